@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import subprocess  # nosec
+import sys
+
+# CLI modules and the heavy dependencies they must not import at startup.
+CLI_MODULES = (
+    "src.cli.benchmark",
+    "src.cli.cleanup",
+    "src.cli.consumer_addon",
+    "src.cli.fleet",
+    "src.cli.monitor",
+    "src.cli.pool",
+    "src.cli.reaper",
+    "src.cli.recovery",
+)
+LAZY_DEPENDENCIES = (
+    "boto3",
+    "botocore",
+    "cryptography",
+    "httpx",
+    "kubernetes",
+    "mypy_boto3_ec2",
+    "urllib3",
+)
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> tuple[float, set[str]]:
+    # `-X importtime` reports "import time: self [us] | cumulative | name" to stderr.
+    result = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        cwd=ROOT_DIR,
+        env={**os.environ, "LOG_FILE": os.devnull},
+        text=True,
+    )
+    cumulative_us = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        imported.add(name.strip())
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, imported
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the CLI import time budget.")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.environ.get("IMPORT_TIME_BUDGET_MS", "300")),
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for module in CLI_MODULES:
+        # The fastest run is the least affected by noise from the host.
+        samples = [measure(module) for _ in range(args.runs)]
+        import_ms = min(import_ms for import_ms, _ in samples)
+        eager = sorted(
+            dependency
+            for dependency in LAZY_DEPENDENCIES
+            if any(dependency in imported for _, imported in samples)
+        )
+        status = "OK"
+        if import_ms > args.budget_ms or eager:
+            status = "FAIL"
+            failed = True
+        print(
+            f"{status} {module}: {import_ms:.1f}ms (budget {args.budget_ms:.0f}ms)"
+            + (f", eagerly imports: {', '.join(eager)}" if eager else "")
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
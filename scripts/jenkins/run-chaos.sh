@@ -47,11 +47,22 @@ KUBECONFIG="${CONSUMER_KUBECONFIG}" helm install workload ./helm/ocs-monkey-gene
      --set workload.runtime=9000
 sleep 60  # Wait for the workload deployment to be ready.
 
+# Sample the health of both clusters while the chaos runner disrupts them.
+(cd .. && venv/bin/python -m src.cli.monitor --duration 7500) &
+MONITOR_PID=$!
+# Stop the sampler on any exit: it logs and saves the outages summary on SIGTERM.
+trap 'kill -TERM "${MONITOR_PID}" 2>/dev/null || true; wait "${MONITOR_PID}" || true' EXIT
+
 # Start chaos runner.
 export PROVIDER_KUBECONFIG=../.cluster/provider-kubeconfig.yaml
 KUBECONFIG="${PROVIDER_KUBECONFIG}" ./chaos_runner.py -t 7200 --monitor-deployment default/workload-ocs-monkey-generator \
     --monitor-deployment-cluster-config "${CONSUMER_KUBECONFIG}"
 
+# Stop the sampler before the clusters are uninstalled.
+kill -TERM "${MONITOR_PID}"
+wait "${MONITOR_PID}"
+trap - EXIT
+
 # Clean up after a successful run.
 deactivate || true
 cd -
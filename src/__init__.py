@@ -1,3 +1,3 @@
-from src.util.util import setup_logging
+from src.util.logs import setup_logging
 
 setup_logging()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from src.cli import cleanup, consumer_addon
+from src.platform.kube import get_nodes_statuses
+from src.replay.cloud import CloudTimings
+from src.replay.harness import OfflineHarness
+from src.replay.ocm import load_cluster_template
+from src.service.cluster import AddonId
+from src.service.ledger import ClusterRole
+from src.service.recovery import RecoveryBenchmark, summarize_trials
+from src.service.spec import AddonSpec
+from src.util.metrics import metrics
+from src.util.util import get_file_content, save_to_json_file
+
+logger = logging.getLogger()
+
+NODE_LIST_FIXTURE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "replay", "fixtures", "node-list.json"
+)
+
+
+@dataclass(frozen=True)
+class _ResponseData:
+    # What the kubernetes client deserializes from a response.
+    data: bytes
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool = False
+    # Exact results (request and poll counts) do not depend on the machine or its
+    # load, unlike the measured times, ratios and allocations.
+    exact: bool = False
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the provisioning flows against a simulated cloud."
+    )
+    parser.add_argument(
+        "--speedup",
+        type=float,
+        default=1000,
+        help="Simulated seconds per real second of the provisioning flows.",
+    )
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=16,
+        help="Number of clusters uninstalled by the cleanup benchmark.",
+    )
+    parser.add_argument(
+        "--recovery-trials",
+        type=int,
+        default=5,
+        help="Number of provider disruptions timed by the recovery benchmark.",
+    )
+    parser.add_argument(
+        "--decode-rounds",
+        type=int,
+        default=50,
+        help="Number of times the kube decode benchmark decodes its node list.",
+    )
+    parser.add_argument(
+        "--cassette", help="OCM responses recorded with OCM_CASSETTE to replay."
+    )
+    parser.add_argument("--output", default=".cluster/benchmark-results.json")
+    parser.add_argument(
+        "--baseline", help="Results file the new results must not regress from."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Max. relative regression of the exact results from the baseline.",
+    )
+    parser.add_argument(
+        "--timing-tolerance",
+        type=float,
+        help="Max. relative regression of the measured times, ratios and "
+        "allocations from the baseline (not checked by default: they vary with "
+        "the machine load).",
+    )
+    args = parser.parse_args()
+    if (
+        args.speedup <= 0
+        or min(args.clusters, args.recovery_trials, args.decode_rounds) < 1
+        or min(args.tolerance, args.timing_tolerance or 0) < 0
+    ):
+        parser.error("Speedup, counts and tolerance must be positive numbers.")
+
+    cluster_template = load_cluster_template(args.cassette) if args.cassette else None
+    results = [
+        *benchmark_consumer_addon(args.speedup, cluster_template),
+        *benchmark_cleanup(args.clusters, cluster_template),
+        *benchmark_recovery(args.recovery_trials, cluster_template),
+        *benchmark_kube_decode(args.decode_rounds),
+    ]
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    save_to_json_file(args.output, {"results": [asdict(result) for result in results]})
+    logger.info("Benchmark results:\n%s", format_results(results))
+    if args.baseline:
+        baseline = {
+            result["name"]: result["value"]
+            for result in json.loads(get_file_content(args.baseline))["results"]
+        }
+        if regressions := find_regressions(
+            results, baseline, args.tolerance, args.timing_tolerance
+        ):
+            logger.error("Performance regressions:\n%s", "\n".join(regressions))
+            return 1
+    return 0
+
+
+def benchmark_cleanup(
+    clusters: int, cluster_template: Optional[dict[str, Any]]
+) -> list[BenchmarkResult]:
+    # Uninstalls take no simulated time but their API calls: the clock runs slower
+    # so that the OCM latency, not the local ledger writes, dominates.
+    speedup = 10
+    seconds = {}
+    for max_workers in (1, 8):
+        with OfflineHarness(
+            speedup=speedup, cluster_template=cluster_template
+        ) as harness:
+            cluster_service, _ = harness.create_services("cleanup")
+            cluster_service.install_batch(
+                [
+                    cluster_service.cluster_template.create_spec(
+                        cluster_service.random_cluster_name(prefix="bench")
+                    )
+                    for _ in range(clusters)
+                ],
+                ClusterRole.UNKNOWN,
+            )
+            start = time.monotonic()
+            if cleanup.cleanup(cluster_service, max_workers):
+                raise RuntimeError("Offline cleanup failed.")
+            seconds[max_workers] = (time.monotonic() - start) * speedup
+    return [
+        BenchmarkResult("cleanup.simulated_seconds", round(seconds[8], 1), "s"),
+        BenchmarkResult(
+            "cleanup.parallel_speedup",
+            round(seconds[1] / seconds[8], 2),
+            "x",
+            higher_is_better=True,
+        ),
+    ]
+
+
+def benchmark_consumer_addon(
+    speedup: float, cluster_template: Optional[dict[str, Any]]
+) -> list[BenchmarkResult]:
+    # The simulated cloud takes a known time to provision: anything above it
+    # is orchestration overhead (poll periods, reconnections, serialization).
+    timings = CloudTimings()
+    seconds = {}
+    counters: dict[str, float] = {}
+    requests: dict[str, int] = {}
+    for max_workers in (1, None):
+        counters_before = metrics.report()["counters"]
+        with OfflineHarness(timings, speedup, cluster_template) as harness:
+            cluster_service, aws_service = harness.create_services("consumer-addon")
+            start = time.monotonic()
+            if consumer_addon.install(cluster_service, aws_service, False, max_workers):
+                raise RuntimeError("Offline consumer addon installation failed.")
+            seconds[max_workers] = (time.monotonic() - start) * speedup
+            requests = harness.cloud.requests
+        counters = _get_counters_delta(counters_before, metrics.report()["counters"])
+    return [
+        BenchmarkResult(
+            "consumer_addon.simulated_seconds", round(seconds[None], 1), "s"
+        ),
+        BenchmarkResult(
+            "consumer_addon.overhead_percent",
+            round(100 * (seconds[None] / timings.consumer_addon_seconds - 1), 1),
+            "%",
+        ),
+        BenchmarkResult(
+            "consumer_addon.parallel_speedup",
+            round(seconds[1] / seconds[None], 2),
+            "x",
+            higher_is_better=True,
+        ),
+        *(
+            BenchmarkResult(
+                f"consumer_addon.{api}_requests",
+                requests.get(api, 0),
+                "",
+                exact=True,
+            )
+            for api in ("ec2", "kube", "ocm")
+        ),
+        *(
+            BenchmarkResult(
+                f"consumer_addon.{kind}",
+                sum(
+                    value
+                    for name, value in counters.items()
+                    if name.startswith(f"{kind}:")
+                ),
+                "",
+                exact=True,
+            )
+            for kind in ("poll_attempts", "watch_connections")
+        ),
+    ]
+
+
+def benchmark_kube_decode(rounds: int) -> list[BenchmarkResult]:
+    # A node list poll decoded into kubernetes client models, as it was, and as raw
+    # JSON reduced to the Ready conditions, as KubeClient does.
+    from kubernetes.client import ApiClient  # type: ignore
+
+    payload = get_file_content(NODE_LIST_FIXTURE).encode()
+    api_client = ApiClient()
+
+    def decode_models() -> list[bool]:
+        node_list = api_client.deserialize(_ResponseData(payload), "V1NodeList")
+        return [
+            condition.status == "True"
+            for node in node_list.items
+            for condition in node.status.conditions or []
+            if condition.type == "Ready"
+        ]
+
+    def decode_raw() -> list[bool]:
+        return list(get_nodes_statuses(json.loads(payload)["items"]).values())
+
+    if decode_models() != decode_raw():
+        raise RuntimeError("Node list decoders disagree.")
+    cpu_ms, peak_kib = {}, {}
+    for name, decode in (("models", decode_models), ("raw", decode_raw)):
+        start = time.process_time()
+        for _ in range(rounds):
+            decode()
+        cpu_ms[name] = (time.process_time() - start) * 1000 / rounds
+        tracemalloc.start()
+        decode()
+        peak_kib[name] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return [
+        BenchmarkResult("kube_decode.node_list_cpu_ms", round(cpu_ms["raw"], 2), "ms"),
+        BenchmarkResult(
+            "kube_decode.node_list_peak_kib", round(peak_kib["raw"]), "KiB"
+        ),
+        BenchmarkResult(
+            "kube_decode.cpu_speedup",
+            round(cpu_ms["models"] / cpu_ms["raw"], 1),
+            "x",
+            higher_is_better=True,
+        ),
+        BenchmarkResult(
+            "kube_decode.memory_reduction",
+            round(peak_kib["models"] / peak_kib["raw"], 1),
+            "x",
+            higher_is_better=True,
+        ),
+    ]
+
+
+def benchmark_recovery(
+    trials: int, cluster_template: Optional[dict[str, Any]]
+) -> list[BenchmarkResult]:
+    # Provisioning is not what is measured here: it is kept short. The simulated
+    # recoveries are known, so the results check the measurements and statistics.
+    timings = CloudTimings(
+        addon_seconds=60,
+        api_latency=0.1,
+        install_seconds=120,
+        nodes_seconds=30,
+        subnets_seconds=30,
+        waiting_seconds=10,
+    )
+    with OfflineHarness(timings, 100, cluster_template, seed=0) as harness:
+        cluster_service, _ = harness.create_services("recovery")
+        cluster_ids = {}
+        for role, addon_id in (
+            (ClusterRole.PROVIDER, AddonId.PROVIDER),
+            (ClusterRole.CONSUMER, AddonId.CONSUMER),
+        ):
+            cluster_id = cluster_service.install(
+                cluster_service.random_cluster_name(prefix="bench"), role
+            )
+            cluster_service.wait_for_cluster_ready(cluster_id)
+            cluster_service.install_addon(cluster_id, AddonSpec(addon_id.value))
+            cluster_service.wait_for_addon_ready(cluster_id, addon_id)
+            cluster_ids[role] = cluster_id
+        results = RecoveryBenchmark(
+            cluster_service,
+            cluster_ids[ClusterRole.PROVIDER],
+            cluster_ids[ClusterRole.CONSUMER],
+            harness.cloud.clock,
+        ).run(trials, "app=rook-ceph-osd", cooldown=30)
+    if failed := [result.trial for result in results if result.error]:
+        raise RuntimeError(f"Offline recovery trials failed: {failed}")
+    return [
+        BenchmarkResult(f"recovery.{metric_stats.metric}.{percentile}", value, "s")
+        for metric_stats in summarize_trials(results)
+        for percentile, value in metric_stats.percentiles.items()
+    ]
+
+
+def find_regressions(
+    results: list[BenchmarkResult],
+    baseline: dict[str, float],
+    tolerance: float,
+    timing_tolerance: Optional[float] = None,
+) -> list[str]:
+    regressions = []
+    for result in results:
+        max_regression = tolerance if result.exact else timing_tolerance
+        if (expected := baseline.get(result.name)) is None or max_regression is None:
+            continue
+        if (
+            result.value < expected * (1 - max_regression)
+            if result.higher_is_better
+            else result.value > expected * (1 + max_regression)
+        ):
+            regressions.append(
+                f"{result.name}: {result.value}{result.unit} "
+                f"(baseline: {expected}{result.unit})"
+            )
+    return regressions
+
+
+def format_results(results: list[BenchmarkResult]) -> str:
+    width = max(len(result.name) for result in results)
+    return "\n".join(
+        f"{result.name.ljust(width)}  {result.value}{result.unit}" for result in results
+    )
+
+
+def _get_counters_delta(
+    before: dict[str, float], after: dict[str, float]
+) -> dict[str, float]:
+    return {name: value - before.get(name, 0) for name, value in after.items()}
+
+
+if __name__ == "__main__":
+    sys.exit(main())
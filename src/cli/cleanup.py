@@ -1,22 +1,55 @@
 #!/usr/bin/env python3
 
+import json
 import logging
+import os
 import sys
 
-from src.service.cluster import ClusterService
+from src.service.cluster import ClusterService, format_cluster_statuses
+from src.service.pool import ClusterPool, Lease
+from src.util.util import env, export_metrics, get_file_content
 
 logger = logging.getLogger()
 
 
 def main() -> int:
-    logger.info("Cleaning up...")
-    cluster_service = ClusterService()
+    return cleanup(
+        ClusterService(), max_workers=env.int("CLEANUP_CONCURRENCY", default=8)
+    )
+
 
-    cluster_service.uninstall_all_clusters()
+def cleanup(cluster_service: ClusterService, max_workers: int = 8) -> int:
+    logger.info("Cleaning up...")
+    if stored_clusters := cluster_service.list_stored_clusters():
+        logger.info(
+            "Stored clusters:\n%s",
+            format_cluster_statuses(
+                cluster_service.snapshot(list(stored_clusters), include_kube=False)
+            ),
+        )
+    try:  # pylint: disable=too-many-try-statements
+        release_pool_lease(cluster_service)
+        report = cluster_service.uninstall_all_clusters(max_workers=max_workers)
+    finally:
+        export_metrics(f"{cluster_service.data_dir}/cleanup-metrics")
+    if report.failed:
+        logger.error("Cleanup failed for clusters: %s", ", ".join(report.failed))
+        return 1
 
     logger.info("Cleanup completed.")
     return 0
 
 
+def release_pool_lease(cluster_service: ClusterService) -> None:
+    lease_file = f"{cluster_service.data_dir}/pool-lease.json"
+    if not os.path.isfile(lease_file):
+        return
+    ClusterPool(cluster_service).release(
+        Lease(**json.loads(get_file_content(lease_file))),
+        recycle=env.bool("CLUSTER_POOL_RECYCLE", default=True),
+    )
+    os.remove(lease_file)
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -1,82 +1,288 @@
 #!/usr/bin/env python3
 
+import argparse
+import json
 import logging
+import os
+import subprocess  # nosec
 import sys
+from dataclasses import asdict
+from typing import Optional
 
-from src.service.aws import AWSService
-from src.service.cluster import AddonId, ClusterService
-from src.util.util import env
+from src.service.aws import AWSService, ClusterSubnetsInfo
+from src.service.cluster import AddonId, ClusterService, format_cluster_statuses
+from src.service.ledger import ClusterRole
+from src.service.pool import ClusterPool, Lease
+from src.util.checkpoint import RunCheckpoint
+from src.util.pipeline import Pipeline, Step, StepResults
+from src.util.util import env, export_metrics, get_file_content, save_to_json_file
 
 logger = logging.getLogger()
 
 
 def main() -> int:
+    args = parse_args()
+    return install(
+        ClusterService(run_id=args.resume), AWSService(), resume=bool(args.resume)
+    )
+
+
+def install(
+    cluster_service: ClusterService,
+    aws_service: AWSService,
+    resume: bool = False,
+    max_workers: Optional[int] = None,
+) -> int:
     logger.info("Starting consumer addon installation...")
-    aws_service = AWSService()
-    cluster_service = ClusterService()
+    logger.info("RUN ID: %s", cluster_service.run_id)
+    checkpoint = RunCheckpoint(
+        f"{cluster_service.data_dir}/runs/{cluster_service.run_id}.json"
+    )
+    if resume and not checkpoint.exists:
+        logger.error("No checkpoint found for run %s.", cluster_service.run_id)
+        return 2
+
+    lease: Optional[Lease] = None
+    if env.bool("USE_CLUSTER_POOL", default=False):
+        lease = lease_pool_provider(cluster_service)
+    provider_cluster_name, consumer_cluster_name = get_cluster_names(checkpoint, lease)
 
     # Create provider cluster.
-    provider_cluster_name = env(
-        "PROVIDER_CLUSTER_NAME",
-        default=ClusterService.random_cluster_name(prefix="chaos-p"),
-    )
-    logger.info("PROVIDER CLUSTER NAME: %s", provider_cluster_name)
-    provider_cluster_id = cluster_service.install(provider_cluster_name)
-    logger.info("PROVIDER CLUSTER ID: %s", provider_cluster_id)
-
-    # Add inbound rules required for provider addon installation.
-    cluster_service.wait_for_cluster_ready(provider_cluster_id)
-    aws_service.add_provider_addon_inbound_rules(provider_cluster_name)
-
-    # Create consumer cluster.
-    provider_cluster_subnet_info = aws_service.get_subnets_info(provider_cluster_name)
-    consumer_cluster_name = env(
-        "CONSUMER_CLUSTER_NAME",
-        default=ClusterService.random_cluster_name(prefix="chaos-c"),
+    def install_provider(_: StepResults) -> str:
+        provider_cluster_id = cluster_service.install(
+            provider_cluster_name, ClusterRole.PROVIDER
+        )
+        logger.info("PROVIDER CLUSTER ID: %s", provider_cluster_id)
+        return provider_cluster_id
+
+    # Create consumer cluster as soon as the provider cluster subnets exist.
+    def install_consumer(results: StepResults) -> str:
+        consumer_cluster_id = cluster_service.install(
+            cluster_name=consumer_cluster_name,
+            role=ClusterRole.CONSUMER,
+            subnets_info=results["provider_subnets"],
+        )
+        logger.info("CONSUMER CLUSTER ID: %s", consumer_cluster_id)
+        return consumer_cluster_id
+
+    # Install provider addon.
+    def install_provider_addon(results: StepResults) -> None:
+        cluster_service.install_addon(
+            results["provider_install"], ClusterService.provider_addon_spec()
+        )
+
+    # Install consumer addon. The signed onboarding ticket is a credential: it is
+    # generated for each install instead of being checkpointed as a step result.
+    def install_consumer_addon(results: StepResults) -> None:
+        cluster_service.install_addon(
+            results["consumer_install"],
+            ClusterService.consumer_addon_spec(
+                cluster_service.get_addon_ocs_provider_storage_endpoint(
+                    results["provider_install"]
+                ),
+                cluster_service.get_consumer_onboarding_ticket(),
+            ),
+        )
+
+    provider_steps = (
+        get_leased_provider_steps(lease.cluster_id)
+        if lease
+        else [
+            Step(
+                "provider_install",
+                install_provider,
+                validate=lambda r: cluster_service.cluster_exists(
+                    r["provider_install"]
+                ),
+            ),
+            Step(
+                "provider_ready",
+                lambda r: cluster_service.wait_for_cluster_ready(r["provider_install"]),
+                requires=("provider_install",),
+            ),
+            # Add inbound rules required for provider addon installation.
+            Step(
+                "provider_inbound_rules",
+                lambda _: aws_service.add_provider_addon_inbound_rules(
+                    provider_cluster_name
+                ),
+                requires=("provider_ready",),
+            ),
+            Step(
+                "provider_addon_install",
+                install_provider_addon,
+                requires=("provider_install", "provider_inbound_rules"),
+            ),
+            Step(
+                "provider_addon_ready",
+                lambda r: cluster_service.wait_for_addon_ready(
+                    r["provider_install"], AddonId.PROVIDER
+                ),
+                requires=("provider_install", "provider_addon_install"),
+            ),
+        ]
     )
-    logger.info("CONSUMER CLUSTER NAME: %s", consumer_cluster_name)
-    consumer_cluster_id = cluster_service.install(
-        cluster_name=consumer_cluster_name,
-        subnets_ids=provider_cluster_subnet_info.subnet_ids,
-        availability_zones=provider_cluster_subnet_info.availability_zones,
+    pipeline = Pipeline(
+        provider_steps
+        + [
+            Step(
+                "provider_subnets",
+                lambda _: aws_service.wait_for_subnets_info(provider_cluster_name),
+                requires=("provider_install",),
+                decode=ClusterSubnetsInfo.from_dict,
+                encode=ClusterSubnetsInfo.to_dict,
+            ),
+            # Share the provider kubeconfig so ocs-monkey can identify the provider cluster.
+            Step(
+                "provider_kubeconfig",
+                lambda r: cluster_service.share_kubeconfig_file(
+                    r["provider_install"], "provider-kubeconfig.yaml"
+                ),
+                requires=("provider_install", "provider_addon_ready"),
+                validate=lambda r: os.path.isfile(r["provider_kubeconfig"]),
+            ),
+            Step(
+                "consumer_install",
+                install_consumer,
+                requires=("provider_subnets",),
+                validate=lambda r: cluster_service.cluster_exists(
+                    r["consumer_install"]
+                ),
+            ),
+            Step(
+                "consumer_ready",
+                lambda r: cluster_service.wait_for_cluster_ready(r["consumer_install"]),
+                requires=("consumer_install",),
+            ),
+            Step(
+                "consumer_addon_install",
+                install_consumer_addon,
+                requires=(
+                    "provider_install",
+                    "provider_addon_ready",
+                    "consumer_install",
+                    "consumer_ready",
+                ),
+            ),
+            Step(
+                "consumer_addon_ready",
+                lambda r: cluster_service.wait_for_addon_ready(
+                    r["consumer_install"], AddonId.CONSUMER
+                ),
+                requires=("consumer_install", "consumer_addon_install"),
+            ),
+            # Share the consumer kubeconfig so ocs-monkey can identify the consumer cluster.
+            Step(
+                "consumer_kubeconfig",
+                lambda r: cluster_service.share_kubeconfig_file(
+                    r["consumer_install"], "consumer-kubeconfig.yaml"
+                ),
+                requires=("consumer_install", "consumer_addon_ready"),
+                validate=lambda r: os.path.isfile(r["consumer_kubeconfig"]),
+            ),
+        ],
+        max_workers=max_workers,
+        checkpoint=checkpoint,
     )
-    logger.info("CONSUMER CLUSTER ID: %s", consumer_cluster_id)
+    try:
+        results = pipeline.run()
+    except Exception:
+        logger.error(
+            "Resume the run with: python -m src.cli.consumer_addon --resume %s",
+            cluster_service.run_id,
+        )
+        raise
+    finally:
+        save_pipeline_report(pipeline, cluster_service.data_dir)
 
-    # Install provider addon.
-    provider_addon_params = {
-        "size": "20",
-        "onboarding-validation-key": env("ONBOARDING_PUBLIC_KEY"),
-    }
-    cluster_service.install_addon(
-        provider_cluster_id, AddonId.PROVIDER.value, provider_addon_params
+    logger.info(
+        "Cluster status:\n%s",
+        format_cluster_statuses(
+            cluster_service.snapshot(
+                [results["provider_install"], results["consumer_install"]]
+            )
+        ),
     )
-    cluster_service.wait_for_addon_ready(provider_cluster_id, AddonId.PROVIDER)
+    logger.info("Consumer addon installation completed.")
+    return 0
+
 
-    # Share the provider kubeconfig so ocs-monkey can identify the provider cluster.
-    cluster_service.share_kubeconfig_file(
-        provider_cluster_id, "provider-kubeconfig.yaml"
+def get_cluster_names(
+    checkpoint: RunCheckpoint, lease: Optional[Lease]
+) -> tuple[str, str]:
+    # Cluster names are kept in the checkpoint, so a resumed run reuses them.
+    provider_cluster_name: str = checkpoint.setdefault(
+        "provider_cluster_name",
+        lease.cluster_name
+        if lease
+        else env(
+            "PROVIDER_CLUSTER_NAME",
+            default=ClusterService.random_cluster_name(prefix="chaos-p"),
+        ),
+    )
+    logger.info("PROVIDER CLUSTER NAME: %s", provider_cluster_name)
+    consumer_cluster_name: str = checkpoint.setdefault(
+        "consumer_cluster_name",
+        env(
+            "CONSUMER_CLUSTER_NAME",
+            default=ClusterService.random_cluster_name(prefix="chaos-c"),
+        ),
     )
+    logger.info("CONSUMER CLUSTER NAME: %s", consumer_cluster_name)
+    return provider_cluster_name, consumer_cluster_name
+
 
-    # Install consumer addon.
-    cluster_service.wait_for_cluster_ready(consumer_cluster_id)
-    consumer_addon_params = {
-        "storage-provider-endpoint": cluster_service.get_addon_ocs_provider_storage_endpoint(
-            provider_cluster_id
+def get_leased_provider_steps(cluster_id: str) -> list[Step]:
+    # A leased pool provider is already running the provider addon.
+    return [
+        Step(
+            "provider_install",
+            lambda _: cluster_id,
+            validate=lambda r: bool(r["provider_install"] == cluster_id),
         ),
-        "onboarding-ticket": cluster_service.get_consumer_onboarding_ticket(),
-    }
-    cluster_service.install_addon(
-        consumer_cluster_id, AddonId.CONSUMER.value, consumer_addon_params
+        Step("provider_addon_ready", lambda _: None),
+    ]
+
+
+def lease_pool_provider(cluster_service: ClusterService) -> Optional[Lease]:
+    lease_file = f"{cluster_service.data_dir}/pool-lease.json"
+    # A resumed run keeps the provider it has already leased.
+    if os.path.isfile(lease_file):
+        stored_lease = Lease(**json.loads(get_file_content(lease_file)))
+        if stored_lease.lease_id == cluster_service.run_id:
+            return stored_lease
+    if lease := ClusterPool(cluster_service).lease(cluster_service.run_id):
+        save_to_json_file(lease_file, asdict(lease))
+    # Refill the pool in the background so the next run finds a ready provider.
+    subprocess.Popen(  # pylint: disable=consider-using-with # nosec
+        [sys.executable, "-m", "src.cli.pool", "refill"],
+        env={**os.environ, "LOG_FILE": f"{cluster_service.data_dir}/pool-refill.log"},
+        start_new_session=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
     )
-    cluster_service.wait_for_addon_ready(consumer_cluster_id, AddonId.CONSUMER)
+    return lease
 
-    # Share the consumer kubeconfig so ocs-monkey can identify the consumer cluster.
-    cluster_service.share_kubeconfig_file(
-        consumer_cluster_id, "consumer-kubeconfig.yaml"
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Install the consumer addon.")
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_ID",
+        help="Resume a run from its first unfinished step.",
     )
+    return parser.parse_args()
 
-    logger.info("Consumer addon installation completed.")
-    return 0
+
+def save_pipeline_report(pipeline: Pipeline, data_dir: str) -> None:
+    report = pipeline.report()
+    logger.info(
+        "Critical path (%.1fs): %s",
+        report["total_seconds"],
+        " -> ".join(report["critical_path"]),
+    )
+    save_to_json_file(f"{data_dir}/consumer-addon-timings.json", report)
+    export_metrics(f"{data_dir}/consumer-addon-metrics")
 
 
 if __name__ == "__main__":
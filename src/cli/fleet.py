@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from src.service.async_cluster import AsyncClusterService
+from src.service.aws import AsyncAWSService
+from src.service.cluster import ClusterService
+from src.service.fleet import ClusterTiming, Fleet
+from src.util.util import env, export_metrics, format_table, save_to_json_file
+
+logger = logging.getLogger()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Install providers serving several consumers each."
+    )
+    parser.add_argument("--providers", type=int, default=1)
+    parser.add_argument("--consumers-per-provider", type=int, default=1)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=env.int("FLEET_CONCURRENCY", default=4),
+        help="Max. number of consumers provisioned at the same time.",
+    )
+    args = parser.parse_args()
+    if min(args.providers, args.consumers_per_provider, args.concurrency) < 1:
+        parser.error("Cluster counts and concurrency must be positive numbers.")
+
+    logger.info(
+        "Starting fleet installation: %d providers, %d consumers each...",
+        args.providers,
+        args.consumers_per_provider,
+    )
+    cluster_service = ClusterService()
+    timings: list[ClusterTiming] = []
+    try:
+        timings = asyncio.run(
+            install_fleet(
+                cluster_service,
+                args.providers,
+                args.consumers_per_provider,
+                args.concurrency,
+            )
+        )
+    finally:
+        export_metrics(f"{cluster_service.data_dir}/fleet-metrics")
+
+    logger.info("Fleet timings:\n%s", format_cluster_timings(timings))
+    if failed := [timing.name for timing in timings if timing.error]:
+        logger.error("Fleet installation failed for clusters: %s", ", ".join(failed))
+        return 1
+    logger.info("Fleet installation completed.")
+    return 0
+
+
+def format_cluster_timings(timings: list[ClusterTiming]) -> str:
+    rows = [("NAME", "ROLE", "PROVIDER", "ID", "READY AFTER", "ERROR")] + [
+        (
+            timing.name,
+            timing.role,
+            timing.provider or "-",
+            timing.cluster_id or "-",
+            f"{timing.ready_seconds:.1f}s" if timing.ready_seconds else "-",
+            timing.error or "-",
+        )
+        for timing in timings
+    ]
+    return format_table(rows)
+
+
+async def install_fleet(
+    cluster_service: ClusterService,
+    providers: int,
+    consumers_per_provider: int,
+    concurrency: int,
+) -> list[ClusterTiming]:
+    async with AsyncClusterService(cluster_service) as async_cluster_service:
+        fleet = Fleet(async_cluster_service, AsyncAWSService(), concurrency)
+        try:
+            return await fleet.install(providers, consumers_per_provider)
+        finally:
+            save_to_json_file(
+                f"{cluster_service.data_dir}/fleet-timings.json", fleet.report()
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+from dataclasses import asdict
+
+from src.service.monitor import (
+    SampleWriter,
+    format_signal_summaries,
+    monitor_clusters,
+    read_samples,
+    summarize_samples,
+)
+from src.util.util import export_metrics, save_to_json_file
+
+logger = logging.getLogger()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Sample the health of the clusters until stopped."
+    )
+    parser.add_argument(
+        "--cluster",
+        action="append",
+        dest="clusters",
+        metavar="NAME=KUBECONFIG",
+        help="Cluster to monitor (repeatable), the provider and consumer by default.",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=0,
+        help="Seconds to monitor the clusters for (until SIGINT/SIGTERM if 0).",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1,
+        help="Max. seconds between two samples: changes are sampled right away.",
+    )
+    parser.add_argument("--data-dir", default=".cluster")
+    args = parser.parse_args()
+    if args.duration < 0 or args.interval <= 0:
+        parser.error("Duration and interval must be positive numbers.")
+    if any("=" not in cluster for cluster in args.clusters or []):
+        parser.error("Clusters must be given as NAME=KUBECONFIG.")
+    config_files = dict(
+        cluster.split("=", 1)
+        for cluster in args.clusters
+        or [
+            f"provider={args.data_dir}/provider-kubeconfig.yaml",
+            f"consumer={args.data_dir}/consumer-kubeconfig.yaml",
+        ]
+    )
+
+    stop = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stop.set())
+    if args.duration:
+        timer = threading.Timer(args.duration, stop.set)
+        timer.daemon = True
+        timer.start()
+
+    samples_file = f"{args.data_dir}/monitor-samples.bin"
+    logger.info("Monitoring clusters %s...", ", ".join(config_files))
+    writer = SampleWriter(samples_file, list(config_files))
+    try:
+        monitor_clusters(config_files, writer, stop, args.interval)
+    finally:
+        writer.close()
+        export_metrics(f"{args.data_dir}/monitor-metrics")
+
+    summaries = summarize_samples(read_samples(samples_file))
+    save_to_json_file(
+        f"{args.data_dir}/monitor-summary.json",
+        {"summaries": [asdict(summary) for summary in summaries]},
+    )
+    logger.info("Cluster health summary:\n%s", format_signal_summaries(summaries))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
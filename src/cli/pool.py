@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+
+from src.service.aws import AWSService
+from src.service.cluster import ClusterService
+from src.service.pool import ClusterPool
+from src.util.util import env, export_metrics
+
+logger = logging.getLogger()
+
+
+def main() -> int:
+    if (command := sys.argv[1] if len(sys.argv) > 1 else "status") not in {
+        "refill",
+        "status",
+    }:
+        logger.error("Usage: python -m src.cli.pool [refill|status]")
+        return 2
+    cluster_service = ClusterService()
+    pool = ClusterPool(cluster_service)
+
+    if command == "refill":
+        logger.info("Refilling cluster pool...")
+        try:
+            provisioned = pool.refill(
+                env.int("CLUSTER_POOL_SIZE", default=2),
+                AWSService(),
+                max_workers=env.int("CLUSTER_POOL_CONCURRENCY", default=4),
+            )
+        finally:
+            export_metrics(f"{cluster_service.data_dir}/pool-refill-metrics")
+        logger.info("Cluster pool refill completed: %d provisioned.", len(provisioned))
+
+    for record in pool.status():
+        logger.info(
+            "Pool cluster %s (%s): %s %s",
+            record.name,
+            record.cluster_id,
+            record.state,
+            record.run_id,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import sys
+import time
+from dataclasses import asdict
+from itertools import count
+
+from src.service.aws import AWSService
+from src.service.cluster import ClusterService
+from src.service.reaper import ClusterReaper
+from src.util.util import env, export_metrics, save_to_json_file
+
+logger = logging.getLogger()
+
+# Pool clusters outlive the runs by design: the pool reaps its own.
+DEFAULT_NAME_PREFIXES = ["chaos-c-", "chaos-p-", "ci-", "fleet-c-", "fleet-p-"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Uninstall CI clusters leaked past their TTL."
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=env.float("REAPER_CLUSTER_TTL", default=24),
+        help="Hours after their creation clusters are reaped.",
+    )
+    parser.add_argument(
+        "--prefix",
+        action="append",
+        dest="prefixes",
+        help="Name prefix of the clusters to reap (repeatable).",
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=env.int("REAPER_CONCURRENCY", default=8),
+        help="Max. number of clusters uninstalled at the same time.",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0,
+        help="Minutes between two runs, to run periodically (once if 0).",
+    )
+    args = parser.parse_args()
+    if args.ttl <= 0 or args.max_workers < 1 or args.interval < 0:
+        parser.error("TTL, max. workers and interval must be positive numbers.")
+
+    cluster_service = ClusterService()
+    reaper = ClusterReaper(
+        cluster_service,
+        AWSService(),
+        args.prefixes
+        or env.list("REAPER_NAME_PREFIXES", default=DEFAULT_NAME_PREFIXES),
+        int(args.ttl * 3600),
+    )
+    for _ in count():
+        failed = reap(reaper, cluster_service.data_dir, args.dry_run, args.max_workers)
+        if not args.interval:
+            return 1 if failed else 0
+        logger.info("Next reaper run in %.0f minutes.", args.interval)
+        time.sleep(args.interval * 60)
+    return 0
+
+
+def reap(reaper: ClusterReaper, data_dir: str, dry_run: bool, max_workers: int) -> bool:
+    # A failed run is logged and retried on the next one when run periodically.
+    try:
+        report = reaper.reap(dry_run, max_workers)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Reaper run failed.")
+        return True
+    finally:
+        export_metrics(f"{data_dir}/reaper-metrics")
+    save_to_json_file(f"{data_dir}/reaper-report.json", asdict(report))
+    if report.failed:
+        logger.error("Reaper failed for clusters: %s", ", ".join(report.failed))
+    return bool(report.failed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
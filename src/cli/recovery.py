@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import sys
+from dataclasses import asdict
+from typing import Optional
+
+from src.service.cluster import ClusterService
+from src.service.ledger import ClusterRole
+from src.service.recovery import (
+    RecoveryBenchmark,
+    format_recovery_stats,
+    summarize_trials,
+)
+from src.util.util import env, export_metrics, save_to_json_file
+
+logger = logging.getLogger()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Time how the provider storage and its consumer recover "
+        "from disruptions of the provider Ceph pods."
+    )
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument(
+        "--cooldown",
+        type=float,
+        default=120,
+        help="Seconds between a recovery and the next disruption.",
+    )
+    parser.add_argument(
+        "--pod-selector",
+        default=env(
+            "RECOVERY_POD_SELECTOR",
+            default="app in (rook-ceph-mgr,rook-ceph-mon,rook-ceph-osd)",
+        ),
+        help="Label selector of the provider pods deleted by each disruption.",
+    )
+    parser.add_argument("--provider-id", help="The stored provider by default.")
+    parser.add_argument("--consumer-id", help="The stored consumer by default.")
+    args = parser.parse_args()
+    if args.trials < 1 or args.cooldown < 0:
+        parser.error("Trials and cooldown must be positive numbers.")
+
+    cluster_service = ClusterService()
+    provider_id = args.provider_id or get_stored_cluster_id(
+        cluster_service, ClusterRole.PROVIDER
+    )
+    consumer_id = args.consumer_id or get_stored_cluster_id(
+        cluster_service, ClusterRole.CONSUMER
+    )
+    if not provider_id or not consumer_id:
+        parser.error("No stored provider and consumer: pass their cluster ids.")
+
+    logger.info("Starting %d recovery trials...", args.trials)
+    try:
+        trials = RecoveryBenchmark(cluster_service, provider_id, consumer_id).run(
+            args.trials, args.pod_selector, args.cooldown
+        )
+    finally:
+        export_metrics(f"{cluster_service.data_dir}/recovery-metrics")
+    stats = summarize_trials(trials)
+    save_to_json_file(
+        f"{cluster_service.data_dir}/recovery-results.json",
+        {
+            "trials": [asdict(trial) for trial in trials],
+            "stats": [asdict(metric_stats) for metric_stats in stats],
+        },
+    )
+    logger.info("Recovery times:\n%s", format_recovery_stats(stats))
+    if failed := [trial.trial for trial in trials if trial.error]:
+        logger.error("Recovery failed in trials: %s", failed)
+        return 1
+    return 0
+
+
+def get_stored_cluster_id(
+    cluster_service: ClusterService, role: ClusterRole
+) -> Optional[str]:
+    return next(iter(cluster_service.list_stored_clusters(role=role)), None)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,18 @@
+from __future__ import annotations
+
+import json
 import logging
-from collections.abc import Callable
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Iterator
 from dataclasses import dataclass
 from functools import wraps
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from src.util.metrics import timed
+from src.util.wait import WatchError
 
-from kubernetes.client import CoreV1Api, CustomObjectsApi  # type: ignore
-from kubernetes.client.exceptions import ApiException  # type: ignore
-from kubernetes.config import new_client_from_config  # type: ignore
-from pydantic import BaseModel, Field
+if TYPE_CHECKING:
+    import httpx
+    from kubernetes.client import CoreV1Api, CustomObjectsApi  # type: ignore
 
 logger = logging.getLogger()
 
@@ -16,9 +21,15 @@ class NotFoundError(Exception):
     pass
 
 
+class UnauthorizedError(Exception):
+    pass
+
+
 def handle_error(func: Callable) -> Callable:  # type: ignore
     @wraps(func)
     def wrapper(*args: Any, **kwargs: Any) -> Callable[[Any], Any]:
+        from kubernetes.client.exceptions import ApiException  # type: ignore
+
         try:
             return func(*args, **kwargs)
         except ApiException as error:
@@ -30,6 +41,8 @@ def handle_error(func: Callable) -> Callable:  # type: ignore
             )
             if error.status == 404:
                 raise NotFoundError("Kubernetes resource not found.") from error
+            if error.status in {401, 403}:
+                raise UnauthorizedError("Kubernetes credentials rejected.") from error
             raise
 
     return wrapper
@@ -45,28 +58,35 @@ class CustomObjectRequest:
     version: str = "v1"
 
 
-class KubeResponseMetadata(BaseModel):
-    name: str
-
+@dataclass(frozen=True)
+class KubeResponseStatus:
+    phase: str = ""
+    storage_provider_endpoint: str = ""
 
-class KubeResponseStatusCondition(BaseModel):
-    status: bool = False
-    type: str = ""
 
+@dataclass(frozen=True)
+class KubeResponse:
+    status: KubeResponseStatus
 
-class KubeResponseStatus(BaseModel):
-    conditions: list[KubeResponseStatusCondition] = []
-    phase: str
-    storage_provider_endpoint: str = Field(alias="storageProviderEndpoint", default="")
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "KubeResponse":
+        # Only the fields read by the services are parsed.
+        status = data.get("status") or {}
+        return cls(
+            status=KubeResponseStatus(
+                phase=status.get("phase", ""),
+                storage_provider_endpoint=status.get("storageProviderEndpoint", ""),
+            ),
+        )
 
 
-class KubeResponse(BaseModel):
-    metadata: KubeResponseMetadata
-    status: KubeResponseStatus
+@dataclass(frozen=True)
+class KubeResponseList:
+    items: list[KubeResponse]
 
-
-class KubeResponseList(BaseModel):
-    items: list[KubeResponse] = []
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "KubeResponseList":
+        return cls(items=[KubeResponse.from_dict(item) for item in data["items"]])
 
 
 class KubeClient:
@@ -74,45 +94,355 @@ class KubeClient:
     _custom_objects_api: CustomObjectsApi
 
     def __init__(self, config_file: str) -> None:
+        # The kubernetes client is slow to import: only load it when it is used.
+        from kubernetes.client import CoreV1Api, CustomObjectsApi
+        from kubernetes.config import new_client_from_config  # type: ignore
+
         api_client = new_client_from_config(config_file=config_file)
         self._core_v1_api = CoreV1Api(api_client=api_client)
         self._custom_objects_api = CustomObjectsApi(api_client=api_client)
 
+    def close(self) -> None:
+        api_client = self._core_v1_api.api_client
+        api_client.close()
+        # In-flight requests keep their connection: only idle ones are closed.
+        api_client.rest_client.pool_manager.clear()
+
+    @timed()
+    @handle_error
+    def delete_pods(self, namespace: str, label_selector: str) -> int:
+        response = self._core_v1_api.delete_collection_namespaced_pod(
+            namespace, label_selector=label_selector, _preload_content=False
+        )
+        return len(json.loads(response.data).get("items") or [])
+
+    @timed()
     @handle_error
     def get_object(self, request: CustomObjectRequest) -> KubeResponse:
-        return KubeResponse(
-            **self._custom_objects_api.get_namespaced_custom_object(
-                group=request.group,
-                version=request.version,
-                name=request.name,
-                plural=request.plural,
-                namespace=request.namespace,
-            )
+        response = self._custom_objects_api.get_namespaced_custom_object(
+            group=request.group,
+            version=request.version,
+            name=request.name,
+            plural=request.plural,
+            namespace=request.namespace,
+            _preload_content=False,
         )
+        return KubeResponse.from_dict(json.loads(response.data))
 
+    @timed()
     @handle_error
     def list_nodes_statuses(self) -> list[bool]:
-        statuses = []
-        response: KubeResponseList = self._core_v1_api.list_node()
-        for node in response.items:
-            for condition in node.status.conditions:
-                if condition.type == "Ready":
-                    logger.debug(
-                        "Ready status of node %s: %s",
-                        node.metadata.name,
-                        condition.status,
-                    )
-                    statuses.append(condition.status)
-        return statuses
+        # resourceVersion=0 lets the API server answer from its watch cache.
+        response = self._core_v1_api.list_node(
+            resource_version="0", _preload_content=False
+        )
+        return list(get_nodes_statuses(json.loads(response.data)["items"]).values())
 
+    @timed()
     @handle_error
     def list_objects(self, request: CustomObjectRequest) -> KubeResponseList:
-        return KubeResponseList(
-            **self._custom_objects_api.list_namespaced_custom_object(
-                group=request.group,
-                version=request.version,
-                plural=request.plural,
-                namespace=request.namespace,
-                label_selector=request.label_selector,
+        response = self._custom_objects_api.list_namespaced_custom_object(
+            group=request.group,
+            version=request.version,
+            plural=request.plural,
+            namespace=request.namespace,
+            label_selector=request.label_selector,
+            field_selector=_get_field_selector(request),
+            resource_version="0",
+            _preload_content=False,
+        )
+        return KubeResponseList.from_dict(json.loads(response.data))
+
+    def watch_nodes_statuses(self, timeout_seconds: int) -> Iterator[dict[str, bool]]:
+        # The full set is listed first: the initial ADDED events of a watch come one
+        # by one, and a set judged on the first ones looks ready too early.
+        nodes, resource_version = self._list_for_watch(self._core_v1_api.list_node)
+        statuses = get_nodes_statuses(nodes)
+        yield statuses
+        for event in self._watch(
+            self._core_v1_api.list_node,
+            resource_version=resource_version,
+            timeout_seconds=timeout_seconds,
+        ):
+            yield _update_nodes_statuses(statuses, event)
+
+    def watch_objects(
+        self, request: CustomObjectRequest, timeout_seconds: int
+    ) -> Iterator[dict[str, KubeResponse]]:
+        list_kwargs = {
+            "group": request.group,
+            "version": request.version,
+            "plural": request.plural,
+            "namespace": request.namespace,
+            "label_selector": request.label_selector,
+            "field_selector": _get_field_selector(request),
+        }
+        items, resource_version = self._list_for_watch(
+            self._custom_objects_api.list_namespaced_custom_object, **list_kwargs
+        )
+        objects = _get_objects(items)
+        yield objects
+        for event in self._watch(
+            self._custom_objects_api.list_namespaced_custom_object,
+            resource_version=resource_version,
+            timeout_seconds=timeout_seconds,
+            **list_kwargs,
+        ):
+            yield _update_objects(objects, event)
+
+    @staticmethod
+    def _call_watch_api(func: Callable, **kwargs: Any) -> Any:  # type: ignore
+        from kubernetes.client.exceptions import ApiException
+        from urllib3.exceptions import HTTPError  # type: ignore
+
+        try:
+            return func(_preload_content=False, **kwargs)
+        except ApiException as error:
+            if error.status in {401, 403}:
+                raise UnauthorizedError("Kubernetes credentials rejected.") from error
+            raise WatchError("Kubernetes watch request failed.") from error
+        except HTTPError as error:
+            raise WatchError("Kubernetes watch request failed.") from error
+
+    @staticmethod
+    def _list_for_watch(
+        func: Callable, **kwargs: Any  # type: ignore
+    ) -> tuple[list[dict[str, Any]], str]:
+        data = json.loads(KubeClient._call_watch_api(func, **kwargs).data)
+        return data["items"], data["metadata"]["resourceVersion"]
+
+    @staticmethod
+    def _watch(func: Callable, **kwargs: Any) -> Iterator[dict[str, Any]]:  # type: ignore
+        from urllib3.exceptions import HTTPError
+
+        # Events are decoded as plain dicts instead of kubernetes client models.
+        response = KubeClient._call_watch_api(func, watch=True, **kwargs)
+        try:
+            yield from KubeClient._read_watch_events(response)
+        except HTTPError as error:
+            raise WatchError("Kubernetes watch stream failed.") from error
+        finally:
+            response.close()
+            response.release_conn()
+
+    @staticmethod
+    def _read_watch_events(response: Any) -> Iterator[dict[str, Any]]:
+        from kubernetes.watch.watch import iter_resp_lines  # type: ignore
+
+        for line in iter_resp_lines(response):
+            yield _parse_watch_event(line)
+
+
+class AsyncKubeClient:
+    _client: httpx.AsyncClient
+    _timeout = 60.0
+
+    def __init__(self, config_file: str) -> None:
+        import httpx
+        from kubernetes.client import Configuration
+        from kubernetes.config import load_kube_config
+
+        # Only the connection settings are taken from the kubernetes client config.
+        configuration = Configuration()
+        load_kube_config(config_file=config_file, client_configuration=configuration)
+        headers: dict[str, str] = {}
+        if authorization := configuration.get_api_key_with_prefix("authorization"):
+            headers["Authorization"] = authorization
+        self._client = httpx.AsyncClient(
+            base_url=configuration.host,
+            # Client certificates are absent with token based kubeconfigs.
+            cert=(configuration.cert_file, configuration.key_file)  # type: ignore
+            if configuration.cert_file
+            else None,
+            headers=headers,
+            timeout=self._timeout,
+            verify=(configuration.ssl_ca_cert or True)
+            if configuration.verify_ssl
+            else False,
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    @timed()
+    async def get_object(self, request: CustomObjectRequest) -> KubeResponse:
+        return KubeResponse.from_dict(
+            await self._get(f"{_get_objects_path(request)}/{request.name}")
+        )
+
+    @timed()
+    async def list_nodes_statuses(self) -> list[bool]:
+        nodes = await self._get("/api/v1/nodes", {"resourceVersion": "0"})
+        return list(get_nodes_statuses(nodes["items"]).values())
+
+    @timed()
+    async def list_objects(self, request: CustomObjectRequest) -> KubeResponseList:
+        return KubeResponseList.from_dict(
+            await self._get(
+                _get_objects_path(request),
+                {**_get_list_params(request), "resourceVersion": "0"},
             )
         )
+
+    async def watch_nodes_statuses(
+        self, timeout_seconds: int
+    ) -> AsyncIterator[dict[str, bool]]:
+        # Like KubeClient.watch_nodes_statuses: list the full set, then watch.
+        nodes, resource_version = await self._list_for_watch("/api/v1/nodes", {})
+        statuses = get_nodes_statuses(nodes)
+        yield statuses
+        async for event in self._watch(
+            "/api/v1/nodes", {"resourceVersion": resource_version}, timeout_seconds
+        ):
+            yield _update_nodes_statuses(statuses, event)
+
+    async def watch_objects(
+        self, request: CustomObjectRequest, timeout_seconds: int
+    ) -> AsyncIterator[dict[str, KubeResponse]]:
+        path, params = _get_objects_path(request), _get_list_params(request)
+        items, resource_version = await self._list_for_watch(path, params)
+        objects = _get_objects(items)
+        yield objects
+        async for event in self._watch(
+            path, {**params, "resourceVersion": resource_version}, timeout_seconds
+        ):
+            yield _update_objects(objects, event)
+
+    async def _get(
+        self, path: str, params: Optional[dict[str, str]] = None
+    ) -> dict[str, Any]:
+        response = await self._client.get(path, params=params)
+        _raise_for_status(response)
+        result: dict[str, Any] = json.loads(response.content)
+        return result
+
+    async def _list_for_watch(
+        self, path: str, params: dict[str, str]
+    ) -> tuple[list[dict[str, Any]], str]:
+        import httpx
+
+        try:
+            data = await self._get(path, params)
+        except httpx.HTTPError as error:
+            raise WatchError("Kubernetes watch request failed.") from error
+        return data["items"], data["metadata"]["resourceVersion"]
+
+    async def _watch(
+        self, path: str, params: dict[str, str], timeout_seconds: int
+    ) -> AsyncIterator[dict[str, Any]]:
+        import httpx
+
+        events = self._read_watch_events(path, params, timeout_seconds)
+        try:  # pylint: disable=too-many-try-statements
+            async for event in events:
+                yield event
+        except httpx.HTTPError as error:
+            raise WatchError("Kubernetes watch request failed.") from error
+        finally:
+            await events.aclose()
+
+    async def _read_watch_events(
+        self, path: str, params: dict[str, str], timeout_seconds: int
+    ) -> AsyncGenerator[dict[str, Any], None]:
+        import httpx
+
+        async with self._client.stream(
+            "GET",
+            path,
+            params={**params, "watch": "true", "timeoutSeconds": str(timeout_seconds)},
+            timeout=httpx.Timeout(self._timeout, read=timeout_seconds + self._timeout),
+        ) as response:
+            if response.is_error:
+                await response.aread()
+                _raise_for_status(response)
+            async for line in response.aiter_lines():
+                if line:
+                    yield _parse_watch_event(line)
+
+
+def get_nodes_statuses(nodes: list[dict[str, Any]]) -> dict[str, bool]:
+    return {
+        node["metadata"]["name"]: status
+        for node in nodes
+        if (status := _get_node_ready_status(node)) is not None
+    }
+
+
+def _get_field_selector(request: CustomObjectRequest) -> Optional[str]:
+    return f"metadata.name={request.name}" if request.name else None
+
+
+def _get_list_params(request: CustomObjectRequest) -> dict[str, str]:
+    return {
+        key: value
+        for key, value in (
+            ("labelSelector", request.label_selector),
+            ("fieldSelector", _get_field_selector(request)),
+        )
+        if value
+    }
+
+
+def _get_node_ready_status(node: dict[str, Any]) -> Optional[bool]:
+    for condition in node.get("status", {}).get("conditions") or []:
+        if condition.get("type") == "Ready":
+            logger.debug(
+                "Ready status of node %s: %s",
+                node["metadata"]["name"],
+                condition.get("status"),
+            )
+            return bool(condition.get("status") == "True")
+    return None
+
+
+def _get_objects(items: list[dict[str, Any]]) -> dict[str, KubeResponse]:
+    return {
+        item["metadata"]["name"]: KubeResponse.from_dict(item)
+        for item in items
+        if "status" in item
+    }
+
+
+def _get_objects_path(request: CustomObjectRequest) -> str:
+    return (
+        f"/apis/{request.group}/{request.version}"
+        f"/namespaces/{request.namespace}/{request.plural}"
+    )
+
+
+def _parse_watch_event(line: Union[str, bytes]) -> dict[str, Any]:
+    event: dict[str, Any] = json.loads(line)
+    if event["type"] == "ERROR":
+        raise WatchError(f"Watch error event: {event['object']}")
+    return event
+
+
+def _raise_for_status(response: httpx.Response) -> None:
+    if response.status_code == 404:
+        raise NotFoundError("Kubernetes resource not found.")
+    if response.status_code in {401, 403}:
+        raise UnauthorizedError("Kubernetes credentials rejected.")
+    response.raise_for_status()
+
+
+def _update_nodes_statuses(
+    statuses: dict[str, bool], event: dict[str, Any]
+) -> dict[str, bool]:
+    node = event["object"]
+    name = node["metadata"]["name"]
+    if event["type"] == "DELETED":
+        statuses.pop(name, None)
+    elif (status := _get_node_ready_status(node)) is not None:
+        statuses[name] = status
+    return statuses
+
+
+def _update_objects(
+    objects: dict[str, KubeResponse], event: dict[str, Any]
+) -> dict[str, KubeResponse]:
+    name = event["object"]["metadata"]["name"]
+    if event["type"] == "DELETED":
+        objects.pop(name, None)
+    elif "status" in event["object"]:
+        objects[name] = KubeResponse.from_dict(event["object"])
+    return objects
@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+from subprocess import CalledProcessError, SubprocessError
+from typing import TYPE_CHECKING, Any, Optional, Protocol, Union
+
+from src.util.logs import redact
+from src.util.retry import (
+    DEFAULT_POLICIES,
+    CircuitBreaker,
+    CircuitOpenError,
+    Operation,
+    RetryPolicy,
+    async_call_with_retry,
+    call_with_retry,
+    run_cmd_with_retry,
+)
+from src.util.wait import SYSTEM_CLOCK, Clock
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger()
+
+
+class OcmError(Exception):
+    status_code: int
+
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OcmBackend(Protocol):
+    def delete(self, path: str) -> None:
+        ...
+
+    def get(self, path: str, params: Optional[dict[str, str]] = None) -> dict[str, Any]:
+        ...
+
+    def post(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        ...
+
+
+class AsyncOcmBackend(Protocol):
+    async def aclose(self) -> None:
+        ...
+
+    async def get(
+        self, path: str, params: Optional[dict[str, str]] = None
+    ) -> dict[str, Any]:
+        ...
+
+
+class OcmClient:  # pylint: disable=too-many-instance-attributes
+    _access_token: str = ""
+    _access_token_expires_at: float = 0.0
+    _breaker: CircuitBreaker
+    _client: httpx.Client
+    _client_id: str
+    _clock: Clock
+    _policies = DEFAULT_POLICIES
+    _refresh_token: str
+    _timeout = 60.0
+    _token_expiration_margin = 60
+    _token_lock: threading.Lock
+    _token_url: str
+
+    def __init__(
+        self,
+        url: str,
+        token_url: str,
+        client_id: str,
+        refresh_token: str,
+        *,
+        clock: Clock = SYSTEM_CLOCK,
+    ) -> None:
+        import httpx
+
+        # The breaker is shared by every request so a degraded API isn't hammered.
+        self._breaker = CircuitBreaker("ocm-api", clock=clock)
+        self._client = httpx.Client(
+            base_url=url,
+            timeout=self._timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        self._client_id = client_id
+        self._clock = clock
+        self._refresh_token = refresh_token
+        self._token_lock = threading.Lock()
+        self._token_url = token_url
+
+    @classmethod
+    def from_config(
+        cls, config: dict[str, Union[str, list[str]]], clock: Clock = SYSTEM_CLOCK
+    ) -> "OcmClient":
+        return cls(
+            url=str(config["url"]),
+            token_url=str(config["token_url"]),
+            client_id=str(config["client_id"]),
+            refresh_token=str(config["refresh_token"]),
+            clock=clock,
+        )
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._breaker
+
+    def delete(self, path: str) -> None:
+        self._request("DELETE", path)
+
+    def get(self, path: str, params: Optional[dict[str, str]] = None) -> dict[str, Any]:
+        return self._request("GET", path, params=params).json()
+
+    def get_access_token(self, force_refresh: bool = False) -> str:
+        with self._token_lock:
+            if (
+                force_refresh
+                or self._clock.monotonic() >= self._access_token_expires_at
+            ):
+                response = self._client.post(
+                    self._token_url,
+                    data={
+                        "grant_type": "refresh_token",
+                        "client_id": self._client_id,
+                        "refresh_token": self._refresh_token,
+                    },
+                )
+                if response.is_error:
+                    raise OcmError(
+                        "Unable to refresh the OCM access token.", response.status_code
+                    )
+                token_info = response.json()
+                self._access_token = token_info["access_token"]
+                self._access_token_expires_at = (
+                    self._clock.monotonic()
+                    + token_info.get("expires_in", 300)
+                    - self._token_expiration_margin
+                )
+                self._refresh_token = token_info.get(
+                    "refresh_token", self._refresh_token
+                )
+            return self._access_token
+
+    def post(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        return self._request("POST", path, json=body).json()
+
+    @property
+    def url(self) -> str:
+        return str(self._client.base_url)
+
+    def _request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        import httpx
+
+        logger.info("OCM API: %s %s", method, path)
+        try:
+            return call_with_retry(
+                f"ocm-api {method}",
+                lambda timeout: self._send(method, path, timeout, **kwargs),
+                self._policies[_get_operation(method, kwargs.get("params"))],
+                _is_transient_api_error,
+                self._breaker,
+                clock=self._clock,
+                errors=(OcmError, httpx.TransportError),
+            )
+        except (CircuitOpenError, httpx.TransportError) as error:
+            raise _get_unanswered_error(error, method, path) from error
+
+    def _send(
+        self, method: str, path: str, timeout: float, **kwargs: Any
+    ) -> httpx.Response:
+        import httpx
+
+        # A rejected access token is refreshed once.
+        for force_refresh in (False, True):
+            response = self._client.request(
+                method,
+                path,
+                headers={
+                    "Authorization": f"Bearer {self.get_access_token(force_refresh)}"
+                },
+                timeout=timeout,
+                **kwargs,
+            )
+            if response.status_code != httpx.codes.UNAUTHORIZED:
+                break
+        _raise_for_status(response, method, path)
+        return response
+
+
+class AsyncOcmClient:
+    _client: httpx.AsyncClient
+    _ocm_client: OcmClient
+    _policies = DEFAULT_POLICIES
+    _timeout = 60.0
+
+    def __init__(self, url: str, ocm_client: OcmClient) -> None:
+        import httpx
+
+        self._client = httpx.AsyncClient(
+            base_url=url,
+            timeout=self._timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        # Access tokens and the circuit breaker of the blocking client are shared.
+        self._ocm_client = ocm_client
+
+    @classmethod
+    def from_config(cls, config: dict[str, Union[str, list[str]]]) -> "AsyncOcmClient":
+        return cls(str(config["url"]), OcmClient.from_config(config))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def get(
+        self, path: str, params: Optional[dict[str, str]] = None
+    ) -> dict[str, Any]:
+        import httpx
+
+        logger.info("OCM API: GET %s", path)
+        try:
+            response = await async_call_with_retry(
+                "ocm-api GET",
+                lambda timeout: self._send(path, params, timeout),
+                self._policies[_get_operation("GET", params)],
+                _is_transient_api_error,
+                self._ocm_client.breaker,
+                errors=(OcmError, httpx.TransportError),
+            )
+        except (CircuitOpenError, httpx.TransportError) as error:
+            raise _get_unanswered_error(error, "GET", path) from error
+        result: dict[str, Any] = response.json()
+        return result
+
+    async def _send(
+        self, path: str, params: Optional[dict[str, str]], timeout: float
+    ) -> httpx.Response:
+        import httpx
+
+        for force_refresh in (False, True):
+            access_token = await asyncio.to_thread(
+                self._ocm_client.get_access_token, force_refresh
+            )
+            response = await self._client.get(
+                path,
+                params=params,
+                headers={"Authorization": f"Bearer {access_token}"},
+                timeout=timeout,
+            )
+            if response.status_code != httpx.codes.UNAUTHORIZED:
+                break
+        _raise_for_status(response, "GET", path)
+        return response
+
+
+class OcmRecorder:
+    _backend: OcmBackend
+    _cassette_file: str
+    _lock: threading.Lock
+
+    def __init__(self, backend: OcmBackend, cassette_file: str) -> None:
+        # Successful calls are appended as redacted JSON lines to replay them offline.
+        self._backend = backend
+        self._cassette_file = cassette_file
+        self._lock = threading.Lock()
+
+    def delete(self, path: str) -> None:
+        self._backend.delete(path)
+        self._record("DELETE", path, {})
+
+    def get(self, path: str, params: Optional[dict[str, str]] = None) -> dict[str, Any]:
+        response = self._backend.get(path, params)
+        self._record("GET", path, response)
+        return response
+
+    def post(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        response = self._backend.post(path, body)
+        self._record("POST", path, response)
+        return response
+
+    def _record(self, method: str, path: str, response: dict[str, Any]) -> None:
+        line = redact(
+            json.dumps({"method": method, "path": path, "response": response})
+        )
+        with self._lock, open(self._cassette_file, "a", encoding="utf-8") as cassette:
+            cassette.write(f"{line}\n")
+
+
+class ThreadedOcmBackend:
+    _backend: OcmBackend
+
+    def __init__(self, backend: OcmBackend) -> None:
+        # Backends without asyncio support (CLI, replays, recorders) run in threads.
+        self._backend = backend
+
+    async def aclose(self) -> None:
+        pass
+
+    async def get(
+        self, path: str, params: Optional[dict[str, str]] = None
+    ) -> dict[str, Any]:
+        return await asyncio.to_thread(self._backend.get, path, params)
+
+
+class OcmCli:
+    _breaker: CircuitBreaker
+    _clock: Clock
+    _policies = DEFAULT_POLICIES
+
+    def __init__(self, clock: Clock = SYSTEM_CLOCK) -> None:
+        # The breaker is shared by every command so a degraded API isn't hammered.
+        self._breaker = CircuitBreaker("ocm", clock=clock)
+        self._clock = clock
+
+    def delete(self, path: str) -> None:
+        self._run(["ocm", "delete", path], Operation.DELETE)
+
+    def get(self, path: str, params: Optional[dict[str, str]] = None) -> dict[str, Any]:
+        return json.loads(
+            self._run(
+                ["ocm", "get", path]
+                + [
+                    f"--parameter={key}={value}"
+                    for key, value in (params or {}).items()
+                ],
+                Operation.LIST if params else Operation.READ,
+            )
+        )
+
+    def post(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        # The body is piped to ocm: secrets are neither CLI args nor written to disk.
+        stdout = self._run(["ocm", "post", path], Operation.CREATE, json.dumps(body))
+        return json.loads(stdout) if stdout else {}
+
+    def _run(
+        self, cmd: list[str], operation: Operation, stdin: Optional[str] = None
+    ) -> str:
+        try:
+            return run_cmd_with_retry(
+                cmd,
+                self._policies[operation],
+                self._is_transient,
+                self._breaker,
+                self._clock,
+                stdin=stdin,
+            ).stdout
+        except CalledProcessError as error:
+            raise OcmError(
+                f"OCM CLI error: {error.stderr}", OcmCli._get_status_code(error.stderr)
+            ) from error
+        except CircuitOpenError as error:
+            raise OcmError(f"OCM CLI error: {error}", 503) from error
+        except SubprocessError as error:
+            # Like transport errors of the API client, e.g. timed out commands.
+            raise OcmError(f"OCM CLI error: {error}", 0) from error
+
+    @staticmethod
+    def _get_status_code(stderr: Optional[str]) -> int:
+        try:
+            return int(json.loads(stderr or "")["id"])
+        except (KeyError, TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def _is_transient(error: CalledProcessError, policy: RetryPolicy) -> bool:
+        # Errors without an API status (e.g. connection errors) may have reached the
+        # API too: like 5xx errors, they are only retried for idempotent commands.
+        if (status_code := OcmCli._get_status_code(error.stderr)) in {429, 503}:
+            return True
+        return policy.idempotent and (not status_code or status_code >= 500)
+
+
+def _get_operation(method: str, params: Optional[dict[str, str]]) -> Operation:
+    if method == "POST":
+        return Operation.CREATE
+    if method == "DELETE":
+        return Operation.DELETE
+    return Operation.LIST if params else Operation.READ
+
+
+def _get_unanswered_error(error: Exception, method: str, path: str) -> OcmError:
+    # Like for the CLI, an open circuit is reported as the API being unavailable.
+    return OcmError(
+        f"OCM API error on {method} {path}: {error}",
+        503 if isinstance(error, CircuitOpenError) else 0,
+    )
+
+
+def _is_transient_api_error(error: Exception, policy: RetryPolicy) -> Optional[bool]:
+    # Same rules as the CLI: 5xx errors may have been applied, so they are only
+    # retried for idempotent requests. Transport errors got no answer.
+    if not isinstance(error, OcmError):
+        return None
+    if error.status_code in {429, 503}:
+        return True
+    return policy.idempotent and error.status_code >= 500
+
+
+def _raise_for_status(response: httpx.Response, method: str, path: str) -> None:
+    if response.is_error:
+        logger.debug("OCM API call failed:\n%s", response.text)
+        raise OcmError(
+            f"OCM API error on {method} {path}: {response.text}", response.status_code
+        )
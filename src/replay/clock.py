@@ -0,0 +1,23 @@
+import time
+
+
+class ScaledClock:
+    _speedup: float
+    _started_at: float
+
+    def __init__(self, speedup: float = 1000) -> None:
+        if speedup <= 0:
+            raise ValueError("Clock speedup must be a positive number.")
+        self._speedup = speedup
+        self._started_at = time.monotonic()
+
+    @property
+    def speedup(self) -> float:
+        return self._speedup
+
+    def monotonic(self) -> float:
+        # Simulated seconds since the clock was created.
+        return (time.monotonic() - self._started_at) * self._speedup
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(max(0.0, seconds) / self._speedup)
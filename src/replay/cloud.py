@@ -0,0 +1,196 @@
+import random
+import threading
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+from src.replay.clock import ScaledClock
+
+
+@dataclass(frozen=True)
+class RecoveryTimings:
+    # Mean times after a disruption of the provider storage: each disruption draws
+    # its own within the jitter, like real recoveries spread out.
+    detection_seconds: float = 20
+    jitter: float = 0.5
+    reconnection_seconds: float = 45
+    recovery_seconds: float = 180
+
+
+@dataclass(frozen=True)
+class CloudTimings:
+    addon_seconds: float = 900
+    api_latency: float = 1.0
+    install_seconds: float = 2400
+    nodes_seconds: float = 120
+    recovery: RecoveryTimings = RecoveryTimings()
+    subnets_seconds: float = 300
+    waiting_seconds: float = 60
+
+    @property
+    def consumer_addon_seconds(self) -> float:
+        # Critical path of a consumer addon run: the consumer is installed as soon
+        # as the provider subnets exist, its addon once both addons can be set up.
+        cluster_ready = self.install_seconds + self.nodes_seconds
+        return (
+            max(
+                cluster_ready + self.addon_seconds,
+                self.subnets_seconds + cluster_ready,
+            )
+            + self.addon_seconds
+        )
+
+
+@dataclass(frozen=True)
+class SimulatedDisruption:
+    cluster_id: str
+    detected_at: float
+    recovered_at: float
+    reconnected_at: float
+
+
+@dataclass
+class SimulatedCluster:
+    cluster_id: str
+    name: str
+    created_at: float
+    addons: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def infra_id(self) -> str:
+        return f"{self.name}-{self.cluster_id[:5]}"
+
+
+class SimulatedCloud:
+    # Cluster lifecycles unfold on a scaled clock: hours of provisioning take seconds.
+    _clock: ScaledClock
+    _clusters: dict[str, SimulatedCluster]
+    _disruptions: list[SimulatedDisruption]
+    _lock: threading.Lock
+    _random: random.Random
+    _requests: Counter[str]
+    _timings: CloudTimings
+
+    def __init__(
+        self, clock: ScaledClock, timings: CloudTimings, seed: Optional[int] = None
+    ) -> None:
+        self._clock = clock
+        self._clusters = {}
+        self._disruptions = []
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._requests = Counter()
+        self._timings = timings
+
+    @property
+    def clock(self) -> ScaledClock:
+        return self._clock
+
+    @property
+    def requests(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._requests)
+
+    @property
+    def timings(self) -> CloudTimings:
+        return self._timings
+
+    def call(self, api: str) -> None:
+        with self._lock:
+            self._requests[api] += 1
+        self._clock.sleep(self._timings.api_latency)
+
+    def create_cluster(self, name: str) -> SimulatedCluster:
+        cluster = SimulatedCluster(
+            cluster_id=uuid.uuid4().hex,
+            name=name,
+            created_at=self._clock.monotonic(),
+        )
+        with self._lock:
+            self._clusters[cluster.cluster_id] = cluster
+        return cluster
+
+    def delete_cluster(self, cluster_id: str) -> bool:
+        with self._lock:
+            return self._clusters.pop(cluster_id, None) is not None
+
+    def disrupt(self, cluster: SimulatedCluster) -> None:
+        timings = self._timings.recovery
+        with self._lock:
+            detected_at = self._clock.monotonic() + self._jitter(
+                timings.detection_seconds
+            )
+            recovered_at = detected_at + self._jitter(timings.recovery_seconds)
+            self._disruptions.append(
+                SimulatedDisruption(
+                    cluster_id=cluster.cluster_id,
+                    detected_at=detected_at,
+                    recovered_at=recovered_at,
+                    reconnected_at=recovered_at
+                    + self._jitter(timings.reconnection_seconds),
+                )
+            )
+
+    def find_clusters(self) -> list[SimulatedCluster]:
+        with self._lock:
+            return list(self._clusters.values())
+
+    def get_addon_phase(self, cluster: SimulatedCluster, addon_id: str) -> str:
+        if addon_id not in cluster.addons:
+            return ""
+        if self._elapsed(cluster.addons[addon_id]) < self._timings.addon_seconds:
+            return "Installing"
+        return "Succeeded"
+
+    def get_cluster(self, cluster_id: str) -> Optional[SimulatedCluster]:
+        with self._lock:
+            return self._clusters.get(cluster_id)
+
+    def get_state(self, cluster: SimulatedCluster) -> str:
+        elapsed = self._elapsed(cluster.created_at)
+        if elapsed < self._timings.waiting_seconds:
+            return "waiting"
+        if elapsed < self._timings.install_seconds:
+            return "installing"
+        return "ready"
+
+    def get_storage_cluster_phase(
+        self, cluster: SimulatedCluster, provider: bool
+    ) -> str:
+        # Every consumer is served by the disrupted provider: there is only one.
+        now = self._clock.monotonic()
+        with self._lock:
+            disruptions = list(self._disruptions)
+        if provider:
+            degraded = any(
+                disruption.cluster_id == cluster.cluster_id
+                and disruption.detected_at <= now < disruption.recovered_at
+                for disruption in disruptions
+            )
+            return "Progressing" if degraded else "Ready"
+        disconnected = any(
+            disruption.detected_at <= now < disruption.reconnected_at
+            for disruption in disruptions
+        )
+        return "Connecting" if disconnected else "Ready"
+
+    def install_addon(self, cluster: SimulatedCluster, addon_id: str) -> None:
+        with self._lock:
+            cluster.addons.setdefault(addon_id, self._clock.monotonic())
+
+    def nodes_ready(self, cluster: SimulatedCluster) -> bool:
+        return (
+            self._elapsed(cluster.created_at)
+            >= self._timings.install_seconds + self._timings.nodes_seconds
+        )
+
+    def subnets_created(self, cluster: SimulatedCluster) -> bool:
+        return self._elapsed(cluster.created_at) >= self._timings.subnets_seconds
+
+    def _elapsed(self, since: float) -> float:
+        return self._clock.monotonic() - since
+
+    def _jitter(self, seconds: float) -> float:
+        jitter = self._timings.recovery.jitter
+        return seconds * self._random.uniform(1 - jitter, 1 + jitter)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import fnmatch
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Any
+
+from src.replay.cloud import SimulatedCloud, SimulatedCluster
+
+if TYPE_CHECKING:
+    from botocore.model import OperationModel
+    from mypy_boto3_ec2.client import EC2Client
+
+AVAILABILITY_ZONES = ("a", "b", "c")
+
+
+def create_ec2_client(cloud: SimulatedCloud, region: str) -> EC2Client:
+    import boto3
+
+    client = boto3.session.Session(
+        aws_access_key_id="offline",
+        aws_secret_access_key="offline",
+        region_name=region,
+    ).client("ec2")
+    responder = Ec2Responder(cloud, region)
+    # Like botocore's Stubber, calls are answered before they are signed and sent,
+    # but from the simulated cloud instead of a queue of canned responses.
+    client.meta.events.register("before-call.ec2", responder.respond)  # type: ignore
+    return client
+
+
+class Ec2Responder:
+    _cloud: SimulatedCloud
+    _ip_permissions: dict[str, list[dict[str, Any]]]
+    _lock: threading.Lock
+    _region: str
+
+    def __init__(self, cloud: SimulatedCloud, region: str) -> None:
+        self._cloud = cloud
+        self._ip_permissions = {}
+        self._lock = threading.Lock()
+        self._region = region
+
+    def respond(
+        self, model: OperationModel, params: dict[str, Any], **_: Any
+    ) -> tuple[Any, dict[str, Any]]:
+        from botocore.awsrequest import AWSResponse
+        from botocore.compat import HTTPHeaders
+        from botocore.validate import validate_parameters
+
+        self._cloud.call("ec2")
+        # EC2 requests are serialized as query strings: "Filter.1.Value.1=...".
+        query = params["body"]
+        if model.name == "AuthorizeSecurityGroupIngress":
+            response = self._authorize_security_group_ingress(query)
+        elif model.name == "DescribeRegions":
+            response = {"Regions": [{"RegionName": self._region}]}
+        elif model.name == "DescribeSecurityGroups":
+            response = {"SecurityGroups": self._describe_security_groups(query)}
+        elif model.name == "DescribeSubnets":
+            response = {"Subnets": self._describe_subnets(query)}
+        else:
+            raise NotImplementedError(f"EC2 {model.name} is not simulated.")
+        # Responses are checked against the EC2 model, as the Stubber does.
+        if model.output_shape is not None:
+            validate_parameters(response, model.output_shape)
+        return AWSResponse("", 200, HTTPHeaders(), None), response
+
+    def _authorize_security_group_ingress(
+        self, query: dict[str, str]
+    ) -> dict[str, Any]:
+        group_id = query["GroupId"]
+        added_permissions = [
+            {
+                "IpProtocol": query[f"{prefix}.IpProtocol"],
+                "FromPort": int(query[f"{prefix}.FromPort"]),
+                "ToPort": int(query[f"{prefix}.ToPort"]),
+                "IpRanges": [{"CidrIp": query[f"{prefix}.IpRanges.1.CidrIp"]}],
+            }
+            for prefix in _get_list_prefixes(query, "IpPermissions")
+        ]
+        with self._lock:
+            self._ip_permissions.setdefault(group_id, []).extend(added_permissions)
+        return {"Return": True}
+
+    def _describe_security_groups(self, query: dict[str, str]) -> list[dict[str, Any]]:
+        group_ids = _get_list_values(query, "GroupId")
+        patterns = _get_list_values(query, "Filter.1.Value")
+        security_groups = []
+        for cluster in self._find_provisioned_clusters():
+            group_name = f"{cluster.infra_id}-worker-sg"
+            group_id = f"sg-{_get_resource_id(group_name)}"
+            if group_id in group_ids or _matches(group_name, patterns):
+                with self._lock:
+                    ip_permissions = list(self._ip_permissions.get(group_id, []))
+                security_groups.append(
+                    {
+                        "GroupId": group_id,
+                        "GroupName": group_name,
+                        "IpPermissions": ip_permissions,
+                        "Tags": [{"Key": "Name", "Value": group_name}],
+                    }
+                )
+        return security_groups
+
+    def _describe_subnets(self, query: dict[str, str]) -> list[dict[str, Any]]:
+        patterns = _get_list_values(query, "Filter.1.Value")
+        return [
+            {
+                "AvailabilityZone": f"{self._region}{zone}",
+                "SubnetId": f"subnet-{_get_resource_id(subnet_name)}",
+                "Tags": [{"Key": "Name", "Value": subnet_name}],
+                "VpcId": f"vpc-{_get_resource_id(cluster.infra_id)}",
+            }
+            for cluster in self._find_provisioned_clusters()
+            for zone in AVAILABILITY_ZONES
+            for role in ("private", "public")
+            if _matches(
+                subnet_name := f"{cluster.infra_id}-{role}-{self._region}{zone}",
+                patterns,
+            )
+        ]
+
+    def _find_provisioned_clusters(self) -> list[SimulatedCluster]:
+        return [
+            cluster
+            for cluster in self._cloud.find_clusters()
+            if self._cloud.subnets_created(cluster)
+        ]
+
+
+def _get_list_prefixes(query: dict[str, str], name: str) -> list[str]:
+    return sorted(
+        {".".join(key.split(".")[:2]) for key in query if key.startswith(f"{name}.")},
+        key=lambda prefix: int(prefix.split(".")[1]),
+    )
+
+
+def _get_list_values(query: dict[str, str], name: str) -> list[str]:
+    return [value for key, value in query.items() if key.startswith(f"{name}.")]
+
+
+def _get_resource_id(name: str) -> str:
+    return hashlib.sha256(name.encode()).hexdigest()[:17]
+
+
+def _matches(name: str, patterns: list[str]) -> bool:
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+from typing import Any, Optional
+
+from src.replay.clock import ScaledClock
+from src.replay.cloud import CloudTimings, SimulatedCloud
+from src.replay.ec2 import create_ec2_client
+from src.replay.kube import FakeKubeServer
+from src.replay.ocm import FakeOcm
+from src.service.aws import AWSService
+from src.service.cluster import ClusterService
+from src.util.util import save_to_file
+
+OFFLINE_ENV = {
+    "AWS_ACCESS_KEY_ID": "offline",
+    "AWS_ACCOUNT_ID": "000000000000",
+    "AWS_REGION": "us-east-1",
+    "AWS_SECRET_ACCESS_KEY": "offline",
+    "USE_CLUSTER_POOL": "false",
+}
+# Settings that would pin the flows to live clusters, subnets or runs.
+LIVE_ENV = (
+    "AWS_AVAILABILITY_ZONES",
+    "AWS_SUBNET_IDS",
+    "CONSUMER_CLUSTER_NAME",
+    "OCM_CASSETTE",
+    "PROVIDER_CLUSTER_NAME",
+    "RUN_ID",
+)
+
+
+class OfflineHarness:
+    # Runs the services against a simulated OCM, EC2 and kube API: no credentials,
+    # no network and hours of provisioning replayed in seconds.
+    _cloud: SimulatedCloud
+    _cluster_template: Optional[dict[str, Any]]
+    _kube_server: FakeKubeServer
+    _saved_env: dict[str, Optional[str]]
+    _work_dir: str = ""
+
+    def __init__(
+        self,
+        timings: CloudTimings = CloudTimings(),
+        speedup: float = 1000,
+        cluster_template: Optional[dict[str, Any]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self._cloud = SimulatedCloud(ScaledClock(speedup), timings, seed)
+        self._cluster_template = cluster_template
+        self._kube_server = FakeKubeServer(self._cloud)
+        self._saved_env = {}
+
+    def __enter__(self) -> "OfflineHarness":
+        self._work_dir = tempfile.mkdtemp(prefix="ocs-osd-ci-offline-")
+        private_key, public_key = _generate_onboarding_keys()
+        self._set_env(
+            {
+                **OFFLINE_ENV,
+                "ONBOARDING_PRIVATE_KEY_FILE": save_to_file(
+                    f"{self._work_dir}/onboarding-private-key.pem", private_key
+                ),
+                "ONBOARDING_PUBLIC_KEY": public_key,
+            }
+        )
+        self._kube_server.__enter__()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self._kube_server.__exit__()
+        for name, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(self._work_dir, ignore_errors=True)
+
+    @property
+    def cloud(self) -> SimulatedCloud:
+        return self._cloud
+
+    def create_services(self, name: str) -> tuple[ClusterService, AWSService]:
+        return (
+            ClusterService(
+                data_dir=os.path.join(self._work_dir, name),
+                ocm_backend=FakeOcm(
+                    self._cloud, self._kube_server, self._cluster_template
+                ),
+                clock=self._cloud.clock,
+            ),
+            AWSService(
+                create_ec2_client(self._cloud, OFFLINE_ENV["AWS_REGION"]),
+                self._cloud.clock,
+            ),
+        )
+
+    def _set_env(self, values: dict[str, str]) -> None:
+        for name in (*values, *LIVE_ENV):
+            self._saved_env[name] = os.environ.pop(name, None)
+        os.environ.update(values)
+
+
+def _generate_onboarding_keys() -> tuple[str, str]:
+    from cryptography.hazmat.primitives.asymmetric.rsa import generate_private_key
+    from cryptography.hazmat.primitives.serialization import (
+        Encoding,
+        NoEncryption,
+        PrivateFormat,
+        PublicFormat,
+    )
+
+    private_key = generate_private_key(public_exponent=65537, key_size=2048)
+    return (
+        private_key.private_bytes(
+            Encoding.PEM, PrivateFormat.TraditionalOpenSSL, NoEncryption()
+        ).decode(),
+        private_key.public_key()
+        .public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
+        .decode(),
+    )
@@ -0,0 +1,256 @@
+import json
+import logging
+import threading
+from collections.abc import Iterator
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+from src.replay.cloud import SimulatedCloud, SimulatedCluster
+from src.service.cluster import ADDON_CSV_REQUEST, STORAGE_CLUSTER_REQUEST, AddonId
+
+logger = logging.getLogger()
+
+NODES_PATH = "/api/v1/nodes"
+PODS_PATH = f"/api/v1/namespaces/{STORAGE_CLUSTER_REQUEST.namespace}/pods"
+CSVS_PATH = (
+    f"/apis/{ADDON_CSV_REQUEST.group}/{ADDON_CSV_REQUEST.version}"
+    f"/namespaces/{ADDON_CSV_REQUEST.namespace}/{ADDON_CSV_REQUEST.plural}"
+)
+STORAGE_CLUSTER_PATH = (
+    f"/apis/{STORAGE_CLUSTER_REQUEST.group}/{STORAGE_CLUSTER_REQUEST.version}"
+    f"/namespaces/{STORAGE_CLUSTER_REQUEST.namespace}"
+    f"/{STORAGE_CLUSTER_REQUEST.plural}/{STORAGE_CLUSTER_REQUEST.name}"
+)
+
+
+class FakeKubeServer:
+    # A single API server answers for every simulated cluster: the bearer token
+    # of each kubeconfig is the id of its cluster.
+    _server: ThreadingHTTPServer
+    _thread: threading.Thread
+
+    def __init__(self, cloud: SimulatedCloud) -> None:
+        self._server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), partial(_KubeRequestHandler, cloud, _ListSnapshots())
+        )
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-kube", daemon=True
+        )
+
+    def __enter__(self) -> "FakeKubeServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def get_kubeconfig(self, cluster_id: str) -> str:
+        host, port = self._server.server_address[:2]
+        return "\n".join(
+            (
+                "apiVersion: v1",
+                "kind: Config",
+                "clusters:",
+                f"- cluster: {{server: 'http://{host!s}:{port}'}}",
+                "  name: offline",
+                "contexts:",
+                "- context: {cluster: offline, user: offline}",
+                "  name: offline",
+                "current-context: offline",
+                "users:",
+                "- name: offline",
+                f"  user: {{token: {cluster_id}}}",
+                "",
+            )
+        )
+
+
+class _ListSnapshots:
+    # Every list gets a resource version: a watch from it sends the changes since
+    # that list, as the API server does.
+    _lock: threading.Lock
+    _snapshots: dict[str, dict[str, dict[str, Any]]]
+    _versions: Iterator[int]
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._versions = count(1)
+
+    def add(self, objects: dict[str, dict[str, Any]]) -> str:
+        with self._lock:
+            resource_version = str(next(self._versions))
+            self._snapshots[resource_version] = objects
+        return resource_version
+
+    def pop(self, resource_version: str) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return self._snapshots.pop(resource_version, {})
+
+
+class _KubeRequestHandler(BaseHTTPRequestHandler):
+    _cloud: SimulatedCloud
+    _list_snapshots: _ListSnapshots
+    protocol_version = "HTTP/1.1"  # noqa: V107
+    # Simulated seconds between two checks for changes of watched objects.
+    _watch_resync_seconds = 5.0
+
+    def __init__(
+        self, cloud: SimulatedCloud, list_snapshots: _ListSnapshots, *args: Any
+    ) -> None:
+        self._cloud = cloud
+        self._list_snapshots = list_snapshots
+        super().__init__(*args)
+
+    def do_DELETE(self) -> None:  # noqa: V105 # pylint: disable=invalid-name
+        # Deleting the storage pods of a provider disrupts its storage for a while.
+        self._cloud.call("kube")
+        if (cluster := self._get_cluster()) is None:
+            self._send_status(HTTPStatus.UNAUTHORIZED)
+        elif urlparse(self.path).path != PODS_PATH or not self._is_provider(cluster):
+            self._send_status(HTTPStatus.NOT_FOUND)
+        else:
+            self._cloud.disrupt(cluster)
+            self._send_json(
+                {
+                    "kind": "PodList",
+                    "items": [
+                        {"metadata": {"name": f"rook-ceph-osd-{index}"}}
+                        for index in range(3)
+                    ],
+                }
+            )
+
+    def do_GET(self) -> None:  # noqa: V105 # pylint: disable=invalid-name
+        self._cloud.call("kube")
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if (cluster := self._get_cluster()) is None:
+            self._send_status(HTTPStatus.UNAUTHORIZED)
+        elif url.path == STORAGE_CLUSTER_PATH:
+            self._get_storage_cluster(cluster)
+        elif url.path not in {NODES_PATH, CSVS_PATH}:
+            self._send_status(HTTPStatus.NOT_FOUND)
+        elif params.get("watch", "").lower() == "true":
+            self._watch(
+                cluster,
+                url.path,
+                float(params.get("timeoutSeconds", "60")),
+                self._list_snapshots.pop(params.get("resourceVersion", "")),
+            )
+        else:
+            objects = self._list_objects(cluster, url.path)
+            self._send_json(
+                {
+                    "metadata": {"resourceVersion": self._list_snapshots.add(objects)},
+                    "items": list(objects.values()),
+                }
+            )
+
+    def log_message(self, *args: Any) -> None:  # noqa: V105
+        logger.debug("Fake kube API: %s", args[0] % args[1:])
+
+    def _get_cluster(self) -> Optional[SimulatedCluster]:
+        return self._cloud.get_cluster(
+            self.headers.get("Authorization", "").removeprefix("Bearer ")
+        )
+
+    def _get_storage_cluster(self, cluster: SimulatedCluster) -> None:
+        provider = self._is_provider(cluster)
+        if not provider and (
+            self._cloud.get_addon_phase(cluster, AddonId.CONSUMER.value) != "Succeeded"
+        ):
+            self._send_status(HTTPStatus.NOT_FOUND)
+            return
+        status = {"phase": self._cloud.get_storage_cluster_phase(cluster, provider)}
+        if provider:
+            status["storageProviderEndpoint"] = "10.0.0.10:31659"
+        self._send_json(
+            {"metadata": {"name": STORAGE_CLUSTER_REQUEST.name}, "status": status}
+        )
+
+    def _is_provider(self, cluster: SimulatedCluster) -> bool:
+        return (
+            self._cloud.get_addon_phase(cluster, AddonId.PROVIDER.value) == "Succeeded"
+        )
+
+    def _list_objects(
+        self, cluster: SimulatedCluster, path: str
+    ) -> dict[str, dict[str, Any]]:
+        if path == NODES_PATH:
+            ready = str(self._cloud.nodes_ready(cluster))
+            return {
+                name: {
+                    "metadata": {"name": name},
+                    "status": {"conditions": [{"type": "Ready", "status": ready}]},
+                }
+                for name in (f"ip-10-0-{index}-10.ec2.internal" for index in range(3))
+            }
+        return {
+            f"ocs-osd-deployer.{addon_id}": {
+                "metadata": {"name": f"ocs-osd-deployer.{addon_id}"},
+                "status": {"phase": self._cloud.get_addon_phase(cluster, addon_id)},
+            }
+            for addon_id in cluster.addons
+        }
+
+    def _send_json(
+        self, body: dict[str, Any], status: HTTPStatus = HTTPStatus.OK
+    ) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_status(self, status: HTTPStatus) -> None:
+        self._send_json(
+            {"kind": "Status", "code": status.value, "reason": status.phrase}, status
+        )
+
+    def _watch(
+        self,
+        cluster: SimulatedCluster,
+        path: str,
+        timeout: float,
+        objects: dict[str, dict[str, Any]],
+    ) -> None:
+        # Events are sent as they happen in chunks, like the API server does.
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        expires_at = self._cloud.clock.monotonic() + timeout
+        for _ in count():
+            current = self._list_objects(cluster, path)
+            events = [
+                {"type": "MODIFIED" if name in objects else "ADDED", "object": item}
+                for name, item in current.items()
+                if objects.get(name) != item
+            ]
+            objects = current
+            if events and not self._write_chunk(
+                "".join(f"{json.dumps(event)}\n" for event in events).encode()
+            ):
+                return
+            remaining = expires_at - self._cloud.clock.monotonic()
+            if remaining <= 0 or self._cloud.get_cluster(cluster.cluster_id) is None:
+                self._write_chunk(b"")
+                return
+            self._cloud.clock.sleep(min(self._watch_resync_seconds, remaining))
+
+    def _write_chunk(self, data: bytes) -> bool:
+        # The empty chunk ends the stream.
+        try:
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Fake kube API: watch client disconnected.")
+            return False
+        return True
@@ -0,0 +1,98 @@
+import copy
+import json
+import re
+from typing import Any, Optional
+
+from src.platform.ocm import OcmError
+from src.replay.cloud import SimulatedCloud, SimulatedCluster
+from src.replay.kube import FakeKubeServer
+from src.service.cluster import CLUSTERS_API_PATH
+from src.util.util import get_file_content
+
+_CLUSTER_PATH = re.compile(rf"^{CLUSTERS_API_PATH}/(\w+)(/\w+)?$")
+_SEARCH_IDS = re.compile(r"'([^']+)'")
+
+
+def load_cluster_template(cassette_file: str) -> dict[str, Any]:
+    # The last cluster recorded by OcmRecorder gives replayed clusters a real payload.
+    template: dict[str, Any] = {}
+    for line in get_file_content(cassette_file).splitlines():
+        entry = json.loads(line)
+        if entry["method"] == "GET" and entry["path"] == CLUSTERS_API_PATH:
+            template = next(iter(entry["response"].get("items", [])), template)
+    if not template:
+        raise ValueError(f"No cluster recorded in cassette {cassette_file}.")
+    return template
+
+
+class FakeOcm:
+    _cloud: SimulatedCloud
+    _cluster_template: dict[str, Any]
+    _kube_server: FakeKubeServer
+
+    def __init__(
+        self,
+        cloud: SimulatedCloud,
+        kube_server: FakeKubeServer,
+        cluster_template: Optional[dict[str, Any]] = None,
+    ) -> None:
+        self._cloud = cloud
+        self._cluster_template = cluster_template or {"kind": "Cluster"}
+        self._kube_server = kube_server
+
+    def delete(self, path: str) -> None:
+        self._cloud.call("ocm")
+        cluster_id, resource = self._match_cluster_path(path)
+        if resource or not self._cloud.delete_cluster(cluster_id):
+            raise OcmError(f"OCM API error on DELETE {path}: not found", 404)
+
+    def get(self, path: str, params: Optional[dict[str, str]] = None) -> dict[str, Any]:
+        self._cloud.call("ocm")
+        if path == CLUSTERS_API_PATH:
+            return self._search_clusters(params or {})
+        cluster_id, resource = self._match_cluster_path(path)
+        if resource == "/credentials":
+            return {"kubeconfig": self._kube_server.get_kubeconfig(cluster_id)}
+        raise OcmError(f"OCM API error on GET {path}: not found", 404)
+
+    def post(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        self._cloud.call("ocm")
+        if path == CLUSTERS_API_PATH:
+            return self._get_cluster_info(self._cloud.create_cluster(body["name"]))
+        cluster_id, resource = self._match_cluster_path(path)
+        cluster = self._cloud.get_cluster(cluster_id)
+        if resource != "/addons" or cluster is None:
+            raise OcmError(f"OCM API error on POST {path}: not found", 404)
+        self._cloud.install_addon(cluster, body["addon"]["id"])
+        return {"kind": "AddOnInstallation", "id": body["addon"]["id"]}
+
+    def _get_cluster_info(self, cluster: SimulatedCluster) -> dict[str, Any]:
+        cluster_info = copy.deepcopy(self._cluster_template)
+        cluster_info.update(id=cluster.cluster_id, name=cluster.name)
+        cluster_info.setdefault("status", {})["state"] = self._cloud.get_state(cluster)
+        return cluster_info
+
+    def _match_cluster_path(self, path: str) -> tuple[str, str]:
+        if not (match := _CLUSTER_PATH.match(path)):
+            raise OcmError(f"OCM API error on {path}: not found", 404)
+        if self._cloud.get_cluster(match.group(1)) is None:
+            raise OcmError(f"OCM API error on {path}: cluster not found", 404)
+        return match.group(1), match.group(2) or ""
+
+    def _search_clusters(self, params: dict[str, str]) -> dict[str, Any]:
+        # Only the "id in (...)" search sent by ClusterService is supported.
+        cluster_ids = set(_SEARCH_IDS.findall(params.get("search", "")))
+        items = [
+            self._get_cluster_info(cluster)
+            for cluster in self._cloud.find_clusters()
+            if cluster.cluster_id in cluster_ids
+        ]
+        page, size = int(params.get("page", "1")), int(params.get("size", "100"))
+        page_items = items[(page - 1) * size : page * size]
+        return {
+            "kind": "ClusterList",
+            "page": page,
+            "size": len(page_items),
+            "total": len(items),
+            "items": page_items,
+        }
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+from collections import defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any, Optional, TypeVar
+
+from src.platform.kube import AsyncKubeClient, KubeResponse, UnauthorizedError
+from src.platform.ocm import (
+    AsyncOcmBackend,
+    AsyncOcmClient,
+    OcmClient,
+    OcmError,
+    ThreadedOcmBackend,
+)
+from src.service.cluster import (
+    ADDON_CSV_REQUEST,
+    CLUSTERS_API_PATH,
+    STORAGE_CLUSTER_REQUEST,
+    AddonId,
+    ClusterService,
+    get_csvs_phase,
+)
+from src.service.ledger import ClusterRole, ClusterUpdate
+from src.service.spec import AddonSpec, ClusterSpec
+from src.util.aio import gather_or_cancel
+from src.util.logs import with_cluster_id
+from src.util.metrics import timed
+from src.util.wait import (
+    Backoff,
+    Deadline,
+    WatchError,
+    async_poll_until,
+    async_watch_until,
+)
+
+logger = logging.getLogger()
+
+T = TypeVar("T")
+
+
+class AsyncClusterService:
+    _cluster_service: ClusterService
+    _cluster_state_backoff = Backoff(initial=15, maximum=120)
+    _kube_clients: dict[str, AsyncKubeClient]
+    _kube_client_locks: defaultdict[str, asyncio.Lock]
+    _ocm_backend: Optional[AsyncOcmBackend]
+
+    def __init__(
+        self,
+        cluster_service: Optional[ClusterService] = None,
+        ocm_backend: Optional[AsyncOcmBackend] = None,
+    ) -> None:
+        # Writes (installs, addons, uninstalls) and the ledger stay on the blocking
+        # service in worker threads: only the long waits are natively asynchronous.
+        self._cluster_service = cluster_service or ClusterService()
+        self._kube_clients = {}
+        self._kube_client_locks = defaultdict(asyncio.Lock)
+        self._ocm_backend = ocm_backend
+
+    async def __aenter__(self) -> "AsyncClusterService":
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        await self.aclose()
+
+    @property
+    def cluster_service(self) -> ClusterService:
+        return self._cluster_service
+
+    async def aclose(self) -> None:
+        clients: list[Any] = list(self._kube_clients.values())
+        self._kube_clients.clear()
+        if self._ocm_backend:
+            clients.append(self._ocm_backend)
+            self._ocm_backend = None
+        await gather_or_cancel(*(client.aclose() for client in clients))
+
+    @timed()
+    @with_cluster_id
+    async def get_addon_ocs_provider_storage_endpoint(self, cluster_id: str) -> str:
+        storage_cluster = await self._call_kube(
+            cluster_id,
+            lambda kube_client: kube_client.get_object(STORAGE_CLUSTER_REQUEST),
+        )
+        storage_provider_endpoint = storage_cluster.status.storage_provider_endpoint
+        logger.info("Storage Provider Endpoint: %s", storage_provider_endpoint)
+        return storage_provider_endpoint
+
+    async def get_consumer_onboarding_ticket(self) -> str:
+        return await asyncio.to_thread(
+            self._cluster_service.get_consumer_onboarding_ticket
+        )
+
+    async def get_consumer_onboarding_tickets(self, number: int) -> list[str]:
+        return await asyncio.to_thread(
+            self._cluster_service.get_consumer_onboarding_tickets, number
+        )
+
+    async def install_addon(self, cluster_id: str, spec: AddonSpec) -> None:
+        await asyncio.to_thread(self._cluster_service.install_addon, cluster_id, spec)
+
+    async def install_spec(self, spec: ClusterSpec, role: ClusterRole) -> str:
+        return await asyncio.to_thread(self._cluster_service.install_spec, spec, role)
+
+    async def share_kubeconfig_file(self, cluster_id: str, target_file: str) -> str:
+        return await asyncio.to_thread(
+            self._cluster_service.share_kubeconfig_file, cluster_id, target_file
+        )
+
+    async def uninstall(self, cluster_id: str, cluster_name: str) -> bool:
+        return await asyncio.to_thread(
+            self._cluster_service.uninstall, cluster_id, cluster_name
+        )
+
+    @timed()
+    @with_cluster_id
+    async def wait_for_addon_ready(
+        self, cluster_id: str, addon_id: AddonId, timeout: int = 5400
+    ) -> None:
+        async def addon_ready(timeout_seconds: int) -> AsyncIterator[bool]:
+            def watch_csvs(
+                kube_client: AsyncKubeClient,
+            ) -> AsyncIterator[dict[str, KubeResponse]]:
+                return kube_client.watch_objects(ADDON_CSV_REQUEST, timeout_seconds)
+
+            addon_status = "Not Found"
+            async for csvs in self._watch_kube(cluster_id, watch_csvs):
+                if (status := get_csvs_phase(csvs)) != addon_status:
+                    logger.info("Addon %s current status: %s", addon_id.value, status)
+                    addon_status = status
+                yield addon_status == "Succeeded"
+
+        await async_watch_until(addon_ready, timeout)
+        await asyncio.to_thread(
+            self._cluster_service.record_state,
+            cluster_id,
+            ClusterUpdate(addon_state="Succeeded"),
+        )
+        logger.info("Addon %s is ready.", addon_id.value)
+
+    @timed()
+    @with_cluster_id
+    async def wait_for_cluster_ready(
+        self, cluster_id: str, timeout: int = 5400
+    ) -> None:
+        deadline = Deadline(timeout)
+        cluster_name = ""
+
+        async def cluster_state_ready() -> bool:
+            nonlocal cluster_name
+            try:
+                cluster_info = await self._get_ocm_backend().get(
+                    f"{CLUSTERS_API_PATH}/{cluster_id}"
+                )
+            except OcmError as error:
+                if error.status_code == 404:
+                    raise ValueError(f"Cluster {cluster_id} not found.") from error
+                raise
+            cluster_name = cluster_info["name"]
+            if (state := cluster_info["status"]["state"]) == "error":
+                await asyncio.to_thread(
+                    self._cluster_service.record_state,
+                    cluster_id,
+                    ClusterUpdate(state=state),
+                )
+                raise ValueError(f"Cluster {cluster_name} is in error state.")
+            logger.info("Cluster %s state: %s", cluster_name, state)
+            return bool(state == "ready")
+
+        await async_poll_until(
+            cluster_state_ready, timeout, self._cluster_state_backoff
+        )
+        await asyncio.to_thread(
+            self._cluster_service.record_state,
+            cluster_id,
+            ClusterUpdate(state="ready"),
+        )
+
+        async def nodes_ready(timeout_seconds: int) -> AsyncIterator[bool]:
+            async for statuses in self._watch_kube(
+                cluster_id,
+                lambda kube_client: kube_client.watch_nodes_statuses(timeout_seconds),
+            ):
+                yield bool(statuses) and all(statuses.values())
+
+        await async_watch_until(nodes_ready, max(1, deadline.remaining))
+        logger.info("Cluster %s is ready.", cluster_name)
+
+    async def _call_kube(
+        self, cluster_id: str, func: Callable[[AsyncKubeClient], Awaitable[T]]
+    ) -> T:
+        try:
+            return await func(await self._get_kube_client(cluster_id))
+        except UnauthorizedError:
+            await self._invalidate_kube_client(cluster_id)
+        return await func(await self._get_kube_client(cluster_id))
+
+    async def _get_kube_client(self, cluster_id: str) -> AsyncKubeClient:
+        # Per cluster locks: a kubeconfig fetch only delays the same cluster calls.
+        async with self._kube_client_locks[cluster_id]:
+            if cluster_id not in self._kube_clients:
+                self._kube_clients[cluster_id] = await asyncio.to_thread(
+                    lambda: AsyncKubeClient(
+                        self._cluster_service.save_kubeconfig_file(cluster_id)
+                    )
+                )
+            return self._kube_clients[cluster_id]
+
+    def _get_ocm_backend(self) -> AsyncOcmBackend:
+        # Reads go through the backend of the blocking service: natively for the
+        # OCM API, sharing its access tokens, in worker threads otherwise.
+        if self._ocm_backend is None:
+            backend = self._cluster_service.ocm_backend
+            self._ocm_backend = (
+                AsyncOcmClient(backend.url, backend)
+                if isinstance(backend, OcmClient)
+                else ThreadedOcmBackend(backend)
+            )
+        return self._ocm_backend
+
+    async def _invalidate_kube_client(self, cluster_id: str) -> None:
+        logger.info("Refreshing rejected credentials of cluster %s.", cluster_id)
+        if kube_client := self._kube_clients.pop(cluster_id, None):
+            await kube_client.aclose()
+        await asyncio.to_thread(self._cluster_service.expire_kubeconfig, cluster_id)
+
+    async def _watch_kube(
+        self,
+        cluster_id: str,
+        watch: Callable[[AsyncKubeClient], AsyncIterator[T]],
+    ) -> AsyncIterator[T]:
+        try:  # pylint: disable=too-many-try-statements
+            async for item in watch(await self._get_kube_client(cluster_id)):
+                yield item
+        except UnauthorizedError as error:
+            await self._invalidate_kube_client(cluster_id)
+            raise WatchError("Kubernetes credentials were rejected.") from error
@@ -1,125 +1,396 @@
-import logging
-from dataclasses import dataclass
+from __future__ import annotations
 
-import boto3
-from mypy_boto3_ec2.client import EC2Client
-from mypy_boto3_ec2.type_defs import (
-    AuthorizeSecurityGroupIngressResultTypeDef,
-    DescribeSecurityGroupsResultTypeDef,
-    DescribeSubnetsResultTypeDef,
-)
+import asyncio
+import logging
+import threading
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from enum import Enum
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Optional, Union
 
+from src.util.cache import TTLCache
+from src.util.metrics import timed
 from src.util.util import env
+from src.util.wait import SYSTEM_CLOCK, Backoff, Clock, async_poll_until, poll_until
+
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.client import EC2Client
+    from mypy_boto3_ec2.type_defs import (
+        AuthorizeSecurityGroupIngressResultTypeDef,
+        InstanceTypeDef,
+        IpPermissionTypeDef,
+        SecurityGroupTypeDef,
+        SubnetTypeDef,
+    )
 
 logger = logging.getLogger()
 
+CLUSTER_TAG_PREFIX = "kubernetes.io/cluster/"
+
+
+class SubnetRole(Enum):
+    PRIVATE = "private"
+    PUBLIC = "public"
+
 
-@dataclass
+@dataclass(frozen=True)
+class ClusterSubnet:
+    availability_zone: str
+    role: SubnetRole
+    subnet_id: str
+    vpc_id: str
+
+
+@dataclass(frozen=True)
 class ClusterSubnetsInfo:
-    availability_zones: list[str]
-    subnet_ids: list[str]
+    subnets: tuple[ClusterSubnet, ...]
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "ClusterSubnetsInfo":
+        return cls(
+            subnets=tuple(
+                ClusterSubnet(
+                    availability_zone=subnet["availability_zone"],
+                    role=SubnetRole(subnet["role"]),
+                    subnet_id=subnet["subnet_id"],
+                    vpc_id=subnet["vpc_id"],
+                )
+                for subnet in data["subnets"]
+            )
+        )
+
+    @property
+    def availability_zones(self) -> list[str]:
+        return sorted({subnet.availability_zone for subnet in self.subnets})
+
+    @property
+    def complete(self) -> bool:
+        # The installer creates a public and a private subnet per availability zone.
+        return bool(self.subnets) and all(
+            {subnet.role for subnet in self.subnets if subnet.availability_zone == zone}
+            == set(SubnetRole)
+            for zone in self.availability_zones
+        )
+
+    @property
+    def subnet_ids(self) -> list[str]:
+        return [subnet.subnet_id for subnet in self.subnets]
+
+    @property
+    def vpc_ids(self) -> list[str]:
+        return sorted({subnet.vpc_id for subnet in self.subnets})
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "subnets": [
+                {**asdict(subnet), "role": subnet.role.value} for subnet in self.subnets
+            ]
+        }
+
+
+@dataclass(frozen=True)
+class InboundRule:
+    from_port: int
+    to_port: int
+    description: str
+    cidr: str = "10.0.0.0/16"
+    protocol: str = "tcp"
+
+    def to_ip_permission(self) -> IpPermissionTypeDef:
+        return {
+            "FromPort": self.from_port,
+            "ToPort": self.to_port,
+            "IpProtocol": self.protocol,
+            "IpRanges": [{"CidrIp": self.cidr, "Description": self.description}],
+        }
 
 
 class AWSService:
-    _ec2_client: EC2Client
-
-    def __init__(self) -> None:
-        self._ec2_client = boto3.client(
-            "ec2",
-            aws_access_key_id=env("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=env("AWS_SECRET_ACCESS_KEY"),
-            region_name=env("AWS_REGION"),
+    _authorize_attempts = 3
+    _canary_checked = False
+    _canary_lock: threading.Lock
+    _client: EC2Client
+    _clock: Clock
+    _provider_addon_inbound_rules = (
+        InboundRule(6800, 7300, "Ceph OSDs"),
+        InboundRule(3300, 3300, "Ceph MONs rule1"),
+        InboundRule(6789, 6789, "Ceph MONs rule2"),
+        InboundRule(9283, 9283, "Ceph Manager"),
+        InboundRule(31659, 31659, "API Server"),
+    )
+
+    _subnets_cache: TTLCache[str, ClusterSubnetsInfo]
+
+    def __init__(
+        self, ec2_client: Optional[EC2Client] = None, clock: Clock = SYSTEM_CLOCK
+    ) -> None:
+        self._canary_lock = threading.Lock()
+        self._client = ec2_client or _get_ec2_client()
+        self._clock = clock
+        self._subnets_cache = TTLCache(
+            maxsize=32, ttl=env.int("SUBNETS_CACHE_TTL", default=600)
+        )
+
+    @timed()
+    def add_provider_addon_inbound_rules(self, *cluster_names: str) -> int:
+        # Only the rules missing from each worker security group are authorized,
+        # so reruns are no-ops and concurrent reconcilers don't conflict.
+        security_groups = self._describe_worker_security_groups(cluster_names)
+        if missing_clusters := [
+            cluster_name
+            for cluster_name in cluster_names
+            if not any(
+                self._get_tag(security_group, "Name").startswith(f"{cluster_name}-")
+                for security_group in security_groups
+            )
+        ]:
+            raise RuntimeError(
+                f"EC2: no worker security group found for clusters: {missing_clusters}"
+            )
+        added_rules = 0
+        for security_group in security_groups:
+            added_rules += self._authorize_missing_rules(security_group)
+        logger.info(
+            "EC2: %d inbound rules added to %d security groups.",
+            added_rules,
+            len(security_groups),
+        )
+        return added_rules
+
+    @timed()
+    def find_cluster_instances(self, name_prefixes: Sequence[str]) -> dict[str, int]:
+        # Counts the live instances of each cluster from the tag OpenShift puts on
+        # them, "kubernetes.io/cluster/<cluster name>-<random suffix>".
+        paginator = self._ec2_client.get_paginator("describe_instances")
+        cluster_instances: dict[str, int] = {}
+        for page in paginator.paginate(
+            Filters=[
+                {
+                    "Name": "tag:Name",
+                    "Values": [f"{prefix}*" for prefix in name_prefixes],
+                },
+                {
+                    "Name": "instance-state-name",
+                    "Values": ["pending", "running", "stopping", "stopped"],
+                },
+            ]
+        ):
+            for reservation in page.get("Reservations", []):
+                for instance in reservation.get("Instances", []):
+                    if cluster_name := self._get_instance_cluster_name(instance):
+                        cluster_instances[cluster_name] = (
+                            cluster_instances.get(cluster_name, 0) + 1
+                        )
+        return cluster_instances
+
+    @timed()
+    def get_subnets_info(self, cluster_name: str) -> ClusterSubnetsInfo:
+        if subnets_info := self._subnets_cache.get(cluster_name):
+            return subnets_info
+        return self._discover_subnets(cluster_name)
+
+    @timed()
+    def wait_for_subnets_info(
+        self, cluster_name: str, timeout: int = 1800
+    ) -> ClusterSubnetsInfo:
+        subnets_info = ClusterSubnetsInfo(subnets=())
+
+        def subnets_created() -> bool:
+            nonlocal subnets_info
+            subnets_info = self.get_subnets_info(cluster_name)
+            return subnets_info.complete
+
+        poll_until(
+            subnets_created, timeout, Backoff(initial=15, maximum=60), self._clock
         )
-        # Check the connectivity through a canary test:
-        self._ec2_client.describe_regions()
+        return subnets_info
+
+    @property
+    def _ec2_client(self) -> EC2Client:
+        with self._canary_lock:
+            if not self._canary_checked:
+                # Check the connectivity through a canary test on first use.
+                self._client.describe_regions()
+                self._canary_checked = True
+        return self._client
+
+    def _authorize_missing_rules(self, security_group: SecurityGroupTypeDef) -> int:
+        from botocore.exceptions import ClientError
 
-    def add_provider_addon_inbound_rules(self, cluster_name: str) -> None:
-        describe_result: DescribeSecurityGroupsResultTypeDef = (
-            self._ec2_client.describe_security_groups(
+        group_id = security_group["GroupId"]
+        for attempt in range(1, self._authorize_attempts + 1):
+            if not (
+                missing_rules := self._get_missing_rules(
+                    security_group.get("IpPermissions", [])
+                )
+            ):
+                return 0
+            try:
+                authorize_result: AuthorizeSecurityGroupIngressResultTypeDef = (
+                    self._ec2_client.authorize_security_group_ingress(
+                        GroupId=group_id,
+                        IpPermissions=[
+                            rule.to_ip_permission() for rule in missing_rules
+                        ],
+                    )
+                )
+            except ClientError as error:
+                # Another reconciler added some of the rules in the meantime.
+                if (
+                    error.response.get("Error", {}).get("Code")
+                    != "InvalidPermission.Duplicate"
+                    or attempt == self._authorize_attempts
+                ):
+                    raise
+                logger.info("EC2: %s rules changed concurrently, retrying.", group_id)
+                security_group = self._ec2_client.describe_security_groups(
+                    GroupIds=[group_id]
+                )["SecurityGroups"][0]
+                continue
+            if not authorize_result["Return"]:
+                logger.error(authorize_result)
+                raise RuntimeError("EC2: error while adding inbound rules.")
+            logger.info(
+                "EC2: added inbound rules to %s: %s",
+                group_id,
+                ", ".join(rule.description for rule in missing_rules),
+            )
+            return len(missing_rules)
+        return 0
+
+    def _discover_subnets(self, cluster_name: str) -> ClusterSubnetsInfo:
+        paginator = self._ec2_client.get_paginator("describe_subnets")
+        subnets_info = ClusterSubnetsInfo(
+            subnets=tuple(
+                ClusterSubnet(
+                    availability_zone=subnet["AvailabilityZone"],
+                    role=SubnetRole.PUBLIC
+                    if "-public-" in self._get_tag(subnet, "Name")
+                    else SubnetRole.PRIVATE,
+                    subnet_id=subnet["SubnetId"],
+                    vpc_id=subnet["VpcId"],
+                )
+                for page in paginator.paginate(
+                    Filters=[{"Name": "tag:Name", "Values": [f"{cluster_name}-*"]}]
+                )
+                for subnet in page.get("Subnets", [])
+            )
+        )
+        logger.info(
+            "%s cluster:\nSUBNETS: %s\nVPC IDs: %s",
+            cluster_name,
+            ", ".join(
+                f"{subnet.subnet_id} ({subnet.availability_zone}, {subnet.role.value})"
+                for subnet in subnets_info.subnets
+            ),
+            subnets_info.vpc_ids,
+        )
+        # Subnets are still being created until every zone has both roles.
+        if subnets_info.complete:
+            self._subnets_cache.set(cluster_name, subnets_info)
+        return subnets_info
+
+    def _describe_worker_security_groups(
+        self, cluster_names: tuple[str, ...]
+    ) -> list[SecurityGroupTypeDef]:
+        paginator = self._ec2_client.get_paginator("describe_security_groups")
+        return [
+            security_group
+            for page in paginator.paginate(
                 Filters=[
                     {
                         "Name": "tag:Name",
                         "Values": [
-                            f"{cluster_name}-*-worker-sg",
+                            f"{cluster_name}-*-worker-sg"
+                            for cluster_name in cluster_names
                         ],
                     },
                 ]
             )
-        )
-        sg_group_id = describe_result["SecurityGroups"][0]["GroupId"]
+            for security_group in page.get("SecurityGroups", [])
+        ]
 
-        authorize_result: AuthorizeSecurityGroupIngressResultTypeDef = (
-            self._ec2_client.authorize_security_group_ingress(
-                GroupId=sg_group_id,
-                IpPermissions=[
-                    {
-                        "FromPort": 6800,
-                        "ToPort": 7300,
-                        "IpProtocol": "tcp",
-                        "IpRanges": [
-                            {"CidrIp": "10.0.0.0/16", "Description": "Ceph OSDs"},
-                        ],
-                    },
-                    {
-                        "FromPort": 3300,
-                        "ToPort": 3300,
-                        "IpProtocol": "tcp",
-                        "IpRanges": [
-                            {"CidrIp": "10.0.0.0/16", "Description": "Ceph MONs rule1"}
-                        ],
-                    },
-                    {
-                        "FromPort": 6789,
-                        "ToPort": 6789,
-                        "IpProtocol": "tcp",
-                        "IpRanges": [
-                            {"CidrIp": "10.0.0.0/16", "Description": "Ceph MONs rule2"},
-                        ],
-                    },
-                    {
-                        "FromPort": 9283,
-                        "ToPort": 9283,
-                        "IpProtocol": "tcp",
-                        "IpRanges": [
-                            {"CidrIp": "10.0.0.0/16", "Description": "Ceph Manager"},
-                        ],
-                    },
-                    {
-                        "FromPort": 31659,
-                        "ToPort": 31659,
-                        "IpProtocol": "tcp",
-                        "IpRanges": [
-                            {"CidrIp": "10.0.0.0/16", "Description": "API Server"},
-                        ],
-                    },
-                ],
+    def _get_missing_rules(
+        self, ip_permissions: Sequence[IpPermissionTypeDef]
+    ) -> list[InboundRule]:
+        existing_rules = {
+            (
+                permission.get("IpProtocol"),
+                permission.get("FromPort"),
+                permission.get("ToPort"),
+                ip_range.get("CidrIp"),
             )
+            for permission in ip_permissions
+            for ip_range in permission.get("IpRanges", [])
+        }
+        return [
+            rule
+            for rule in self._provider_addon_inbound_rules
+            if (rule.protocol, rule.from_port, rule.to_port, rule.cidr)
+            not in existing_rules
+        ]
+
+    @staticmethod
+    def _get_instance_cluster_name(instance: InstanceTypeDef) -> str:
+        return next(
+            (
+                tag["Key"].removeprefix(CLUSTER_TAG_PREFIX).rsplit("-", 1)[0]
+                for tag in instance.get("Tags", [])
+                if tag["Key"].startswith(CLUSTER_TAG_PREFIX)
+            ),
+            "",
         )
-        if not authorize_result["Return"]:
-            logger.error(authorize_result)
-            raise RuntimeError("EC2: error while adding inbound rules.")
 
-    def get_subnets_info(self, cluster_name: str) -> ClusterSubnetsInfo:
-        result: DescribeSubnetsResultTypeDef = self._ec2_client.describe_subnets(
-            Filters=[
-                {"Name": "tag:Name", "Values": [f"{cluster_name}-*"]},
-            ]
+    @staticmethod
+    def _get_tag(resource: Union[SecurityGroupTypeDef, SubnetTypeDef], key: str) -> str:
+        return next(
+            (tag["Value"] for tag in resource.get("Tags", []) if tag["Key"] == key),
+            "",
         )
-        subnet_ids = []
-        availability_zones = []
-        if "Subnets" in result:
-            for subnet in result["Subnets"]:
-                subnet_ids.append(subnet["SubnetId"])
-                availability_zones.append(subnet["AvailabilityZone"])
-        subnet_ids = list(set(subnet_ids))
-        availability_zones = list(set(availability_zones))
-        logger.info(
-            "%s cluster:\nSUBNET IDs: %s\nAVAILABILITY ZONES: %s",
-            cluster_name,
-            subnet_ids,
-            availability_zones,
+
+
+class AsyncAWSService:
+    _aws_service: AWSService
+
+    def __init__(self, aws_service: Optional[AWSService] = None) -> None:
+        # boto3 has no asyncio support: its blocking calls run in worker threads.
+        self._aws_service = aws_service or AWSService()
+
+    @timed()
+    async def add_provider_addon_inbound_rules(self, *cluster_names: str) -> int:
+        return await asyncio.to_thread(
+            self._aws_service.add_provider_addon_inbound_rules, *cluster_names
         )
-        return ClusterSubnetsInfo(
-            subnet_ids=subnet_ids,
-            availability_zones=availability_zones,
+
+    @timed()
+    async def wait_for_subnets_info(
+        self, cluster_name: str, timeout: int = 1800
+    ) -> ClusterSubnetsInfo:
+        subnets_info = ClusterSubnetsInfo(subnets=())
+
+        async def subnets_created() -> bool:
+            nonlocal subnets_info
+            subnets_info = await asyncio.to_thread(
+                self._aws_service.get_subnets_info, cluster_name
+            )
+            return subnets_info.complete
+
+        await async_poll_until(
+            subnets_created, timeout, Backoff(initial=15, maximum=60)
         )
+        return subnets_info
+
+
+@lru_cache(maxsize=1)
+def _get_ec2_client() -> EC2Client:
+    import boto3
+    from botocore.config import Config
+
+    # A single client (thread-safe) shares the connection pool and the adaptive
+    # retry rate limiter across every AWSService instance.
+    return boto3.session.Session(
+        aws_access_key_id=env("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=env("AWS_SECRET_ACCESS_KEY"),
+        region_name=env("AWS_REGION"),
+    ).client("ec2", config=Config(retries={"max_attempts": 10, "mode": "adaptive"}))
@@ -1,57 +1,129 @@
-import dbm
-import json
 import logging
 import os
 import random
 import string
+import threading
+import time
+import uuid
+from collections.abc import Collection, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
 from enum import Enum
-from shutil import copy
-from subprocess import CalledProcessError
-from typing import Any, Optional, Union
+from functools import lru_cache
+from itertools import count
+from typing import Any, Callable, Optional, TypeVar, Union
 
-from src.platform.kube import CustomObjectRequest, KubeClient, NotFoundError
+from src.platform.kube import (
+    CustomObjectRequest,
+    KubeClient,
+    KubeResponse,
+    NotFoundError,
+    UnauthorizedError,
+)
+from src.platform.ocm import OcmBackend, OcmCli, OcmClient, OcmError, OcmRecorder
+from src.service.aws import ClusterSubnetsInfo
+from src.service.ledger import ClusterLedger, ClusterRecord, ClusterRole, ClusterUpdate
+from src.service.spec import (
+    CLUSTER_NAME_MAX_LENGTH,
+    AddonSpec,
+    AwsCredentials,
+    ClusterSpec,
+    ClusterTemplate,
+)
+from src.service.ticket import OnboardingTicketGenerator
+from src.util.cache import TTLCache
+from src.util.logs import set_run_id, with_cluster_id
+from src.util.metrics import timed
 from src.util.util import (
+    copy_file,
     download_file,
     env,
-    get_file_content,
-    run_cmd,
+    file_lock,
+    format_table,
     save_to_file,
     save_to_json_file,
-    wait_for,
+)
+from src.util.wait import (
+    SYSTEM_CLOCK,
+    Backoff,
+    Clock,
+    Deadline,
+    WatchError,
+    poll_until,
+    watch_until,
 )
 
 logger = logging.getLogger()
 
+T = TypeVar("T")
+
+ADDON_CSV_REQUEST = CustomObjectRequest(
+    group="operators.coreos.com",
+    version="v1alpha1",
+    plural="clusterserviceversions",
+    label_selector="operators.coreos.com/ocs-osd-deployer.openshift-storage",
+)
+CLUSTERS_API_PATH = "/api/clusters_mgmt/v1/clusters"
+STORAGE_CLUSTER_REQUEST = CustomObjectRequest(
+    group="ocs.openshift.io",
+    name="ocs-storagecluster",
+    plural="storageclusters",
+)
+
 
 class AddonId(Enum):
     CONSUMER = "ocs-consumer-dev"
     PROVIDER = "ocs-provider-dev"
 
 
-class ClusterService:
-    _api_base_url = "/api/clusters_mgmt/v1/clusters"
-    _bin_dir: str = os.path.abspath(os.path.expanduser("~/bin"))
-    _data_dir: str
-    _cluster_install_data: dict[str, Any] = {
-        "aws": {
-            "access_key_id": env("AWS_ACCESS_KEY_ID"),
-            "account_id": env("AWS_ACCOUNT_ID"),
-            "secret_access_key": env("AWS_SECRET_ACCESS_KEY"),
-            "subnet_ids": [],
-        },
-        "ccs": {"enabled": True},
-        "cloud_provider": {"id": "aws"},
-        "name": "",
-        "nodes": {
-            "compute": 3,
-            "compute_machine_type": {"id": "m5.2xlarge"},
-        },
-        "region": {"id": env("AWS_REGION")},
-    }
-    _cluster_store: str
-    _kube_client_instances: dict[str, KubeClient] = {}
-    _ocm_config_file: str
-    _ocm_config_template: dict[str, Union[str, list[str]]] = {
+@dataclass(frozen=True)
+class ClusterInfo:
+    cluster_id: str
+    name: str
+    state: str
+    created_at: float
+
+
+@dataclass(frozen=True)
+class ClusterStatus:
+    cluster_id: str
+    name: str
+    state: str
+    nodes_ready: Optional[bool] = None
+    addon_phase: Optional[str] = None
+
+
+@dataclass
+class UninstallReport:
+    uninstalled: list[str] = field(default_factory=list)
+    not_found: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+
+
+def format_cluster_statuses(statuses: list[ClusterStatus]) -> str:
+    rows = [("ID", "NAME", "STATE", "NODES READY", "ADDON PHASE")] + [
+        (
+            status.cluster_id,
+            status.name,
+            status.state,
+            "-" if status.nodes_ready is None else str(status.nodes_ready),
+            status.addon_phase or "-",
+        )
+        for status in statuses
+    ]
+    return format_table(rows)
+
+
+def get_csvs_phase(csvs: dict[str, KubeResponse]) -> str:
+    phase = "Not Found"
+    for csv in csvs.values():
+        phase = csv.status.phase
+    return phase
+
+
+def get_ocm_config() -> dict[str, Union[str, list[str]]]:
+    return {
         "client_id": "cloud-services",
         "refresh_token": env("OCM_REFRESH_TOKEN"),
         "scopes": ["openid"],
@@ -59,31 +131,145 @@ class ClusterService:
         "redhat-external/protocol/openid-connect/token",
         "url": "https://api.stage.openshift.com",
     }
-    _onboarding_ticket_generator_file: str
-    _onboarding_private_key: str = env("ONBOARDING_PRIVATE_KEY_FILE")
 
-    def __init__(self, data_dir: str = ".cluster") -> None:
-        os.makedirs(self._bin_dir, exist_ok=True)
 
-        self._install_ocm()
+class ClusterService:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
+    _bin_dir: str = os.path.abspath(os.path.expanduser("~/bin"))
+    _data_dir: str
+    _clock: Clock
+    _cluster_template: Optional[ClusterTemplate] = None
+    _cluster_state_backoff = Backoff(initial=15, maximum=120)
+    _kube_clients: TTLCache[str, KubeClient]
+    _ledger: ClusterLedger
+    _ocm_backend: Optional[OcmBackend]
+    _ocm_lock: threading.Lock
+    _ocm_page_size = 100
+    _run_id: str
+    _snapshot_max_workers = 16
 
+    def __init__(
+        self,
+        data_dir: str = ".cluster",
+        run_id: Optional[str] = None,
+        ocm_backend: Optional[OcmBackend] = None,
+        clock: Clock = SYSTEM_CLOCK,
+    ) -> None:
+        self._clock = clock
         self._data_dir = data_dir
         os.makedirs(os.path.abspath(self._data_dir), exist_ok=True)
-        self._cluster_store = f"{self._data_dir}/cluster_store.db"
+        self._ledger = ClusterLedger(f"{self._data_dir}/cluster_ledger.db")
+        self._ledger.import_dbm(
+            f"{self._data_dir}/cluster_store.db",
+            lambda cluster_id, cluster_name: ClusterRecord(
+                cluster_id=cluster_id,
+                name=cluster_name.decode("utf-8"),
+                role=ClusterRole.UNKNOWN.value,
+            ),
+        )
+        self._run_id = run_id or env("RUN_ID", default="") or uuid.uuid4().hex
+        set_run_id(self._run_id)
+        self._kube_clients = TTLCache(
+            maxsize=16,
+            ttl=env.int("KUBE_CLIENT_TTL", default=3600),
+            on_evict=KubeClient.close,
+        )
+        self._ocm_backend = ocm_backend
+        self._ocm_lock = threading.Lock()
 
-        self._set_ocm_config()
-        self._save_onboarding_ticket_required_files()
+    @property
+    def cluster_template(self) -> ClusterTemplate:
+        # Read from the environment and validated once per service.
+        if self._cluster_template is None:
+            self._cluster_template = ClusterTemplate.from_env()
+        return self._cluster_template
 
-    def get_addon_ocs_provider_storage_endpoint(self, cluster_id: str) -> str:
-        kube_client = self._get_kube_client(cluster_id)
-        request = CustomObjectRequest(
-            group="ocs.openshift.io",
-            name="ocs-storagecluster",
-            plural="storageclusters",
+    @property
+    def data_dir(self) -> str:
+        return self._data_dir
+
+    @property
+    def ocm_backend(self) -> OcmBackend:
+        return self._ocm
+
+    @property
+    def run_id(self) -> str:
+        return self._run_id
+
+    @property
+    def _ocm(self) -> OcmBackend:
+        # The OCM backend (and the ocm binary for the CLI one) is set up on first use.
+        with self._ocm_lock:
+            if self._ocm_backend is None:
+                self._ocm_backend = self._create_ocm_backend()
+            return self._ocm_backend
+
+    def cluster_exists(self, cluster_id: str) -> bool:
+        return self.snapshot([cluster_id], include_kube=False)[0].state not in {
+            "error",
+            "not found",
+            "uninstalling",
+        }
+
+    @staticmethod
+    def consumer_addon_spec(
+        storage_provider_endpoint: str, onboarding_ticket: str
+    ) -> AddonSpec:
+        return AddonSpec.create(
+            AddonId.CONSUMER.value,
+            {
+                "storage-provider-endpoint": storage_provider_endpoint,
+                "onboarding-ticket": onboarding_ticket,
+            },
         )
+
+    @timed()
+    def expire_kubeconfig(self, cluster_id: str) -> None:
+        config_file = self._get_cluster_config_file_path(cluster_id)
+        with file_lock(config_file):
+            if os.path.exists(config_file):
+                # Expire the shared kubeconfig so the next access fetches it again.
+                os.utime(config_file, (0, 0))
+
+    @timed()
+    def find_clusters(self, name_prefixes: Collection[str]) -> list[ClusterInfo]:
+        # Finds clusters in OCM, whether this workspace recorded them or not.
+        return [
+            ClusterInfo(
+                cluster_id=cluster_id,
+                name=cluster_info["name"],
+                state=cluster_info["status"]["state"],
+                created_at=datetime.strptime(
+                    cluster_info["creation_timestamp"][:19], "%Y-%m-%dT%H:%M:%S"
+                )
+                .replace(tzinfo=timezone.utc)
+                .timestamp(),
+            )
+            for cluster_id, cluster_info in self._search_clusters(
+                " or ".join(
+                    f"name like '{prefix}%'" for prefix in sorted(name_prefixes)
+                )
+            ).items()
+        ]
+
+    @timed()
+    @with_cluster_id
+    def delete_storage_pods(self, cluster_id: str, label_selector: str) -> int:
+        deleted_pods = self._call_kube(
+            cluster_id,
+            lambda kube_client: kube_client.delete_pods(
+                STORAGE_CLUSTER_REQUEST.namespace, label_selector
+            ),
+        )
+        logger.info("Deleted %d storage pods (%s).", deleted_pods, label_selector)
+        return deleted_pods
+
+    @timed()
+    @with_cluster_id
+    def get_addon_ocs_provider_storage_endpoint(self, cluster_id: str) -> str:
         try:
-            storage_provider_endpoint = kube_client.get_object(
-                request
+            storage_provider_endpoint = self._call_kube(
+                cluster_id,
+                lambda kube_client: kube_client.get_object(STORAGE_CLUSTER_REQUEST),
             ).status.storage_provider_endpoint
         except NotFoundError:
             logger.exception(
@@ -94,176 +280,381 @@ class ClusterService:
         logger.info("Storage Provider Endpoint: %s", storage_provider_endpoint)
         return storage_provider_endpoint
 
-    def get_consumer_onboarding_ticket(self) -> str:
-        response = run_cmd(
-            [self._onboarding_ticket_generator_file, self._onboarding_private_key]
+    @staticmethod
+    @timed()
+    def get_consumer_onboarding_ticket() -> str:
+        onboarding_ticket = _get_ticket_generator(
+            env("ONBOARDING_PRIVATE_KEY_FILE")
+        ).generate()
+        logger.info("Consumer onboarding ticket generated.")
+        return onboarding_ticket
+
+    @staticmethod
+    def get_consumer_onboarding_tickets(number: int) -> list[str]:
+        return _get_ticket_generator(env("ONBOARDING_PRIVATE_KEY_FILE")).generate_batch(
+            number
         )
-        logger.info("Consumer Onboarding Ticket:\n%s", response.stdout)
-        return response.stdout
+
+    def get_nodes_ready(self, cluster_id: str) -> bool:
+        statuses = self._call_kube(
+            cluster_id, lambda kube_client: kube_client.list_nodes_statuses()
+        )
+        return bool(statuses) and all(statuses)
+
+    def get_storage_cluster_phase(self, cluster_id: str) -> str:
+        try:
+            return self._call_kube(
+                cluster_id,
+                lambda kube_client: kube_client.get_object(STORAGE_CLUSTER_REQUEST),
+            ).status.phase
+        except NotFoundError:
+            return "Not Found"
 
     def install(
         self,
         cluster_name: str,
-        subnets_ids: Optional[list[str]] = None,
-        availability_zones: Optional[list[str]] = None,
+        role: ClusterRole,
+        subnets_info: Optional[ClusterSubnetsInfo] = None,
+        track: bool = True,
     ) -> str:
-        request_body = self._cluster_install_data.copy()
-        request_body["name"] = cluster_name
-        if subnets_ids:
-            request_body["aws"]["subnet_ids"] = subnets_ids
-        elif env.list("AWS_SUBNET_IDS", default=[]):
-            request_body["aws"]["subnet_ids"] = env.list("AWS_SUBNET_IDS")
-        if availability_zones:
-            request_body["nodes"]["availability_zones"] = availability_zones
-        elif env.list("AWS_AVAILABILITY_ZONES", default=[]):
-            request_body["nodes"]["availability_zones"] = env.list(
-                "AWS_AVAILABILITY_ZONES"
-            )
-        # Save request body to a file in order to avoid passing secrets as CLI args.
-        body_file = save_to_json_file(
-            f"{self._data_dir}/install-cluster-{cluster_name}.json", request_body
+        return self.install_spec(
+            self.cluster_template.with_subnets(subnets_info).create_spec(cluster_name),
+            role,
+            track,
         )
 
-        result = run_cmd(["ocm", "post", self._api_base_url, "--body", body_file])
-        if not result.stdout:
+    @timed()
+    @with_cluster_id
+    def install_addon(self, cluster_id: str, spec: AddonSpec) -> None:
+        addon_info = self._ocm.post(
+            f"{CLUSTERS_API_PATH}/{cluster_id}/addons", spec.to_request_body()
+        )
+        if not addon_info:
+            raise ValueError("No addon info received.")
+
+    @timed()
+    def install_batch(
+        self,
+        specs: Collection[ClusterSpec],
+        role: ClusterRole,
+        track: bool = True,
+        max_workers: int = 8,
+        *,
+        on_installed: Optional[Callable[[str, str], None]] = None,
+    ) -> dict[str, str]:
+        # Specs are prepared and validated up front: a bad template fails the batch
+        # before any cluster is created. Failed installs are left out of the result.
+        def install(spec: ClusterSpec) -> str:
+            cluster_id = self.install_spec(spec, role, track)
+            # Untracked clusters are recorded by the caller as soon as they exist.
+            if on_installed:
+                on_installed(spec.name, cluster_id)
+            return cluster_id
+
+        cluster_ids = {}
+        with ThreadPoolExecutor(
+            max_workers=max(min(max_workers, len(specs)), 1),
+            thread_name_prefix="install",
+        ) as executor:
+            futures = {executor.submit(install, spec): spec for spec in specs}
+            for future in as_completed(futures):
+                spec = futures[future]
+                if (error := future.exception()) is not None:
+                    logger.error("Unable to install cluster %s: %s", spec.name, error)
+                else:
+                    cluster_ids[spec.name] = future.result()
+        return cluster_ids
+
+    @timed()
+    def install_spec(
+        self, spec: ClusterSpec, role: ClusterRole, track: bool = True
+    ) -> str:
+        # The body is built for this request only: specs share no mutable state.
+        request_body = spec.to_request_body(AwsCredentials.from_env())
+        if not (cluster_info := self._ocm.post(CLUSTERS_API_PATH, request_body)):
             raise ValueError("No cluster info received.")
-        cluster_id = json.loads(result.stdout)["id"]
-        with dbm.open(self._cluster_store, "c") as cluster_store:
-            cluster_store[cluster_id] = cluster_name
+        cluster_id: str = cluster_info["id"]
+        # Untracked clusters (e.g. pooled ones) are left out of the run ledger.
+        if track:
+            self._ledger.add(
+                ClusterRecord(
+                    cluster_id=cluster_id,
+                    name=spec.name,
+                    role=role.value,
+                    run_id=self._run_id,
+                    state=cluster_info.get("status", {}).get("state", ""),
+                )
+            )
         return cluster_id
 
-    def install_addon(
-        self, cluster_id: str, addon_id: str, addon_params: dict[str, Any]
-    ) -> None:
-        body_file = self._get_addon_install_request_file_path(addon_id, addon_params)
-        addon_info = run_cmd(
-            # fmt: off
-            ["ocm", "post", f"{self._api_base_url}/{cluster_id}/addons",
-             "--body", body_file]
-            # fmt: on
+    @staticmethod
+    def provider_addon_spec() -> AddonSpec:
+        return AddonSpec.create(
+            AddonId.PROVIDER.value,
+            {
+                "size": "20",
+                "onboarding-validation-key": env("ONBOARDING_PUBLIC_KEY"),
+            },
         )
-        if not addon_info.stdout:
-            raise ValueError("No addon info received.")
 
     @staticmethod
     def random_cluster_name(prefix: str = "ci") -> str:
         prefix = f"{prefix}-"
-        cluster_name_max_length = 15
-        if len(prefix) >= cluster_name_max_length:
+        if len(prefix) >= CLUSTER_NAME_MAX_LENGTH:
             raise ValueError(
-                "Cluster name cannot exceed max. length: " f"{cluster_name_max_length}"
+                f"Cluster name cannot exceed max. length: {CLUSTER_NAME_MAX_LENGTH}"
             )
         random_suffix_length = len(prefix)
         return "".join(
             [prefix]
             + [
                 random.choice(string.ascii_lowercase + string.digits)
-                for _ in range(cluster_name_max_length - random_suffix_length)
+                for _ in range(CLUSTER_NAME_MAX_LENGTH - random_suffix_length)
             ]
         )
 
-    def share_kubeconfig_file(self, cluster_id: str, target_file: str) -> None:
-        config_file = self._save_cluster_config_file(cluster_id)
-        copy(src=config_file, dst=f"./{self._data_dir}/{target_file}")
-
-    def uninstall_all_clusters(self) -> None:
-        with dbm.open(self._cluster_store, "c") as cluster_store:
-            for cluster_id in cluster_store.keys():
-                if isinstance(cluster_id, bytes):
-                    cluster_id = cluster_id.decode("utf-8")
-                    cluster_name = cluster_store[cluster_id].decode("utf-8")
-                try:
-                    run_cmd(["ocm", "delete", "cluster", cluster_id])
-                except CalledProcessError as error:
-                    error_info = json.loads(error.stderr)
-                    if error_info["id"] == "404":
-                        logger.info("Cluster %s not found.", cluster_name)
-                        continue
-                    raise
-                finally:
-                    del cluster_store[cluster_id]
-                logger.info("Cluster %s is being uninstalled.", cluster_name)
-
-    @wait_for()
-    def wait_for_addon_ready(self, cluster_id: str, addon_id: AddonId) -> bool:
-        if (addon_status := self._get_addon_ocs_status(cluster_id)) == "Succeeded":
-            logger.info("Addon %s is ready.", addon_id.value)
-            return True
-        # @TODO: uncomment this check when the issue below is fixed:
-        # https://bugzilla.redhat.com/show_bug.cgi?id=2076207
-        # if addon_status == "Failed":
-        #     raise ValueError(f"Addon {addon_id.value} is in Failed state.")
-        logger.info(
-            "Addon %s is not ready yet... Current status: %s",
-            addon_id.value,
-            addon_status,
-        )
-        return False
-
-    @wait_for()
-    def wait_for_cluster_ready(self, cluster_id: str) -> bool:
-        cluster_info = self._get_cluster_info(cluster_id)
-        cluster_name = cluster_info["name"]
-        cluster_status = cluster_info["status"]["state"]
-        if cluster_status == "ready" and False not in self._get_cluster_nodes_statuses(
-            cluster_id
-        ):
-            logger.info("Cluster %s is ready.", cluster_name)
-            return True
-        if cluster_status == "error":
-            raise ValueError(f"Cluster {cluster_name} is in error state.")
-        logger.info("Cluster %s is not ready yet...", cluster_name)
-        return False
-
-    def _get_addon_install_request_file_path(
-        self, addon_id: str, params: dict[str, Any]
-    ) -> str:
-        addon_install_data: dict[str, Any] = {
-            "addon": {"id": ""},
-            "parameters": {"items": []},
+    def record_state(self, cluster_id: str, update: ClusterUpdate) -> None:
+        self._ledger.transition(cluster_id, update)
+
+    @timed()
+    @with_cluster_id
+    def save_kubeconfig_file(self, cluster_id: str) -> str:
+        # The kubeconfig is shared on disk by concurrent processes:
+        # only one of them fetches it from OCM when it is missing or expired.
+        config_file = self._get_cluster_config_file_path(cluster_id)
+        with file_lock(config_file):
+            if not os.path.exists(config_file) or time.time() - os.path.getmtime(
+                config_file
+            ) > env.int("KUBECONFIG_TTL", default=6 * 3600):
+                cluster_config: str = self._ocm.get(
+                    f"{CLUSTERS_API_PATH}/{cluster_id}/credentials"
+                )["kubeconfig"]
+                save_to_file(config_file, cluster_config)
+        return config_file
+
+    @timed()
+    def share_kubeconfig_file(self, cluster_id: str, target_file: str) -> str:
+        config_file = self.save_kubeconfig_file(cluster_id)
+        target_path = os.path.join(self._data_dir, target_file)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        return copy_file(src=config_file, dst=target_path)
+
+    def list_stored_clusters(
+        self,
+        run_id: Optional[str] = None,
+        created_before: Optional[float] = None,
+        role: Optional[ClusterRole] = None,
+    ) -> dict[str, str]:
+        return {
+            record.cluster_id: record.name
+            for record in self._ledger.find(
+                run_id=run_id, created_before=created_before
+            )
+            if role is None or record.role == role.value
         }
-        addon_install_data["addon"]["id"] = addon_id
-        for param_id, param_value in params.items():
-            addon_install_data["parameters"]["items"].append(
-                {"id": param_id, "value": param_value}
+
+    @timed()
+    def snapshot(
+        self, cluster_ids: list[str], include_kube: bool = True
+    ) -> list[ClusterStatus]:
+        # One paginated OCM query for all clusters, then concurrent kube queries.
+        clusters_info = self._list_clusters_info(cluster_ids)
+        statuses = {
+            cluster_id: ClusterStatus(
+                cluster_id=cluster_id,
+                name=clusters_info[cluster_id]["name"],
+                state=clusters_info[cluster_id]["status"]["state"],
             )
-        return save_to_json_file(
-            f"{self._data_dir}/install-addon-{addon_id}.json", addon_install_data
+            if cluster_id in clusters_info
+            else ClusterStatus(cluster_id=cluster_id, name="", state="not found")
+            for cluster_id in cluster_ids
+        }
+        ready_cluster_ids = [
+            cluster_id
+            for cluster_id, status in statuses.items()
+            if status.state == "ready"
+        ]
+        if not include_kube or not ready_cluster_ids:
+            return list(statuses.values())
+        with ThreadPoolExecutor(
+            max_workers=min(self._snapshot_max_workers, 2 * len(ready_cluster_ids)),
+            thread_name_prefix="snapshot",
+        ) as executor:
+            nodes_ready = {
+                cluster_id: executor.submit(self.get_nodes_ready, cluster_id)
+                for cluster_id in ready_cluster_ids
+            }
+            addon_phases = {
+                cluster_id: executor.submit(self._get_addon_phase, cluster_id)
+                for cluster_id in ready_cluster_ids
+            }
+        for cluster_id in ready_cluster_ids:
+            statuses[cluster_id] = replace(
+                statuses[cluster_id],
+                nodes_ready=None
+                if nodes_ready[cluster_id].exception()
+                else nodes_ready[cluster_id].result(),
+                addon_phase=None
+                if addon_phases[cluster_id].exception()
+                else addon_phases[cluster_id].result(),
+            )
+        return list(statuses.values())
+
+    @timed()
+    @with_cluster_id
+    def uninstall(self, cluster_id: str, cluster_name: str) -> bool:
+        # Transient errors are retried by the OCM backend, per its DELETE policy.
+        if found := self._delete_cluster(cluster_id):
+            logger.info("Cluster %s is being uninstalled.", cluster_name)
+        else:
+            logger.info("Cluster %s not found.", cluster_name)
+        return found
+
+    @timed()
+    def uninstall_all_clusters(self, max_workers: int = 8) -> UninstallReport:
+        clusters = self.list_stored_clusters()
+        report = UninstallReport()
+        if not clusters:
+            return report
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(clusters)),
+            thread_name_prefix="uninstall",
+        ) as executor:
+            futures = {
+                executor.submit(
+                    self._uninstall_stored_cluster, cluster_id, cluster_name
+                ): cluster_name
+                for cluster_id, cluster_name in clusters.items()
+            }
+            for future in as_completed(futures):
+                cluster_name = futures[future]
+                if (error := future.exception()) is not None:
+                    logger.error("Cluster %s uninstall failed: %s", cluster_name, error)
+                    report.failed[cluster_name] = str(error)
+                elif future.result():
+                    report.uninstalled.append(cluster_name)
+                else:
+                    report.not_found.append(cluster_name)
+        logger.info(
+            "Uninstall summary: %d uninstalling, %d not found, %d failed.",
+            len(report.uninstalled),
+            len(report.not_found),
+            len(report.failed),
         )
+        return report
+
+    @timed()
+    @with_cluster_id
+    def wait_for_addon_ready(
+        self, cluster_id: str, addon_id: AddonId, timeout: int = 5400
+    ) -> None:
+        def addon_ready(timeout_seconds: int) -> Iterator[bool]:
+            addon_status = "Not Found"
+            for csvs in self._watch_kube(
+                cluster_id,
+                lambda kube_client: kube_client.watch_objects(
+                    ADDON_CSV_REQUEST, timeout_seconds
+                ),
+            ):
+                if (status := get_csvs_phase(csvs)) != addon_status:
+                    addon_status = status
+                    logger.info(
+                        "Addon %s current status: %s",
+                        addon_id.value,
+                        addon_status,
+                    )
+                # @TODO: raise an error on "Failed" status when the issue below is fixed:
+                # https://bugzilla.redhat.com/show_bug.cgi?id=2076207
+                yield addon_status == "Succeeded"
 
-    def _get_addon_ocs_status(self, cluster_id: str) -> str:
-        kube_client = self._get_kube_client(cluster_id)
-        request = CustomObjectRequest(
-            group="operators.coreos.com",
-            version="v1alpha1",
-            plural="clusterserviceversions",
-            label_selector="operators.coreos.com/ocs-osd-deployer.openshift-storage",
+        watch_until(addon_ready, timeout, clock=self._clock)
+        self.record_state(cluster_id, ClusterUpdate(addon_state="Succeeded"))
+        logger.info("Addon %s is ready.", addon_id.value)
+
+    @timed()
+    @with_cluster_id
+    def wait_for_cluster_ready(self, cluster_id: str, timeout: int = 5400) -> None:
+        # OCM has no watch API: poll the cluster state with backoff, then watch nodes.
+        deadline = Deadline(timeout, self._clock)
+        cluster_name = ""
+
+        def cluster_state_ready() -> bool:
+            nonlocal cluster_name
+            cluster_status = self.snapshot([cluster_id], include_kube=False)[0]
+            cluster_name = cluster_status.name
+            if cluster_status.state in {"error", "not found"}:
+                if cluster_status.state == "error":
+                    self.record_state(cluster_id, ClusterUpdate(state="error"))
+                raise ValueError(
+                    f"Cluster {cluster_name or cluster_id} is in "
+                    f"{cluster_status.state} state."
+                )
+            logger.info("Cluster %s state: %s", cluster_name, cluster_status.state)
+            return cluster_status.state == "ready"
+
+        poll_until(
+            cluster_state_ready, timeout, self._cluster_state_backoff, self._clock
         )
-        status = "Not Found"
+        self.record_state(cluster_id, ClusterUpdate(state="ready"))
+
+        def nodes_ready(timeout_seconds: int) -> Iterator[bool]:
+            for statuses in self._watch_kube(
+                cluster_id,
+                lambda kube_client: kube_client.watch_nodes_statuses(timeout_seconds),
+            ):
+                yield bool(statuses) and all(statuses.values())
+
+        watch_until(nodes_ready, max(1, deadline.remaining), clock=self._clock)
+        logger.info("Cluster %s is ready.", cluster_name)
+
+    def _call_kube(self, cluster_id: str, func: Callable[[KubeClient], T]) -> T:
         try:
-            response = kube_client.list_objects(request)
-        except NotFoundError:
-            return status
-        if len(response.items) > 0:
-            status = response.items[0].status.phase
-        logger.debug("Addon status: %s", status)
-        return status
-
-    def _get_cluster_info(self, cluster_id: str) -> dict[str, Any]:
-        completed_process = run_cmd(
-            ["ocm", "get", f"{self._api_base_url}/{cluster_id}"]
-        )
-        return json.loads(completed_process.stdout)
+            return func(self._get_kube_client(cluster_id))
+        except UnauthorizedError:
+            self._invalidate_kube_client(cluster_id)
+        return func(self._get_kube_client(cluster_id))
+
+    def _create_ocm_backend(self) -> OcmBackend:
+        backend: OcmBackend
+        if env("OCM_BACKEND", default="api") == "cli":
+            os.makedirs(self._bin_dir, exist_ok=True)
+            self._install_ocm()
+            self._set_ocm_config()
+            backend = OcmCli(self._clock)
+        else:
+            backend = OcmClient.from_config(get_ocm_config(), self._clock)
+        # Live OCM responses can be recorded to seed offline replays.
+        if cassette_file := env("OCM_CASSETTE", default=""):
+            return OcmRecorder(backend, cassette_file)
+        return backend
+
+    def _delete_cluster(self, cluster_id: str) -> bool:
+        try:
+            self._ocm.delete(f"{CLUSTERS_API_PATH}/{cluster_id}")
+        except OcmError as error:
+            if error.status_code == 404:
+                return False
+            raise
+        return True
 
-    def _get_cluster_nodes_statuses(self, cluster_id: str) -> list[bool]:
-        return self._get_kube_client(cluster_id).list_nodes_statuses()
+    @with_cluster_id
+    def _get_addon_phase(self, cluster_id: str) -> Optional[str]:
+        try:
+            csvs = self._call_kube(
+                cluster_id,
+                lambda kube_client: kube_client.list_objects(ADDON_CSV_REQUEST),
+            )
+        except NotFoundError:
+            return None
+        return csvs.items[0].status.phase if csvs.items else None
 
     def _get_kube_client(self, cluster_id: str) -> KubeClient:
-        if cluster_id in self._kube_client_instances:
-            return self._kube_client_instances[cluster_id]
-        cluster_config_path = self._save_cluster_config_file(cluster_id)
-        self._kube_client_instances[cluster_id] = KubeClient(cluster_config_path)
-        return self._kube_client_instances[cluster_id]
+        return self._kube_clients.get_or_create(
+            cluster_id, lambda: KubeClient(self.save_kubeconfig_file(cluster_id))
+        )
+
+    def _get_cluster_config_file_path(self, cluster_id: str) -> str:
+        return f"{self._data_dir}/{cluster_id}-config.yaml"
 
     def _install_ocm(self) -> None:
         ocm_binary = f"{self._bin_dir}/ocm"
@@ -272,38 +663,61 @@ class ClusterService:
                 "https://github.com/openshift-online/ocm-cli/releases/"
                 f"download/{env('OCM_VERSION')}/ocm-linux-amd64"
             )
-            download_file(ocm_url, ocm_binary)
+            download_file(ocm_url, ocm_binary, sha256=env("OCM_SHA256", default=None))
         # Give execution permissions.
         os.chmod(ocm_binary, 0o700)
 
-    def _save_cluster_config_file(self, cluster_id: str) -> str:
-        config_file = f"{self._data_dir}/{cluster_id}-config.yaml"
-        if not os.path.exists(config_file):
-            response = run_cmd(
-                ["ocm", "get", f"{self._api_base_url}/{cluster_id}/credentials"]
-            )
-            cluster_config: str = json.loads(response.stdout)["kubeconfig"]
-            save_to_file(config_file, cluster_config)
-            os.chmod(config_file, 0o600)
-        return config_file
+    @with_cluster_id
+    def _invalidate_kube_client(self, cluster_id: str) -> None:
+        logger.info("Refreshing rejected credentials of cluster %s.", cluster_id)
+        self._kube_clients.discard(cluster_id)
+        self.expire_kubeconfig(cluster_id)
 
-    def _save_onboarding_ticket_required_files(self) -> None:
-        self._onboarding_ticket_generator_file = f"{self._data_dir}/ticketgen.sh"
-        if not os.path.exists(self._onboarding_ticket_generator_file):
-            download_file(
-                url="https://raw.githubusercontent.com/red-hat-storage/"
-                "ocs-operator/main/hack/ticketgen/ticketgen.sh",
-                file_path=self._onboarding_ticket_generator_file,
+    def _list_clusters_info(self, cluster_ids: list[str]) -> dict[str, dict[str, Any]]:
+        if not cluster_ids:
+            return {}
+        return self._search_clusters(
+            f"id in ({', '.join(repr(cluster_id) for cluster_id in cluster_ids)})"
+        )
+
+    def _search_clusters(self, search: str) -> dict[str, dict[str, Any]]:
+        clusters_info: dict[str, dict[str, Any]] = {}
+        for page in count(1):
+            response = self._ocm.get(
+                CLUSTERS_API_PATH,
+                {"search": search, "page": str(page), "size": str(self._ocm_page_size)},
             )
-            # Extend the ticket expiration date.
-            file_content = get_file_content(self._onboarding_ticket_generator_file)
-            file_content = file_content.replace("172800", "999999999")
-            save_to_file(self._onboarding_ticket_generator_file, file_content)
-            # Give execution permissions.
-            os.chmod(self._onboarding_ticket_generator_file, 0o700)
+            for cluster_info in response.get("items", []):
+                clusters_info[cluster_info["id"]] = cluster_info
+            if not response.get("items") or len(clusters_info) >= response.get(
+                "total", 0
+            ):
+                break
+        return clusters_info
 
     def _set_ocm_config(self) -> None:
-        self._ocm_config_file = f"{self._data_dir}/ocm.json"
-        if not os.path.exists(self._ocm_config_file):
-            save_to_json_file(self._ocm_config_file, self._ocm_config_template)
-        os.environ["OCM_CONFIG"] = self._ocm_config_file
+        ocm_config_file = f"{self._data_dir}/ocm.json"
+        if not os.path.exists(ocm_config_file):
+            save_to_json_file(ocm_config_file, get_ocm_config())
+        os.environ["OCM_CONFIG"] = ocm_config_file
+
+    def _uninstall_stored_cluster(self, cluster_id: str, cluster_name: str) -> bool:
+        self._ledger.transition(cluster_id, ClusterUpdate(state="uninstalling"))
+        found = self.uninstall(cluster_id, cluster_name)
+        self._ledger.remove(cluster_id)
+        return found
+
+    def _watch_kube(
+        self, cluster_id: str, watch: Callable[[KubeClient], Iterator[T]]
+    ) -> Iterator[T]:
+        try:
+            yield from watch(self._get_kube_client(cluster_id))
+        except UnauthorizedError as error:
+            self._invalidate_kube_client(cluster_id)
+            raise WatchError("Kubernetes credentials were rejected.") from error
+
+
+@lru_cache(maxsize=1)
+def _get_ticket_generator(private_key_file: str) -> OnboardingTicketGenerator:
+    # The private key is loaded once and kept in memory for every ticket.
+    return OnboardingTicketGenerator(private_key_file)
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from src.service.async_cluster import AsyncClusterService
+from src.service.aws import AsyncAWSService
+from src.service.cluster import AddonId, ClusterService
+from src.service.ledger import ClusterRole
+from src.service.spec import AddonSpec, ClusterTemplate
+from src.util.aio import gather_or_cancel
+
+logger = logging.getLogger()
+
+
+class ProviderError(Exception):
+    pass
+
+
+@dataclass
+class ClusterTiming:
+    name: str
+    role: str
+    provider: str = ""
+    cluster_id: str = ""
+    error: str = ""
+    ready_seconds: float = 0.0
+    stages: dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(time.monotonic() - start, 3)
+
+
+@dataclass(frozen=True)
+class FleetSpec:
+    # Prepared and validated once per fleet: every cluster is installed from it.
+    cluster_template: ClusterTemplate
+    provider_addon: AddonSpec
+
+
+class Fleet:
+    _aws_service: AsyncAWSService
+    _cluster_service: AsyncClusterService
+    _concurrency: int
+    _consumer_slots: asyncio.Semaphore
+    _kubeconfig_dir = "fleet"
+    _spec: FleetSpec
+    _start: float = 0.0
+    _timings: list[ClusterTiming]
+
+    def __init__(
+        self,
+        cluster_service: AsyncClusterService,
+        aws_service: AsyncAWSService,
+        concurrency: int = 4,
+    ) -> None:
+        self._aws_service = aws_service
+        self._cluster_service = cluster_service
+        self._concurrency = concurrency
+        self._consumer_slots = asyncio.Semaphore(concurrency)
+        self._spec = FleetSpec(
+            cluster_template=cluster_service.cluster_service.cluster_template,
+            provider_addon=ClusterService.provider_addon_spec(),
+        )
+        self._timings = []
+
+    async def install(
+        self, providers: int, consumers_per_provider: int
+    ) -> list[ClusterTiming]:
+        # Failures are recorded per cluster: only the consumers of a failed
+        # provider are given up, the rest of the fleet keeps going.
+        self._start = time.monotonic()
+        await gather_or_cancel(
+            *(self._install_group(consumers_per_provider) for _ in range(providers))
+        )
+        return self._timings
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "concurrency": self._concurrency,
+            "total_seconds": round(
+                max((timing.ready_seconds for timing in self._timings), default=0.0),
+                3,
+            ),
+            "clusters": [asdict(timing) for timing in self._timings],
+        }
+
+    def _add_timing(self, role: ClusterRole, provider: str = "") -> ClusterTiming:
+        timing = ClusterTiming(
+            name=ClusterService.random_cluster_name(
+                prefix="fleet-p" if role == ClusterRole.PROVIDER else "fleet-c"
+            ),
+            role=role.value,
+            provider=provider,
+        )
+        self._timings.append(timing)
+        return timing
+
+    def _get_kubeconfig_file(self, provider: str, name: str) -> str:
+        return f"{self._kubeconfig_dir}/{provider}/{name}-kubeconfig.yaml"
+
+    async def _install_consumer(
+        self,
+        timing: ClusterTiming,
+        consumer_template: "asyncio.Future[ClusterTemplate]",
+        endpoint: "asyncio.Future[str]",
+        onboarding_ticket: str,
+    ) -> None:
+        try:
+            await self._provision_consumer(
+                timing, consumer_template, endpoint, onboarding_ticket
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("Consumer cluster %s failed: %s", timing.name, error)
+            timing.error = str(error) or type(error).__name__
+
+    async def _install_group(self, consumers: int) -> None:
+        # The provider publishes the template of its consumers, installed in its
+        # subnets, and its storage endpoint.
+        loop = asyncio.get_running_loop()
+        consumer_template: "asyncio.Future[ClusterTemplate]" = loop.create_future()
+        endpoint: "asyncio.Future[str]" = loop.create_future()
+        provider = self._add_timing(ClusterRole.PROVIDER)
+        # Every consumer gets its own onboarding ticket, signed in a single batch.
+        onboarding_tickets = (
+            await self._cluster_service.get_consumer_onboarding_tickets(consumers)
+        )
+        await gather_or_cancel(
+            self._install_provider(provider, consumer_template, endpoint),
+            *(
+                self._install_consumer(
+                    self._add_timing(ClusterRole.CONSUMER, provider.name),
+                    consumer_template,
+                    endpoint,
+                    onboarding_ticket,
+                )
+                for onboarding_ticket in onboarding_tickets
+            ),
+        )
+
+    async def _install_provider(
+        self,
+        timing: ClusterTiming,
+        consumer_template: "asyncio.Future[ClusterTemplate]",
+        endpoint: "asyncio.Future[str]",
+    ) -> None:
+        try:
+            await self._provision_provider(timing, consumer_template, endpoint)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("Provider cluster %s failed: %s", timing.name, error)
+            timing.error = str(error) or type(error).__name__
+            futures: tuple["asyncio.Future[Any]", ...] = (consumer_template, endpoint)
+            for future in futures:
+                if not future.done():
+                    future.set_exception(
+                        ProviderError(f"Provider cluster {timing.name} failed.")
+                    )
+
+    async def _provision_consumer(
+        self,
+        timing: ClusterTiming,
+        consumer_template: "asyncio.Future[ClusterTemplate]",
+        endpoint: "asyncio.Future[str]",
+        onboarding_ticket: str,
+    ) -> None:
+        spec = (await asyncio.shield(consumer_template)).create_spec(timing.name)
+        # A slot is only held while working on the cluster: it is given back while
+        # the consumer waits for the storage endpoint of its provider.
+        async with self._consumer_slots:
+            with timing.stage("install"):
+                timing.cluster_id = await self._cluster_service.install_spec(
+                    spec, ClusterRole.CONSUMER
+                )
+            with timing.stage("cluster_ready"):
+                await self._cluster_service.wait_for_cluster_ready(timing.cluster_id)
+        with timing.stage("provider_ready"):
+            storage_provider_endpoint = await asyncio.shield(endpoint)
+        async with self._consumer_slots:
+            with timing.stage("addon_install"):
+                await self._cluster_service.install_addon(
+                    timing.cluster_id,
+                    ClusterService.consumer_addon_spec(
+                        storage_provider_endpoint, onboarding_ticket
+                    ),
+                )
+            with timing.stage("addon_ready"):
+                await self._cluster_service.wait_for_addon_ready(
+                    timing.cluster_id, AddonId.CONSUMER
+                )
+            await self._share_kubeconfig_file(timing)
+
+    async def _provision_provider(
+        self,
+        timing: ClusterTiming,
+        consumer_template: "asyncio.Future[ClusterTemplate]",
+        endpoint: "asyncio.Future[str]",
+    ) -> None:
+        with timing.stage("install"):
+            timing.cluster_id = await self._cluster_service.install_spec(
+                self._spec.cluster_template.create_spec(timing.name),
+                ClusterRole.PROVIDER,
+            )
+
+        async def publish_consumer_template() -> None:
+            consumer_template.set_result(
+                self._spec.cluster_template.with_subnets(
+                    await self._aws_service.wait_for_subnets_info(timing.name)
+                )
+            )
+
+        async def wait_for_cluster_ready() -> None:
+            with timing.stage("cluster_ready"):
+                await self._cluster_service.wait_for_cluster_ready(timing.cluster_id)
+
+        await gather_or_cancel(publish_consumer_template(), wait_for_cluster_ready())
+        with timing.stage("inbound_rules"):
+            await self._aws_service.add_provider_addon_inbound_rules(timing.name)
+        with timing.stage("addon_install"):
+            await self._cluster_service.install_addon(
+                timing.cluster_id, self._spec.provider_addon
+            )
+        with timing.stage("addon_ready"):
+            await self._cluster_service.wait_for_addon_ready(
+                timing.cluster_id, AddonId.PROVIDER
+            )
+        endpoint.set_result(
+            await self._cluster_service.get_addon_ocs_provider_storage_endpoint(
+                timing.cluster_id
+            )
+        )
+        await self._share_kubeconfig_file(timing)
+
+    async def _share_kubeconfig_file(self, timing: ClusterTiming) -> None:
+        with timing.stage("kubeconfig"):
+            kubeconfig_file = await self._cluster_service.share_kubeconfig_file(
+                timing.cluster_id,
+                self._get_kubeconfig_file(timing.provider or timing.name, timing.name),
+            )
+        timing.ready_seconds = round(time.monotonic() - self._start, 3)
+        logger.info(
+            "Fleet %s cluster %s is ready in %.1fs: %s",
+            timing.role,
+            timing.name,
+            timing.ready_seconds,
+            kubeconfig_file,
+        )
@@ -0,0 +1,252 @@
+import dbm
+import glob
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Callable, Collection, Iterator
+from contextlib import closing, contextmanager, suppress
+from dataclasses import astuple, dataclass, fields, replace
+from enum import Enum
+from typing import Optional
+
+from src.util.util import file_lock
+
+logger = logging.getLogger()
+
+
+class ClusterRole(Enum):
+    CONSUMER = "consumer"
+    PROVIDER = "provider"
+    UNKNOWN = "unknown"
+
+
+@dataclass(frozen=True)
+class ClusterRecord:  # pylint: disable=too-many-instance-attributes
+    cluster_id: str
+    name: str
+    role: str
+    run_id: str = ""
+    state: str = ""
+    addon_state: str = ""
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+
+@dataclass(frozen=True)
+class ClusterUpdate:
+    addon_state: Optional[str] = None
+    run_id: Optional[str] = None
+    state: Optional[str] = None
+
+
+class ClusterLedger:
+    _busy_timeout = 30.0
+    _db_file: str
+    _schema = """
+        CREATE TABLE IF NOT EXISTS clusters (
+            cluster_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            role TEXT NOT NULL,
+            run_id TEXT NOT NULL DEFAULT '',
+            state TEXT NOT NULL DEFAULT '',
+            addon_state TEXT NOT NULL DEFAULT '',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS clusters_addon_state ON clusters (addon_state);
+        CREATE INDEX IF NOT EXISTS clusters_created_at ON clusters (created_at);
+        CREATE INDEX IF NOT EXISTS clusters_name ON clusters (name);
+        CREATE INDEX IF NOT EXISTS clusters_role ON clusters (role);
+        CREATE INDEX IF NOT EXISTS clusters_run_id ON clusters (run_id);
+        CREATE INDEX IF NOT EXISTS clusters_state ON clusters (state, updated_at);
+    """
+
+    def __init__(self, db_file: str) -> None:
+        self._db_file = db_file
+        with self._connect() as connection:
+            # WAL lets readers proceed while another process holds the write lock.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self._schema)
+
+    def add(self, record: ClusterRecord, replace_existing: bool = True) -> bool:
+        now = time.time()
+        record = replace(
+            record,
+            created_at=record.created_at or now,
+            updated_at=record.updated_at or now,
+        )
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT OR REPLACE INTO clusters VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                if replace_existing
+                else "INSERT OR IGNORE INTO clusters VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                astuple(record),
+            )
+            return cursor.rowcount == 1
+
+    def claim(self, state: str, update: ClusterUpdate) -> Optional[ClusterRecord]:
+        # Atomically takes the least recently updated cluster in the given state.
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT * FROM clusters WHERE state = ? ORDER BY updated_at LIMIT 1",
+                (state,),
+            ).fetchone()
+            if row is None:
+                return None
+            record = self._apply(ClusterRecord(*row), update)
+            connection.execute(
+                "UPDATE clusters SET run_id = ?, state = ?, addon_state = ?, "
+                "updated_at = ? WHERE cluster_id = ?",
+                (
+                    record.run_id,
+                    record.state,
+                    record.addon_state,
+                    record.updated_at,
+                    record.cluster_id,
+                ),
+            )
+        return record
+
+    def find(
+        self,
+        run_id: Optional[str] = None,
+        states: Optional[Collection[str]] = None,
+        created_before: Optional[float] = None,
+        updated_before: Optional[float] = None,
+    ) -> list[ClusterRecord]:
+        clauses = []
+        params: list[object] = []
+        if run_id is not None:
+            clauses.append("run_id = ?")
+            params.append(run_id)
+        if states is not None:
+            clauses.append(f"state IN ({', '.join('?' for _ in states)})")
+            params.extend(states)
+        if created_before is not None:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+        if updated_before is not None:
+            clauses.append("updated_at < ?")
+            params.append(updated_before)
+        # Only constant clauses are interpolated: values are always bound.
+        query = "SELECT * FROM clusters"
+        if clauses:
+            query += f" WHERE {' AND '.join(clauses)}"
+        with self._connect() as connection:
+            return [
+                ClusterRecord(*row)
+                for row in connection.execute(f"{query} ORDER BY created_at", params)
+            ]
+
+    def import_dbm(
+        self, dbm_file: str, to_record: Callable[[str, bytes], ClusterRecord]
+    ) -> int:
+        if not dbm.whichdb(dbm_file):
+            return 0
+        # Concurrent processes starting on the same workspace import it only once.
+        with file_lock(dbm_file):
+            if not dbm.whichdb(dbm_file):
+                return 0
+            with dbm.open(dbm_file, "r") as store:
+                records = [
+                    to_record(
+                        key.decode() if isinstance(key, bytes) else key, store[key]
+                    )
+                    for key in store.keys()
+                ]
+            imported = sum(
+                self.add(record, replace_existing=False) for record in records
+            )
+            for file_path in glob.glob(f"{glob.escape(dbm_file)}*"):
+                if not file_path.endswith(".lock"):
+                    with suppress(FileNotFoundError):
+                        os.remove(file_path)
+        logger.info("Imported %d clusters from %s.", imported, dbm_file)
+        return imported
+
+    def remove(
+        self, cluster_id: str, expected: ClusterUpdate = ClusterUpdate()
+    ) -> bool:
+        with self._transaction() as connection:
+            if not self._matches(connection, cluster_id, expected):
+                return False
+            connection.execute(
+                "DELETE FROM clusters WHERE cluster_id = ?", (cluster_id,)
+            )
+        return True
+
+    def transition(
+        self,
+        cluster_id: str,
+        update: ClusterUpdate,
+        expected: ClusterUpdate = ClusterUpdate(),
+    ) -> bool:
+        # Compare-and-set: the update is only applied if the expected values match.
+        with self._transaction() as connection:
+            if not (record := self._matches(connection, cluster_id, expected)):
+                return False
+            record = self._apply(record, update)
+            connection.execute(
+                "UPDATE clusters SET run_id = ?, state = ?, addon_state = ?, "
+                "updated_at = ? WHERE cluster_id = ?",
+                (
+                    record.run_id,
+                    record.state,
+                    record.addon_state,
+                    record.updated_at,
+                    record.cluster_id,
+                ),
+            )
+        return True
+
+    @staticmethod
+    def _apply(record: ClusterRecord, update: ClusterUpdate) -> ClusterRecord:
+        return replace(
+            record,
+            updated_at=time.time(),
+            **{
+                field.name: value
+                for field in fields(update)
+                if (value := getattr(update, field.name)) is not None
+            },
+        )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        with closing(
+            sqlite3.connect(
+                self._db_file, timeout=self._busy_timeout, isolation_level=None
+            )
+        ) as connection:
+            yield connection
+
+    @staticmethod
+    def _matches(
+        connection: sqlite3.Connection, cluster_id: str, expected: ClusterUpdate
+    ) -> Optional[ClusterRecord]:
+        row = connection.execute(
+            "SELECT * FROM clusters WHERE cluster_id = ?", (cluster_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = ClusterRecord(*row)
+        for field in fields(expected):
+            if (value := getattr(expected, field.name)) is not None and getattr(
+                record, field.name
+            ) != value:
+                return None
+        return record
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock upfront, so read-then-write
+        # transitions can't interleave with other writers.
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
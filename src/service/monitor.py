@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from dataclasses import dataclass, field, replace
+from typing import BinaryIO, Optional
+
+from src.platform.kube import KubeClient, UnauthorizedError
+from src.service.cluster import (
+    ADDON_CSV_REQUEST,
+    STORAGE_CLUSTER_REQUEST,
+    get_csvs_phase,
+)
+from src.util.metrics import metrics
+from src.util.util import format_table
+from src.util.wait import Backoff, WatchError
+
+logger = logging.getLogger()
+
+SAMPLES_MAGIC = b"OCS-OSD-CI-HEALTH-1\n"
+# A JSON header (after the magic and its length) describes the fixed-size records:
+# unix time, cluster index, API up, ready and total nodes, CSV and StorageCluster
+# phase indexes.
+SAMPLE_RECORD = struct.Struct("<dBBHHBB")
+HEADER_LENGTH = struct.Struct("<I")
+PHASES = (
+    "",
+    "Other",
+    "Connected",
+    "Connecting",
+    "Deleting",
+    "Error",
+    "Failed",
+    "Ignored",
+    "InstallReady",
+    "Installing",
+    "Not Found",
+    "Pending",
+    "Progressing",
+    "Ready",
+    "Replacing",
+    "Succeeded",
+    "Unknown",
+)
+
+
+@dataclass(frozen=True)
+class HealthSample:
+    timestamp: float
+    cluster: str
+    api_up: bool = False
+    nodes_ready: int = 0
+    nodes_total: int = 0
+    csv_phase: str = ""
+    storage_cluster_phase: str = ""
+
+    @property
+    def signals(self) -> dict[str, Optional[bool]]:
+        # Phases not observed yet (e.g. no StorageCluster on a cluster) are unknown.
+        return {
+            "api": self.api_up,
+            "nodes": bool(self.nodes_total) and self.nodes_ready == self.nodes_total,
+            "addon": self.csv_phase == "Succeeded" if self.csv_phase else None,
+            "storage_cluster": self.storage_cluster_phase == "Ready"
+            if self.storage_cluster_phase
+            else None,
+        }
+
+
+@dataclass
+class SignalSummary:
+    cluster: str
+    signal: str
+    first_healthy_seconds: Optional[float] = None
+    healthy_at_end: bool = False
+    outages: int = 0
+    downtime_seconds: float = 0.0
+    recovery_seconds: list[float] = field(default_factory=list)
+
+
+class SampleWriter:
+    _file: BinaryIO
+    _clusters: dict[str, int]
+
+    def __init__(self, file_path: str, clusters: Sequence[str]) -> None:
+        self._clusters = {cluster: index for index, cluster in enumerate(clusters)}
+        # pylint: disable-next=consider-using-with
+        self._file = os.fdopen(
+            os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb"
+        )
+        header = json.dumps(
+            {
+                "clusters": list(clusters),
+                "phases": PHASES,
+                "record": SAMPLE_RECORD.format,
+            }
+        ).encode()
+        self._file.write(SAMPLES_MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def write(self, samples: Sequence[HealthSample]) -> None:
+        self._file.write(
+            b"".join(
+                SAMPLE_RECORD.pack(
+                    sample.timestamp,
+                    self._clusters[sample.cluster],
+                    sample.api_up,
+                    min(sample.nodes_ready, 0xFFFF),
+                    min(sample.nodes_total, 0xFFFF),
+                    _get_phase_index(sample.csv_phase),
+                    _get_phase_index(sample.storage_cluster_phase),
+                )
+                for sample in samples
+            )
+        )
+        # Flushed on every write so that an interrupted run keeps its samples.
+        self._file.flush()
+
+
+class ClusterWatcher:
+    # Follows the health of a cluster through watches: the API server pushes the
+    # changes, so sampling often costs the cluster nothing but a few connections.
+    _changed: threading.Event
+    _config_file: str
+    _kube_client: Optional[KubeClient] = None
+    _lock: threading.Lock
+    _name: str
+    _reconnect_backoff = Backoff(initial=1, maximum=10)
+    _sample: HealthSample
+    _stop: threading.Event
+    _watch_timeout = 300
+
+    def __init__(
+        self,
+        name: str,
+        config_file: str,
+        changed: threading.Event,
+        stop: threading.Event,
+    ) -> None:
+        self._changed = changed
+        self._config_file = config_file
+        self._lock = threading.Lock()
+        self._name = name
+        self._sample = HealthSample(timestamp=0, cluster=name)
+        self._stop = stop
+
+    def sample(self, timestamp: float) -> HealthSample:
+        with self._lock:
+            return replace(self._sample, timestamp=timestamp)
+
+    def start(self) -> None:
+        for watch_name, watch in (
+            ("nodes", self._watch_nodes),
+            ("csvs", self._watch_csvs),
+            ("storage_cluster", self._watch_storage_cluster),
+        ):
+            threading.Thread(
+                target=self._run_watch,
+                args=(watch_name, watch),
+                name=f"monitor-{self._name}-{watch_name}",
+                daemon=True,
+            ).start()
+
+    def _get_kube_client(self) -> KubeClient:
+        with self._lock:
+            if self._kube_client is None:
+                self._kube_client = KubeClient(self._config_file)
+            return self._kube_client
+
+    def _run_watch(
+        self, watch_name: str, watch: Callable[[KubeClient], Iterator[None]]
+    ) -> None:
+        reconnect_delays = self._reconnect_backoff.delays()
+        while not self._stop.is_set():  # pylint: disable=while-used
+            metrics.increment("watch_connections", f"monitor:{self._name}:{watch_name}")
+            received_events = False
+            try:  # pylint: disable=too-many-try-statements
+                for _ in watch(self._get_kube_client()):
+                    received_events = True
+                    if self._stop.is_set():
+                        return
+            except UnauthorizedError:
+                # The shared kubeconfig may have been refreshed since it was loaded.
+                logger.warning("Monitor %s: credentials rejected.", self._name)
+                with self._lock:
+                    self._kube_client = None
+            except WatchError:
+                logger.debug("Monitor %s: %s watch failed.", self._name, watch_name)
+            except Exception as error:  # pylint: disable=broad-except
+                # E.g. a kubeconfig not shared yet: keep sampling until it is.
+                logger.warning(
+                    "Monitor %s: %s watch error: %s", self._name, watch_name, error
+                )
+            if watch_name == "nodes" and not received_events:
+                self._update(api_up=False)
+            if received_events:
+                reconnect_delays = self._reconnect_backoff.delays()
+            else:
+                self._stop.wait(next(reconnect_delays))
+
+    def _update(self, **changes: object) -> None:
+        with self._lock:
+            if (sample := replace(self._sample, **changes)) == self._sample:
+                return
+            self._sample = sample
+        self._changed.set()
+
+    def _watch_csvs(self, kube_client: KubeClient) -> Iterator[None]:
+        for csvs in kube_client.watch_objects(ADDON_CSV_REQUEST, self._watch_timeout):
+            self._update(csv_phase=get_csvs_phase(csvs))
+            yield None
+
+    def _watch_nodes(self, kube_client: KubeClient) -> Iterator[None]:
+        for statuses in kube_client.watch_nodes_statuses(self._watch_timeout):
+            self._update(
+                api_up=True,
+                nodes_ready=sum(statuses.values()),
+                nodes_total=len(statuses),
+            )
+            yield None
+
+    def _watch_storage_cluster(self, kube_client: KubeClient) -> Iterator[None]:
+        for storage_clusters in kube_client.watch_objects(
+            STORAGE_CLUSTER_REQUEST, self._watch_timeout
+        ):
+            self._update(
+                storage_cluster_phase=next(
+                    (
+                        storage_cluster.status.phase or "Unknown"
+                        for storage_cluster in storage_clusters.values()
+                    ),
+                    "Not Found",
+                )
+            )
+            yield None
+
+
+def monitor_clusters(
+    config_files: dict[str, str],
+    writer: SampleWriter,
+    stop: threading.Event,
+    interval: float = 1.0,
+) -> None:
+    # Samples are written on every change, and every interval if nothing changes.
+    changed = threading.Event()
+    watchers = [
+        ClusterWatcher(name, config_file, changed, stop)
+        for name, config_file in config_files.items()
+    ]
+    for watcher in watchers:
+        watcher.start()
+    while not stop.is_set():  # pylint: disable=while-used
+        changed.wait(interval)
+        changed.clear()
+        timestamp = time.time()
+        writer.write([watcher.sample(timestamp) for watcher in watchers])
+
+
+def read_samples(file_path: str) -> Iterator[HealthSample]:
+    with open(file_path, "rb") as samples_file:
+        if samples_file.read(len(SAMPLES_MAGIC)) != SAMPLES_MAGIC:
+            raise ValueError(f"{file_path} is not a health samples file.")
+        (header_length,) = HEADER_LENGTH.unpack(samples_file.read(HEADER_LENGTH.size))
+        header = json.loads(samples_file.read(header_length))
+        clusters, phases = header["clusters"], header["phases"]
+        record = struct.Struct(header["record"])
+        # A record cut short by an interrupted run is dropped.
+        for chunk in iter(lambda: samples_file.read(record.size), b""):
+            if len(chunk) < record.size:
+                break
+            timestamp, cluster, api_up, ready, total, csv, storage = record.unpack(
+                chunk
+            )
+            yield HealthSample(
+                timestamp,
+                clusters[cluster],
+                bool(api_up),
+                ready,
+                total,
+                phases[csv],
+                phases[storage],
+            )
+
+
+def summarize_samples(samples: Iterator[HealthSample]) -> list[SignalSummary]:
+    # An outage runs from the first unhealthy sample of a signal that was healthy
+    # before to its next healthy sample: the recovery time.
+    summaries: dict[tuple[str, str], SignalSummary] = {}
+    outage_starts: dict[tuple[str, str], Optional[float]] = {}
+    started_at: dict[str, float] = {}
+    last_timestamp = 0.0
+    for sample in samples:
+        last_timestamp = sample.timestamp
+        started_at.setdefault(sample.cluster, sample.timestamp)
+        for signal, healthy in sample.signals.items():
+            if healthy is None:
+                continue
+            key = (sample.cluster, signal)
+            summary = summaries.setdefault(key, SignalSummary(sample.cluster, signal))
+            summary.healthy_at_end = healthy
+            if summary.first_healthy_seconds is None:
+                if healthy:
+                    summary.first_healthy_seconds = round(
+                        sample.timestamp - started_at[sample.cluster], 3
+                    )
+                continue
+            if not healthy:
+                outage_starts.setdefault(key, sample.timestamp)
+            elif (outage_start := outage_starts.pop(key, None)) is not None:
+                summary.recovery_seconds.append(
+                    round(sample.timestamp - outage_start, 3)
+                )
+    for key, summary in summaries.items():
+        ongoing_outage = outage_starts.get(key)
+        summary.outages = len(summary.recovery_seconds) + int(
+            ongoing_outage is not None
+        )
+        summary.downtime_seconds = round(
+            sum(summary.recovery_seconds)
+            + (last_timestamp - ongoing_outage if ongoing_outage is not None else 0),
+            3,
+        )
+    return sorted(
+        summaries.values(), key=lambda summary: (summary.cluster, summary.signal)
+    )
+
+
+def format_signal_summaries(summaries: list[SignalSummary]) -> str:
+    rows = [
+        (
+            "CLUSTER",
+            "SIGNAL",
+            "HEALTHY AFTER",
+            "OUTAGES",
+            "DOWNTIME",
+            "MAX RECOVERY",
+            "AT END",
+        )
+    ] + [
+        (
+            summary.cluster,
+            summary.signal,
+            "-"
+            if summary.first_healthy_seconds is None
+            else f"{summary.first_healthy_seconds:.1f}s",
+            str(summary.outages),
+            f"{summary.downtime_seconds:.1f}s",
+            f"{max(summary.recovery_seconds):.1f}s"
+            if summary.recovery_seconds
+            else "-",
+            "healthy" if summary.healthy_at_end else "unhealthy",
+        )
+        for summary in summaries
+    ]
+    return format_table(rows)
+
+
+def _get_phase_index(phase: str) -> int:
+    return PHASES.index(phase) if phase in PHASES else PHASES.index("Other")
@@ -0,0 +1,226 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+from src.service.aws import AWSService
+from src.service.cluster import AddonId, ClusterService
+from src.service.ledger import ClusterLedger, ClusterRecord, ClusterRole, ClusterUpdate
+from src.service.spec import AddonSpec, ClusterSpec
+from src.util.metrics import timed
+from src.util.util import env, file_lock
+
+logger = logging.getLogger()
+
+
+class PoolState(Enum):
+    FAILED = "failed"
+    LEASED = "leased"
+    PROVISIONING = "provisioning"
+    READY = "ready"
+
+
+@dataclass(frozen=True)
+class Lease:
+    cluster_id: str
+    cluster_name: str
+    lease_id: str
+
+
+class ClusterPool:
+    _cluster_name_prefix = "pool-p"
+    _cluster_service: ClusterService
+    _lease_ttl: int
+    _ledger: ClusterLedger
+    _pool_dir: str
+    _provisioning_ttl: int
+
+    def __init__(
+        self, cluster_service: ClusterService, pool_dir: Optional[str] = None
+    ) -> None:
+        self._pool_dir = os.path.abspath(
+            os.path.expanduser(
+                pool_dir or env("CLUSTER_POOL_DIR", default="~/.ocs-osd-ci/pool")
+            )
+        )
+        os.makedirs(self._pool_dir, exist_ok=True)
+        self._cluster_service = cluster_service
+        self._lease_ttl = env.int("CLUSTER_POOL_LEASE_TTL", default=12 * 3600)
+        self._ledger = ClusterLedger(f"{self._pool_dir}/pool_ledger.db")
+        self._provisioning_ttl = env.int(
+            "CLUSTER_POOL_PROVISIONING_TTL", default=3 * 3600
+        )
+
+    @timed()
+    def lease(self, lease_id: str) -> Optional[Lease]:
+        if not (
+            record := self._ledger.claim(
+                PoolState.READY.value,
+                ClusterUpdate(run_id=lease_id, state=PoolState.LEASED.value),
+            )
+        ):
+            logger.info("No ready cluster available in the pool.")
+            return None
+        logger.info("Leased pool cluster %s (%s).", record.name, lease_id)
+        return Lease(record.cluster_id, record.name, lease_id)
+
+    @timed()
+    def refill(
+        self, size: int, aws_service: AWSService, max_workers: int = 4
+    ) -> list[str]:
+        self._reap()
+        # Refills are serialized so concurrent jobs don't over-provision the pool.
+        with file_lock(f"{self._pool_dir}/refill"):
+            available = len(
+                self._ledger.find(
+                    states=(PoolState.PROVISIONING.value, PoolState.READY.value)
+                )
+            )
+            if available >= size:
+                logger.info("Cluster pool is full: %d/%d.", available, size)
+                return []
+            # The specs are all prepared before any cluster is created.
+            addon_spec = ClusterService.provider_addon_spec()
+            records = self._install(
+                [
+                    self._cluster_service.cluster_template.create_spec(
+                        ClusterService.random_cluster_name(
+                            prefix=self._cluster_name_prefix
+                        )
+                    )
+                    for _ in range(size - available)
+                ],
+                max_workers,
+            )
+        if not records:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(records)), thread_name_prefix="pool"
+        ) as executor:
+            futures = {
+                executor.submit(
+                    self._provision, record, aws_service, addon_spec
+                ): record
+                for record in records
+            }
+            provisioned = []
+            for future in as_completed(futures):
+                record = futures[future]
+                if (error := future.exception()) is not None:
+                    logger.error(
+                        "Pool cluster %s provisioning failed: %s", record.name, error
+                    )
+                    self._discard(record.cluster_id, record.name)
+                else:
+                    provisioned.append(record.cluster_id)
+        return provisioned
+
+    @timed()
+    def release(self, lease: Lease, recycle: bool = True) -> None:
+        # A recycled cluster stays failed until uninstalled, so that a failed
+        # uninstallation is retried by the next refill.
+        if not self._ledger.transition(
+            lease.cluster_id,
+            ClusterUpdate(
+                run_id="",
+                state=PoolState.FAILED.value if recycle else PoolState.READY.value,
+            ),
+            ClusterUpdate(run_id=lease.lease_id, state=PoolState.LEASED.value),
+        ):
+            logger.warning(
+                "Pool cluster %s is no longer leased by %s.",
+                lease.cluster_name,
+                lease.lease_id,
+            )
+            return
+        if recycle and not self._discard(lease.cluster_id, lease.cluster_name):
+            return
+        logger.info(
+            "Released pool cluster %s (%s).",
+            lease.cluster_name,
+            "recycled" if recycle else "returned",
+        )
+
+    def status(self) -> list[ClusterRecord]:
+        return sorted(self._ledger.find(), key=lambda record: record.name)
+
+    def _discard(self, cluster_id: str, cluster_name: str) -> bool:
+        try:
+            self._cluster_service.uninstall(cluster_id, cluster_name)
+        except Exception:  # pylint: disable=broad-except
+            # Keep it as failed so a later refill retries the uninstallation.
+            logger.exception("Unable to uninstall pool cluster %s.", cluster_name)
+            self._ledger.transition(
+                cluster_id, ClusterUpdate(state=PoolState.FAILED.value)
+            )
+            return False
+        self._ledger.remove(cluster_id)
+        return True
+
+    def _install(
+        self, specs: list[ClusterSpec], max_workers: int
+    ) -> list[ClusterRecord]:
+        # Pool clusters outlive the run, so they are kept out of the run ledger. Each
+        # one is recorded once created: a crashed refill leaves none unaccounted for.
+        records = {}
+
+        def add_record(cluster_name: str, cluster_id: str) -> None:
+            records[cluster_name] = ClusterRecord(
+                cluster_id=cluster_id,
+                name=cluster_name,
+                role=ClusterRole.PROVIDER.value,
+                state=PoolState.PROVISIONING.value,
+            )
+            self._ledger.add(records[cluster_name])
+            logger.info("Pool cluster %s is being provisioned.", cluster_name)
+
+        return [
+            records[cluster_name]
+            for cluster_name in self._cluster_service.install_batch(
+                specs,
+                ClusterRole.PROVIDER,
+                track=False,
+                max_workers=max_workers,
+                on_installed=add_record,
+            )
+        ]
+
+    def _provision(
+        self, record: ClusterRecord, aws_service: AWSService, addon_spec: AddonSpec
+    ) -> None:
+        self._cluster_service.wait_for_cluster_ready(record.cluster_id)
+        aws_service.add_provider_addon_inbound_rules(record.name)
+        self._cluster_service.install_addon(record.cluster_id, addon_spec)
+        self._cluster_service.wait_for_addon_ready(record.cluster_id, AddonId.PROVIDER)
+        self._ledger.transition(
+            record.cluster_id,
+            ClusterUpdate(addon_state="Succeeded", state=PoolState.READY.value),
+            ClusterUpdate(state=PoolState.PROVISIONING.value),
+        )
+        logger.info("Pool cluster %s is ready.", record.name)
+
+    def _reap(self) -> None:
+        now = time.time()
+        stale_records = [
+            record
+            for state, updated_before in (
+                (PoolState.FAILED.value, None),
+                (PoolState.LEASED.value, now - self._lease_ttl),
+                (PoolState.PROVISIONING.value, now - self._provisioning_ttl),
+            )
+            for record in self._ledger.find(
+                states=(state,), updated_before=updated_before
+            )
+        ]
+        for record in stale_records:
+            # Skip clusters that changed since they were listed (e.g. a returned lease).
+            if self._ledger.transition(
+                record.cluster_id,
+                ClusterUpdate(state=PoolState.FAILED.value),
+                ClusterUpdate(run_id=record.run_id, state=record.state),
+            ):
+                logger.warning("Reaping %s pool cluster %s.", record.state, record.name)
+                self._discard(record.cluster_id, record.name)
@@ -0,0 +1,121 @@
+import logging
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from src.service.aws import AWSService
+from src.service.cluster import ClusterInfo, ClusterService
+from src.util.metrics import metrics, timed
+
+logger = logging.getLogger()
+
+
+@dataclass
+class ReapReport:
+    dry_run: bool
+    expired: list[str] = field(default_factory=list)
+    reaped: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    # Clusters with EC2 instances left but no longer known to OCM.
+    unmanaged: dict[str, int] = field(default_factory=dict)
+
+
+class ClusterReaper:
+    _aws_service: AWSService
+    _cluster_service: ClusterService
+    _name_prefixes: tuple[str, ...]
+    _ttl: int
+
+    def __init__(
+        self,
+        cluster_service: ClusterService,
+        aws_service: AWSService,
+        name_prefixes: Sequence[str],
+        ttl: int,
+    ) -> None:
+        if not name_prefixes:
+            raise ValueError("At least one cluster name prefix is required.")
+        self._aws_service = aws_service
+        self._cluster_service = cluster_service
+        self._name_prefixes = tuple(name_prefixes)
+        self._ttl = ttl
+
+    @timed()
+    def reap(self, dry_run: bool = False, max_workers: int = 8) -> ReapReport:
+        clusters = self._cluster_service.find_clusters(self._name_prefixes)
+        cluster_instances = self._aws_service.find_cluster_instances(
+            self._name_prefixes
+        )
+        cluster_names = {cluster.name for cluster in clusters}
+        report = ReapReport(
+            dry_run=dry_run,
+            unmanaged={
+                cluster_name: instances
+                for cluster_name, instances in sorted(cluster_instances.items())
+                if cluster_name not in cluster_names
+            },
+        )
+        expired_clusters = self._find_expired(clusters, cluster_instances)
+        report.expired.extend(cluster.name for cluster in expired_clusters)
+        if expired_clusters and not dry_run:
+            self._uninstall(expired_clusters, report, max_workers)
+        for cluster_name, instances in report.unmanaged.items():
+            logger.warning(
+                "Reaper: %d EC2 instances left by cluster %s, unknown to OCM.",
+                instances,
+                cluster_name,
+            )
+        metrics.increment("reaper_clusters", "expired", len(report.expired))
+        metrics.increment("reaper_clusters", "unmanaged", len(report.unmanaged))
+        logger.info(
+            "Reaper summary%s: %d expired, %d reaped, %d failed, %d unmanaged.",
+            " (dry run)" if dry_run else "",
+            len(report.expired),
+            len(report.reaped),
+            len(report.failed),
+            len(report.unmanaged),
+        )
+        return report
+
+    def _find_expired(
+        self, clusters: list[ClusterInfo], cluster_instances: dict[str, int]
+    ) -> list[ClusterInfo]:
+        expired_before = time.time() - self._ttl
+        expired_clusters = []
+        for cluster in sorted(clusters, key=lambda cluster: cluster.created_at):
+            if cluster.created_at >= expired_before or cluster.state == "uninstalling":
+                continue
+            logger.info(
+                "Reaper: cluster %s (%s) is %.1f hours old, %s, %d EC2 instances.",
+                cluster.name,
+                cluster.cluster_id,
+                (time.time() - cluster.created_at) / 3600,
+                cluster.state,
+                cluster_instances.get(cluster.name, 0),
+            )
+            expired_clusters.append(cluster)
+        return expired_clusters
+
+    def _uninstall(
+        self, clusters: list[ClusterInfo], report: ReapReport, max_workers: int
+    ) -> None:
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(clusters)), thread_name_prefix="reaper"
+        ) as executor:
+            futures = {
+                executor.submit(
+                    self._cluster_service.uninstall, cluster.cluster_id, cluster.name
+                ): cluster.name
+                for cluster in clusters
+            }
+            for future in as_completed(futures):
+                cluster_name = futures[future]
+                if (error := future.exception()) is not None:
+                    logger.error(
+                        "Reaper: cluster %s uninstall failed: %s", cluster_name, error
+                    )
+                    report.failed[cluster_name] = str(error)
+                elif future.result():
+                    report.reaped.append(cluster_name)
+        metrics.increment("reaper_clusters", "reaped", len(report.reaped))
@@ -0,0 +1,235 @@
+import logging
+import math
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, replace
+from itertools import count
+from typing import Optional
+
+from src.service.cluster import ClusterService
+from src.util.metrics import metrics
+from src.util.util import format_table
+from src.util.wait import (
+    SYSTEM_CLOCK,
+    Backoff,
+    Clock,
+    Deadline,
+    WaitTimeoutError,
+    poll_until,
+)
+
+logger = logging.getLogger()
+
+RECOVERY_METRICS = (
+    "detection_seconds",
+    "storage_cluster_ready_seconds",
+    "consumer_reconnection_seconds",
+)
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass(frozen=True)
+class RecoveryTrial:
+    trial: int
+    deleted_pods: int = 0
+    # Seconds after the disruption until the provider is seen unhealthy, its
+    # StorageCluster is Ready again and the consumer StorageCluster is Ready again.
+    detection_seconds: Optional[float] = None
+    storage_cluster_ready_seconds: Optional[float] = None  # noqa: V107
+    consumer_reconnection_seconds: Optional[float] = None  # noqa: V107
+    error: str = ""
+
+
+@dataclass(frozen=True)
+class RecoveryStats:
+    metric: str
+    samples: int
+    percentiles: dict[str, float]
+    max_seconds: float
+
+
+class RecoveryBenchmark:
+    _clock: Clock
+    _cluster_service: ClusterService
+    _consumer_id: str
+    _detection_timeout = 300
+    _poll_interval = 1.0
+    _provider_id: str
+    _recovery_timeout = 1800
+
+    def __init__(
+        self,
+        cluster_service: ClusterService,
+        provider_id: str,
+        consumer_id: str,
+        clock: Clock = SYSTEM_CLOCK,
+    ) -> None:
+        self._clock = clock
+        self._cluster_service = cluster_service
+        self._consumer_id = consumer_id
+        self._provider_id = provider_id
+
+    def run(
+        self, trials: int, pod_selector: str, cooldown: float = 60
+    ) -> list[RecoveryTrial]:
+        results = []
+        for trial in range(1, trials + 1):
+            if trial > 1:
+                self._clock.sleep(cooldown)
+            try:
+                result = self._run_trial(trial, pod_selector)
+            except WaitTimeoutError:
+                # The clusters never recovered: the next trials can't start either.
+                results.append(
+                    _with_error(
+                        RecoveryTrial(trial),
+                        "Clusters not Ready before the disruption.",
+                    )
+                )
+                break
+            except Exception as error:  # pylint: disable=broad-except
+                # E.g. an API error: the trials done so far are still reported.
+                results.append(
+                    _with_error(
+                        RecoveryTrial(trial), str(error) or type(error).__name__
+                    )
+                )
+                break
+            logger.info("Recovery trial %d/%d: %s", trial, trials, result)
+            results.append(result)
+        return results
+
+    def _consumer_ready(self) -> bool:
+        phase = self._cluster_service.get_storage_cluster_phase(self._consumer_id)
+        return phase == "Ready"
+
+    def _measure(
+        self, started_at: float, condition: Callable[[], bool], timeout: float
+    ) -> Optional[float]:
+        deadline = Deadline(timeout, self._clock)
+        for _ in count():
+            # The time is taken before the check: it is when the state was seen.
+            seen_at = self._clock.monotonic()
+            if condition():
+                return round(seen_at - started_at, 1)
+            if deadline.expired:
+                break
+            deadline.sleep(self._poll_interval)
+        return None
+
+    def _provider_ready(self) -> bool:
+        phase = self._cluster_service.get_storage_cluster_phase(self._provider_id)
+        return phase == "Ready" and self._cluster_service.get_nodes_ready(
+            self._provider_id
+        )
+
+    def _run_trial(self, trial: int, pod_selector: str) -> RecoveryTrial:
+        poll_until(
+            lambda: self._provider_ready() and self._consumer_ready(),
+            self._recovery_timeout,
+            Backoff(initial=self._poll_interval, maximum=self._poll_interval * 10),
+            self._clock,
+        )
+        endpoint = self._cluster_service.get_addon_ocs_provider_storage_endpoint(
+            self._provider_id
+        )
+        started_at = self._clock.monotonic()
+        result = RecoveryTrial(
+            trial,
+            deleted_pods=self._cluster_service.delete_storage_pods(
+                self._provider_id, pod_selector
+            ),
+        )
+        if (
+            detection_seconds := self._measure(
+                started_at, lambda: not self._provider_ready(), self._detection_timeout
+            )
+        ) is None:
+            return _with_error(result, "Disruption not detected.")
+        result = _replace_seconds(result, detection_seconds=detection_seconds)
+        if (
+            ready_seconds := self._measure(
+                started_at, self._provider_ready, self._recovery_timeout
+            )
+        ) is None:
+            return _with_error(result, "Provider StorageCluster not Ready.")
+        result = _replace_seconds(result, storage_cluster_ready_seconds=ready_seconds)
+        # Consumers reconnect to the endpoint they were onboarded with.
+        if (
+            self._cluster_service.get_addon_ocs_provider_storage_endpoint(
+                self._provider_id
+            )
+            != endpoint
+        ):
+            return _with_error(result, "Storage provider endpoint changed.")
+        if (
+            reconnection_seconds := self._measure(
+                started_at, self._consumer_ready, self._recovery_timeout
+            )
+        ) is None:
+            return _with_error(result, "Consumer StorageCluster not Ready.")
+        return _replace_seconds(
+            result, consumer_reconnection_seconds=reconnection_seconds
+        )
+
+
+def format_recovery_stats(stats: list[RecoveryStats]) -> str:
+    rows = [
+        (
+            "METRIC",
+            "SAMPLES",
+            *(f"P{percentile}" for percentile in PERCENTILES),
+            "MAX",
+        )
+    ] + [
+        (
+            metric_stats.metric,
+            str(metric_stats.samples),
+            *(f"{value:.1f}s" for value in metric_stats.percentiles.values()),
+            f"{metric_stats.max_seconds:.1f}s",
+        )
+        for metric_stats in stats
+    ]
+    return format_table(rows)
+
+
+def get_percentile(values: Sequence[float], percentile: float) -> float:
+    # Linear interpolation between the closest ranks, as numpy does by default.
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percentile / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_trials(trials: Sequence[RecoveryTrial]) -> list[RecoveryStats]:
+    # Failed trials still count for the stages they went through.
+    stats = []
+    for metric in RECOVERY_METRICS:
+        values = [
+            value for trial in trials if (value := getattr(trial, metric)) is not None
+        ]
+        if not values:
+            continue
+        stats.append(
+            RecoveryStats(
+                metric=metric,
+                samples=len(values),
+                percentiles={
+                    f"p{percentile}": round(get_percentile(values, percentile), 1)
+                    for percentile in PERCENTILES
+                },
+                max_seconds=max(values),
+            )
+        )
+    return stats
+
+
+def _replace_seconds(trial: RecoveryTrial, **seconds: float) -> RecoveryTrial:
+    for metric, value in seconds.items():
+        metrics.observe("recovery", metric, value)
+    return replace(trial, **seconds)
+
+
+def _with_error(trial: RecoveryTrial, error: str) -> RecoveryTrial:
+    logger.error("Recovery trial %d: %s", trial.trial, error)
+    return replace(trial, error=error)
@@ -0,0 +1,152 @@
+import re
+from collections.abc import Mapping
+from dataclasses import dataclass, field, replace
+from typing import Any, Optional
+
+from src.service.aws import ClusterSubnetsInfo
+from src.util.util import env
+
+CLUSTER_NAME_MAX_LENGTH = 15
+CLUSTER_NAME_PATTERN = re.compile(r"[a-z]([-a-z0-9]*[a-z0-9])?")
+MACHINE_TYPE_PATTERN = re.compile(r"[a-z][a-z0-9-]*\.[a-z0-9]+")
+# OSD CCS clusters need 2 compute nodes in a single zone, 3 per zone otherwise.
+MIN_COMPUTE_NODES = 2
+MULTI_ZONE_COUNT = 3
+
+
+@dataclass(frozen=True)
+class AwsCredentials:
+    access_key_id: str
+    account_id: str
+    secret_access_key: str = field(repr=False)
+
+    @classmethod
+    def from_env(cls) -> "AwsCredentials":
+        return cls(
+            access_key_id=env("AWS_ACCESS_KEY_ID"),
+            account_id=env("AWS_ACCOUNT_ID"),
+            secret_access_key=env("AWS_SECRET_ACCESS_KEY"),
+        )
+
+
+@dataclass(frozen=True)
+class ClusterTemplate:
+    # Validated once, then shared by every install: each request body is built anew.
+    region: str
+    availability_zones: tuple[str, ...] = ()
+    compute_nodes: int = 3
+    machine_type: str = "m5.2xlarge"
+    subnet_ids: tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        if not self.region:
+            raise ValueError("Cluster template region is required.")
+        if not MACHINE_TYPE_PATTERN.fullmatch(self.machine_type):
+            raise ValueError(f"Invalid machine type: {self.machine_type}")
+        if len(self.availability_zones) not in {0, 1, MULTI_ZONE_COUNT} or len(
+            set(self.availability_zones)
+        ) != len(self.availability_zones):
+            raise ValueError(
+                f"Expected 1 or {MULTI_ZONE_COUNT} distinct availability zones: "
+                f"{self.availability_zones}"
+            )
+        if any(not zone.startswith(self.region) for zone in self.availability_zones):
+            raise ValueError(
+                f"Availability zones {self.availability_zones} are not all "
+                f"in region {self.region}."
+            )
+        if self.compute_nodes < MIN_COMPUTE_NODES or (
+            len(self.availability_zones) == MULTI_ZONE_COUNT
+            and self.compute_nodes % MULTI_ZONE_COUNT
+        ):
+            raise ValueError(
+                f"Invalid compute node count for {len(self.availability_zones)} "
+                f"zones: {self.compute_nodes}"
+            )
+
+    @classmethod
+    def from_env(cls) -> "ClusterTemplate":
+        return cls(
+            region=env("AWS_REGION"),
+            availability_zones=tuple(env.list("AWS_AVAILABILITY_ZONES", default=[])),
+            compute_nodes=env.int("CLUSTER_COMPUTE_NODES", default=3),
+            machine_type=env("CLUSTER_MACHINE_TYPE", default="m5.2xlarge"),
+            subnet_ids=tuple(env.list("AWS_SUBNET_IDS", default=[])),
+        )
+
+    def create_spec(self, name: str) -> "ClusterSpec":
+        return ClusterSpec(name, self)
+
+    def with_subnets(
+        self, subnets_info: Optional[ClusterSubnetsInfo]
+    ) -> "ClusterTemplate":
+        # E.g. consumers are installed in the subnets of their provider.
+        if not subnets_info:
+            return self
+        return replace(
+            self,
+            availability_zones=tuple(subnets_info.availability_zones)
+            or self.availability_zones,
+            subnet_ids=tuple(subnets_info.subnet_ids) or self.subnet_ids,
+        )
+
+
+@dataclass(frozen=True)
+class ClusterSpec:
+    name: str
+    template: ClusterTemplate
+
+    def __post_init__(self) -> None:
+        if len(self.name) > CLUSTER_NAME_MAX_LENGTH or not (
+            CLUSTER_NAME_PATTERN.fullmatch(self.name)
+        ):
+            raise ValueError(f"Invalid cluster name: {self.name}")
+
+    def to_request_body(self, credentials: AwsCredentials) -> dict[str, Any]:
+        nodes: dict[str, Any] = {
+            "compute": self.template.compute_nodes,
+            "compute_machine_type": {"id": self.template.machine_type},
+        }
+        if self.template.availability_zones:
+            nodes["availability_zones"] = list(self.template.availability_zones)
+        return {
+            "aws": {
+                "access_key_id": credentials.access_key_id,
+                "account_id": credentials.account_id,
+                "secret_access_key": credentials.secret_access_key,
+                "subnet_ids": list(self.template.subnet_ids),
+            },
+            "ccs": {"enabled": True},
+            "cloud_provider": {"id": "aws"},
+            "name": self.name,
+            "nodes": nodes,
+            "region": {"id": self.template.region},
+        }
+
+
+@dataclass(frozen=True)
+class AddonSpec:
+    addon_id: str
+    params: tuple[tuple[str, str], ...] = ()
+
+    def __post_init__(self) -> None:
+        param_ids = [param_id for param_id, _ in self.params]
+        if not self.addon_id or not all(param_ids):
+            raise ValueError(f"Addon {self.addon_id} ids must not be empty.")
+        if len(set(param_ids)) != len(param_ids):
+            raise ValueError(f"Duplicate addon {self.addon_id} parameters.")
+
+    @classmethod
+    def create(cls, addon_id: str, params: Mapping[str, str]) -> "AddonSpec":
+        return cls(addon_id, tuple(sorted(params.items())))
+
+    def to_request_body(self) -> dict[str, Any]:
+        return {
+            "addon": {"id": self.addon_id},
+            "parameters": {
+                "items": [
+                    {"id": param_id, "value": param_value}
+                    for param_id, param_value in self.params
+                ]
+            },
+        }
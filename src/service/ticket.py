@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import base64
+import json
+import time
+import uuid
+from typing import TYPE_CHECKING
+
+from src.util.metrics import timed
+
+if TYPE_CHECKING:
+    from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+
+
+class OnboardingTicketGenerator:
+    _expiration_seconds = 999999999
+    _private_key: RSAPrivateKey
+
+    def __init__(self, private_key_file: str) -> None:
+        from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        with open(private_key_file, "rb") as key_file:
+            private_key = load_pem_private_key(key_file.read(), password=None)
+        if not isinstance(private_key, RSAPrivateKey):
+            raise ValueError("The onboarding private key must be an RSA key.")
+        self._private_key = private_key
+
+    def generate(self) -> str:
+        return self.generate_batch(1)[0]
+
+    @timed()
+    def generate_batch(self, count: int) -> list[str]:
+        expiration_date = str(int(time.time()) + self._expiration_seconds)
+        return [
+            self._sign({"id": str(uuid.uuid4()), "expirationDate": expiration_date})
+            for _ in range(count)
+        ]
+
+    def _sign(self, ticket: dict[str, str]) -> str:
+        from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+        from cryptography.hazmat.primitives.hashes import SHA256
+
+        # Same format as ocs-operator's ticketgen.sh: base64(json).base64(signature).
+        # The provider server verifies the signature over the decoded JSON bytes.
+        message = json.dumps(ticket, indent=2).encode()
+        signature = self._private_key.sign(message, PKCS1v15(), SHA256())
+        return (
+            f"{base64.b64encode(message).decode()}."
+            f"{base64.b64encode(signature).decode()}"
+        )
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Callable, Generic, Optional, TypeVar
+
+from src.util.wait import SYSTEM_CLOCK, Clock
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    _clock: Clock
+    _entries: "OrderedDict[K, tuple[float, V]]"
+    _key_locks: dict[K, threading.Lock]
+    _lock: threading.Lock
+    _maxsize: int
+    _on_evict: Optional[Callable[[V], None]]
+    _ttl: float
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        clock: Clock = SYSTEM_CLOCK,
+        on_evict: Optional[Callable[[V], None]] = None,
+    ) -> None:
+        if maxsize <= 0 or ttl <= 0:
+            raise ValueError("Cache size and TTL must be positive numbers.")
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        # Releases the resources of the values that expire or are evicted.
+        self._on_evict = on_evict
+        self._ttl = ttl
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry:
+            self._evict([entry[1]])
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            expires_at, value = entry
+            if self._clock.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+        self._evict([value])
+        return None
+
+    def get_or_create(self, key: K, factory: Callable[[], V]) -> V:
+        # Per key locks: a slow factory only delays the callers of the same key.
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if (value := self.get(key)) is None:
+                value = factory()
+                self.set(key, value)
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        with self._lock:
+            replaced = self._entries.pop(key, None)
+            self._entries[key] = (self._clock.monotonic() + self._ttl, value)
+            evicted = [
+                self._entries.popitem(last=False)[1][1]
+                for _ in range(len(self._entries) - self._maxsize)
+            ]
+        if replaced and replaced[1] is not value:
+            evicted.append(replaced[1])
+        self._evict(evicted)
+
+    def _evict(self, values: list[V]) -> None:
+        if self._on_evict:
+            for value in values:
+                self._on_evict(value)
@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import time
+from typing import Any
+
+from src.util.util import get_file_content, save_to_json_file
+
+logger = logging.getLogger()
+
+
+class RunCheckpoint:
+    _file_path: str
+    _params: dict[str, Any]
+    _steps: dict[str, Any]
+
+    def __init__(self, file_path: str) -> None:
+        self._file_path = file_path
+        self._params = {}
+        self._steps = {}
+        if os.path.isfile(file_path):
+            state = json.loads(get_file_content(file_path))
+            self._params = state["params"]
+            self._steps = state["steps"]
+            logger.info(
+                "Loaded checkpoint %s: %d completed steps.", file_path, len(self._steps)
+            )
+
+    @property
+    def exists(self) -> bool:
+        return os.path.isfile(self._file_path)
+
+    def discard(self, step_name: str) -> None:
+        if self._steps.pop(step_name, None) is not None:
+            self._save()
+
+    def get(self, step_name: str) -> Any:
+        return self._steps[step_name]["result"]
+
+    def is_completed(self, step_name: str) -> bool:
+        return step_name in self._steps
+
+    def save(self, step_name: str, result: Any) -> None:
+        self._steps[step_name] = {"completed_at": time.time(), "result": result}
+        self._save()
+
+    def setdefault(self, key: str, value: Any) -> Any:
+        # Run parameters (e.g. random cluster names) must not change on resume.
+        if key not in self._params:
+            self._params[key] = value
+            self._save()
+        return self._params[key]
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self._file_path)), exist_ok=True)
+        save_to_json_file(
+            self._file_path, {"params": self._params, "steps": self._steps}
+        )
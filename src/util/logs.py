@@ -0,0 +1,169 @@
+import atexit
+import contextvars
+import inspect
+import json
+import logging
+import os
+import queue
+import re
+from collections.abc import Callable
+from functools import wraps
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, TypeVar
+
+from src.util.util import env
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_cluster_id: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "cluster_id", default=""
+)
+_REDACTED = "[REDACTED]"
+# Patterns of secrets that end up in logged commands, payloads and errors.
+_SECRET_PATTERNS = (
+    (
+        re.compile(
+            r"-----BEGIN [A-Z ]*PRIVATE KEY-----.*?(?:-----END [A-Z ]*PRIVATE KEY-----|$)",
+            re.DOTALL,
+        ),
+        _REDACTED,
+    ),
+    (
+        re.compile(
+            r"""(["']?(?:access_token|kubeconfig|onboarding-ticket|password"""
+            r"""|refresh_token|secret_access_key|token)["']?\s*[:=]\s*)"""
+            r"""(?:"(?:[^"\\]|\\.)*(?:"|$)|'(?:[^'\\]|\\.)*(?:'|$))""",
+            re.IGNORECASE,
+        ),
+        rf'\1"{_REDACTED}"',
+    ),
+    (
+        re.compile(
+            r"((?:client-certificate-data|client-key-data|password|token)\s*:\s*)\S+"
+        ),
+        rf"\1{_REDACTED}",
+    ),
+    (re.compile(r"(Bearer\s+)[\w.~+/=-]+"), rf"\1{_REDACTED}"),
+    (re.compile(r"sha256~[\w-]+"), _REDACTED),
+    (re.compile(r"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b"), _REDACTED),
+)
+# Fields shared by every thread of the process.
+_PROCESS_FIELDS = {"run_id": ""}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(
+            {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "file": record.filename,
+                "line": record.lineno,
+                "thread": record.threadName,
+                "run_id": getattr(record, "run_id", ""),
+                "cluster_id": getattr(record, "cluster_id", ""),
+                "message": record.getMessage(),
+            }
+        )
+
+
+class ContextQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> Any:
+        # Runs in the logging thread: only the message arguments are merged and the
+        # context fields captured, the rest is left to the listener thread.
+        record = super().prepare(record)
+        record.__dict__.update(_PROCESS_FIELDS, cluster_id=_cluster_id.get())
+        return record
+
+
+class SanitizingQueueListener(QueueListener):
+    _max_message_length: int
+
+    def __init__(
+        self, log_queue: "queue.SimpleQueue[Any]", *handlers: logging.Handler
+    ) -> None:
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self._max_message_length = env.int("LOG_MAX_MESSAGE_LENGTH", default=4096)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is bounded before it is redacted, so large payloads
+        # (kubeconfigs, cluster lists) stay cheap to log.
+        message = str(record.msg)
+        if len(message) > self._max_message_length:
+            message = (
+                f"{message[:self._max_message_length]}"
+                f"... [{len(message) - self._max_message_length} chars truncated]"
+            )
+        record.msg = record.message = redact(message)
+        return record
+
+
+def redact(message: str) -> str:
+    for pattern, replacement in _SECRET_PATTERNS:
+        message = pattern.sub(replacement, message)
+    return message
+
+
+def set_run_id(run_id: str) -> None:
+    _PROCESS_FIELDS["run_id"] = run_id
+
+
+def setup_logging() -> None:
+    # Logging threads only queue the records: redaction, formatting and disk I/O
+    # happen in the listener thread, so polling loops never wait on the log file.
+    log_queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+    cli_handler = logging.StreamHandler()
+    cli_handler.setLevel(logging.INFO)
+    cli_handler.setFormatter(
+        logging.Formatter(" %(asctime)s [%(levelname)s] %(message)s")
+    )
+    file_handler = _create_file_handler(env("LOG_FILE", default="test-output.log"))
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(JsonFormatter())
+    listener = SanitizingQueueListener(log_queue, cli_handler, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG)
+    root_logger.addHandler(ContextQueueHandler(log_queue))
+
+
+def with_cluster_id(func: F) -> F:
+    # Tags the records logged during the call with its cluster_id argument.
+    def get_cluster_id(*args: Any, **kwargs: Any) -> str:
+        return str(kwargs["cluster_id"] if "cluster_id" in kwargs else args[1])
+
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            token = _cluster_id.set(get_cluster_id(*args, **kwargs))
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _cluster_id.reset(token)
+
+        return async_wrapper  # type: ignore
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = _cluster_id.set(get_cluster_id(*args, **kwargs))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _cluster_id.reset(token)
+
+    return wrapper  # type: ignore
+
+
+def _create_file_handler(file_path: str) -> RotatingFileHandler:
+    file_handler = RotatingFileHandler(
+        file_path,
+        maxBytes=env.int("LOG_MAX_BYTES", default=10 * 1024 * 1024),
+        backupCount=env.int("LOG_BACKUP_COUNT", default=5),
+        delay=True,
+    )
+    # Every run starts a new log file: the previous one is kept as a backup.
+    if os.path.isfile(file_path) and os.path.getsize(file_path):
+        file_handler.doRollover()
+    return file_handler
@@ -0,0 +1,149 @@
+import inspect
+import re
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from functools import wraps
+from typing import Any, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_METRIC_PREFIX = "ocs_osd_ci"
+
+
+@dataclass
+class TimerStats:
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    errors: int = 0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.errors += int(error)
+
+
+class Metrics:
+    _counters: dict[tuple[str, str], float]
+    _lock: threading.Lock
+    _started_at: float
+    _timers: dict[tuple[str, str], TimerStats]
+
+    def __init__(self) -> None:
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._timers = {}
+
+    def increment(self, kind: str, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[(kind, name)] = self._counters.get((kind, name), 0) + value
+
+    def observe(
+        self, kind: str, name: str, seconds: float, error: bool = False
+    ) -> None:
+        with self._lock:
+            self._timers.setdefault((kind, name), TimerStats()).observe(seconds, error)
+
+    @contextmanager
+    def stage(self, name: str, kind: str = "stage") -> Iterator[None]:
+        start = time.monotonic()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(kind, name, time.monotonic() - start, error)
+
+    def report(self) -> dict[str, Any]:
+        with self._lock:
+            timers = {
+                f"{kind}:{name}": {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "total_seconds": round(stats.total_seconds, 3),
+                    "max_seconds": round(stats.max_seconds, 3),
+                }
+                for (kind, name), stats in sorted(self._timers.items())
+            }
+            counters = {
+                f"{kind}:{name}": value
+                for (kind, name), value in sorted(self._counters.items())
+            }
+        return {
+            "started_at": self._started_at,
+            "duration_seconds": round(time.time() - self._started_at, 3),
+            "timers": timers,
+            "counters": counters,
+        }
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            timers = [
+                (key, replace(stats)) for key, stats in sorted(self._timers.items())
+            ]
+            counters = sorted(self._counters.items())
+        lines = []
+        for kind in sorted({kind for (kind, _), _ in timers}):
+            kind_timers = [
+                (_escape(name), stats)
+                for (timer_kind, name), stats in timers
+                if timer_kind == kind
+            ]
+            metric = f"{_METRIC_PREFIX}_{_sanitize(kind)}_duration_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for name, stats in kind_timers:
+                lines.append(f'{metric}_sum{{name="{name}"}} {stats.total_seconds}')
+                lines.append(f'{metric}_count{{name="{name}"}} {stats.count}')
+            metric = f"{_METRIC_PREFIX}_{_sanitize(kind)}_errors_total"
+            lines.append(f"# TYPE {metric} counter")
+            for name, stats in kind_timers:
+                lines.append(f'{metric}{{name="{name}"}} {stats.errors}')
+        for kind in sorted({kind for (kind, _), _ in counters}):
+            metric = f"{_METRIC_PREFIX}_{_sanitize(kind)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_kind, name), value in counters:
+                if counter_kind == kind:
+                    lines.append(f'{metric}{{name="{_escape(name)}"}} {value}')
+        metric = f"{_METRIC_PREFIX}_run_started_timestamp_seconds"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {self._started_at}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def timed(kind: str = "call") -> Callable[[F], F]:
+    def inner(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with metrics.stage(func.__qualname__, kind):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with metrics.stage(func.__qualname__, kind):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return inner
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sanitize(value: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", value)
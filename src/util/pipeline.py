@@ -0,0 +1,250 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from queue import Empty, Queue
+from typing import Any, Callable, Optional
+
+from src.util.checkpoint import RunCheckpoint
+from src.util.metrics import metrics
+from src.util.wait import Deadline
+
+logger = logging.getLogger()
+
+StepResults = dict[str, Any]
+
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    func: Callable[[StepResults], Any]
+    requires: tuple[str, ...] = ()
+    # Checkpointed results are JSON: encode/decode convert other result types.
+    decode: Optional[Callable[[Any], Any]] = None
+    encode: Optional[Callable[[Any], Any]] = None
+    # Tells whether a checkpointed result (given with the required ones) still holds.
+    validate: Optional[Callable[[StepResults], bool]] = None
+
+
+@dataclass(frozen=True)
+class StepTiming:
+    name: str
+    start: float
+    end: float
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass(frozen=True)
+class StepOutcome:
+    step: Step
+    started_at: float
+    ended_at: float
+    result: Any = None
+    error: Optional[Exception] = None
+
+
+class Pipeline:
+    # Seconds given to the running steps to finish after a step failed.
+    _abandon_timeout = 2.0
+    _checkpoint: Optional[RunCheckpoint]
+    _max_workers: Optional[int]
+    _restored: set[str]
+    _start: float = 0.0
+    _steps: dict[str, Step]
+    _timings: dict[str, StepTiming]
+
+    def __init__(
+        self,
+        steps: list[Step],
+        max_workers: Optional[int] = None,
+        checkpoint: Optional[RunCheckpoint] = None,
+    ) -> None:
+        self._steps = {step.name: step for step in steps}
+        if len(self._steps) != len(steps):
+            raise ValueError("Pipeline step names must be unique.")
+        for step in steps:
+            if missing := set(step.requires) - self._steps.keys():
+                raise ValueError(f"Step {step.name} requires unknown steps: {missing}")
+        self._steps = {name: self._steps[name] for name in self._sort_steps()}
+        self._checkpoint = checkpoint
+        self._max_workers = max_workers
+        self._restored = set()
+        self._timings = {}
+
+    def run(self) -> StepResults:
+        # Steps run in daemon threads: when one fails, the steps still running (e.g.
+        # hours long waits) are abandoned instead of holding up the process exit.
+        results = self._restore()
+        pending = {
+            name: step for name, step in self._steps.items() if name not in results
+        }
+        running: set[str] = set()
+        outcomes: "Queue[StepOutcome]" = Queue()
+        max_workers = self._max_workers or len(self._steps)
+        self._start = time.monotonic()
+        while pending or running:  # pylint: disable=while-used
+            for step in list(pending.values()):
+                if len(running) < max_workers and all(
+                    name in results for name in step.requires
+                ):
+                    logger.debug("Pipeline step started: %s", step.name)
+                    del pending[step.name]
+                    running.add(step.name)
+                    threading.Thread(
+                        target=_run_step,
+                        args=(
+                            step,
+                            {name: results[name] for name in step.requires},
+                            outcomes,
+                        ),
+                        name=f"pipeline-{step.name}",
+                        daemon=True,
+                    ).start()
+            outcome = outcomes.get()
+            running.remove(outcome.step.name)
+            if outcome.error is not None:
+                logger.error("Pipeline step %s failed.", outcome.step.name)
+                self._record(outcome)
+                self._drain(running, outcomes, results)
+                raise outcome.error
+            self._complete(outcome, results)
+        return results
+
+    def critical_path(self) -> list[StepTiming]:
+        if not self._timings:
+            return []
+        path = [max(self._timings.values(), key=lambda timing: timing.end)]
+        while self._steps[path[0].name].requires:  # pylint: disable=while-used
+            # The dependency that finished last is the one that gated the step.
+            path.insert(
+                0,
+                max(
+                    (
+                        self._timings[name]
+                        for name in self._steps[path[0].name].requires
+                    ),
+                    key=lambda timing: timing.end,
+                ),
+            )
+        return path
+
+    def report(self) -> dict[str, Any]:
+        critical_path = self.critical_path()
+        return {
+            "total_seconds": round(critical_path[-1].end, 3) if critical_path else 0.0,
+            "critical_path": [timing.name for timing in critical_path],
+            "steps": {
+                timing.name: {
+                    "start_seconds": round(timing.start, 3),
+                    "end_seconds": round(timing.end, 3),
+                    "duration_seconds": round(timing.duration, 3),
+                    "critical": timing in critical_path,
+                    "restored": timing.name in self._restored,
+                }
+                for timing in sorted(self._timings.values(), key=lambda t: t.start)
+            },
+        }
+
+    def _complete(self, outcome: StepOutcome, results: StepResults) -> None:
+        step = outcome.step
+        self._record(outcome)
+        results[step.name] = outcome.result
+        if self._checkpoint:
+            self._checkpoint.save(
+                step.name,
+                step.encode(outcome.result) if step.encode else outcome.result,
+            )
+        logger.info(
+            "Pipeline step %s completed in %.1fs.",
+            step.name,
+            self._timings[step.name].duration,
+        )
+
+    def _drain(
+        self, running: set[str], outcomes: "Queue[StepOutcome]", results: StepResults
+    ) -> None:
+        # Steps finishing within the grace period are still checkpointed, so that a
+        # resumed run does not redo them.
+        deadline = Deadline(self._abandon_timeout)
+        while running and not deadline.expired:  # pylint: disable=while-used
+            try:
+                outcome = outcomes.get(timeout=deadline.remaining)
+            except Empty:
+                break
+            running.remove(outcome.step.name)
+            if outcome.error is None:
+                self._complete(outcome, results)
+            else:
+                self._record(outcome)
+        if running:
+            logger.warning("Pipeline steps abandoned: %s", ", ".join(sorted(running)))
+
+    def _record(self, outcome: StepOutcome) -> None:
+        self._timings[outcome.step.name] = StepTiming(
+            outcome.step.name,
+            outcome.started_at - self._start,
+            outcome.ended_at - self._start,
+        )
+        metrics.observe(
+            "stage",
+            outcome.step.name,
+            self._timings[outcome.step.name].duration,
+            outcome.error is not None,
+        )
+
+    def _restore(self) -> StepResults:
+        # A checkpointed step is only reused if every step it requires was reused.
+        results: StepResults = {}
+        if not self._checkpoint:
+            return results
+        for step in self._steps.values():
+            if not self._checkpoint.is_completed(step.name) or any(
+                name not in results for name in step.requires
+            ):
+                continue
+            result = self._checkpoint.get(step.name)
+            if step.decode:
+                result = step.decode(result)
+            if step.validate and not step.validate(
+                {**{name: results[name] for name in step.requires}, step.name: result}
+            ):
+                logger.info("Checkpointed step %s is no longer valid.", step.name)
+                self._checkpoint.discard(step.name)
+                continue
+            results[step.name] = result
+            self._restored.add(step.name)
+            self._timings[step.name] = StepTiming(step.name, 0.0, 0.0)
+            logger.info("Pipeline step %s restored from checkpoint.", step.name)
+        return results
+
+    def _sort_steps(self) -> list[str]:
+        # Topological order: every step comes after the steps it requires.
+        resolved: dict[str, None] = {}
+        unresolved = dict(self._steps)
+        while unresolved:  # pylint: disable=while-used
+            ready = [
+                name
+                for name, step in unresolved.items()
+                if resolved.keys() >= set(step.requires)
+            ]
+            if not ready:
+                raise ValueError(f"Pipeline has a dependency cycle: {set(unresolved)}")
+            for name in ready:
+                resolved[name] = None
+                del unresolved[name]
+        return list(resolved)
+
+
+def _run_step(
+    step: Step, requirements: StepResults, outcomes: "Queue[StepOutcome]"
+) -> None:
+    started_at = time.monotonic()
+    try:
+        result = step.func(requirements)
+    except Exception as error:  # pylint: disable=broad-except
+        outcomes.put(StepOutcome(step, started_at, time.monotonic(), error=error))
+        return
+    outcomes.put(StepOutcome(step, started_at, time.monotonic(), result))
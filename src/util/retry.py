@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import os
+import subprocess
+import threading
+from collections.abc import Awaitable, Callable, Iterator
+from dataclasses import dataclass
+from enum import Enum
+from itertools import count
+from typing import Optional, TypeVar
+
+from src.util.metrics import metrics
+from src.util.util import run_cmd
+from src.util.wait import SYSTEM_CLOCK, Backoff, Clock
+
+logger = logging.getLogger()
+
+T = TypeVar("T")
+
+
+class Operation(Enum):
+    CREATE = "create"
+    DELETE = "delete"
+    LIST = "list"
+    READ = "read"
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = 3
+    backoff: Backoff = Backoff(initial=2, maximum=30)
+    # Non-idempotent commands are only retried when they were surely not applied.
+    idempotent: bool = True
+    max_timeout: float = 120
+    timeout: float = 10
+
+    def __post_init__(self) -> None:
+        if self.attempts < 1 or self.timeout <= 0 or self.max_timeout < self.timeout:
+            raise ValueError("Attempts and timeouts must be positive and ordered.")
+
+    def timeouts(self) -> Iterator[float]:
+        # Every attempt gets twice the time of the previous one: a slow API
+        # is given more time instead of being hit again with the same deadline.
+        timeout = self.timeout
+        for _ in count():
+            yield timeout
+            timeout = min(timeout * 2, self.max_timeout)
+
+
+DEFAULT_POLICIES = {
+    Operation.CREATE: RetryPolicy(attempts=3, idempotent=False, timeout=60),
+    Operation.DELETE: RetryPolicy(attempts=4, timeout=30),
+    Operation.LIST: RetryPolicy(attempts=4, timeout=30),
+    Operation.READ: RetryPolicy(attempts=5, timeout=20),
+}
+
+# Tells whether an error answered by the API is transient, None if the call got no
+# answer (e.g. a timeout or a connection error).
+IsTransient = Callable[[Exception, RetryPolicy], Optional[bool]]
+
+
+class CircuitOpenError(RuntimeError):
+    retry_after: float
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:  # pylint: disable=too-many-instance-attributes
+    # Consecutive transient failures open the circuit: calls fail fast until the
+    # reset timeout elapses, then a single probe call decides whether to close it.
+    _clock: Clock
+    _failure_threshold: int
+    _failures: int = 0
+    _lock: threading.Lock
+    _name: str
+    _opened_at: float = 0.0
+    _probing: bool = False
+    _reset_timeout: float
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60,
+        clock: Clock = SYSTEM_CLOCK,
+    ) -> None:
+        if failure_threshold < 1 or reset_timeout <= 0:
+            raise ValueError("Failure threshold and reset timeout must be positive.")
+        self._clock = clock
+        self._failure_threshold = failure_threshold
+        self._lock = threading.Lock()
+        self._name = name
+        self._reset_timeout = reset_timeout
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._failures < self._failure_threshold:
+                return
+            retry_after = (
+                self._opened_at + self._reset_timeout - self._clock.monotonic()
+            )
+            if retry_after <= 0 and not self._probing:
+                self._probing = True
+                logger.info("Circuit %s half-open, probing...", self._name)
+                return
+        raise CircuitOpenError(f"Circuit {self._name} is open.", max(retry_after, 1.0))
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures == self._failure_threshold:
+                self._opened_at = self._clock.monotonic()
+                self._probing = False
+                metrics.increment("circuit_breaker", f"{self._name}:open")
+                logger.warning(
+                    "Circuit %s open for %.0f seconds after %d failures.",
+                    self._name,
+                    self._reset_timeout,
+                    self._failures,
+                )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._failures >= self._failure_threshold:
+                logger.info("Circuit %s closed.", self._name)
+            self._failures = 0
+            self._probing = False
+
+
+@dataclass(frozen=True)
+class _Retrier:
+    name: str
+    policy: RetryPolicy
+    is_transient: IsTransient
+    breaker: CircuitBreaker
+    delays: Iterator[float]
+
+    def attempts(self) -> Iterator[tuple[int, float]]:
+        return zip(range(1, self.policy.attempts + 1), self.policy.timeouts())
+
+    def failed(self, error: Exception, attempt: int, timeout: float) -> Optional[float]:
+        # Returns the delay before the next attempt, None to give up.
+        outcome, retryable, delay = self._classify_failure(error)
+        metrics.increment("call_attempts", f"{self.name}:{outcome}")
+        if not retryable or attempt == self.policy.attempts:
+            return None
+        delay = max(delay, next(self.delays))
+        logger.warning(
+            "%s: %s (attempt %d/%d, timeout %.0fs), retrying in %.1fs.",
+            self.name,
+            outcome,
+            attempt,
+            self.policy.attempts,
+            timeout,
+            delay,
+        )
+        return delay
+
+    def succeeded(self) -> None:
+        self.breaker.record_success()
+        metrics.increment("call_attempts", f"{self.name}:ok")
+
+    def _classify_failure(self, error: Exception) -> tuple[str, bool, float]:
+        if isinstance(error, CircuitOpenError):
+            return "circuit_open", True, error.retry_after
+        if (transient := self.is_transient(error, self.policy)) is None:
+            self.breaker.record_failure()
+            return "unanswered", self.policy.idempotent, 0.0
+        if not transient:
+            # The API answered: a client error says nothing about its health.
+            self.breaker.record_success()
+            return "failed", False, 0.0
+        self.breaker.record_failure()
+        return "transient", True, 0.0
+
+
+def call_with_retry(
+    name: str,
+    call: Callable[[float], T],
+    policy: RetryPolicy,
+    is_transient: IsTransient,
+    breaker: CircuitBreaker,
+    *,
+    clock: Clock = SYSTEM_CLOCK,
+    errors: tuple[type[Exception], ...],
+) -> T:
+    # The call gets the timeout of its attempt: other errors than the given ones
+    # are raised at once.
+    retrier = _Retrier(name, policy, is_transient, breaker, policy.backoff.delays())
+    retried_errors: tuple[type[Exception], ...] = (CircuitOpenError, *errors)
+    for attempt, timeout in retrier.attempts():
+        try:  # pylint: disable=too-many-try-statements
+            breaker.before_call()
+            result = call(timeout)
+        except retried_errors as error:
+            if (delay := retrier.failed(error, attempt, timeout)) is None:
+                raise
+            clock.sleep(delay)
+            continue
+        retrier.succeeded()
+        return result
+    raise RuntimeError(f"{name}: no attempt made.")
+
+
+async def async_call_with_retry(
+    name: str,
+    call: Callable[[float], Awaitable[T]],
+    policy: RetryPolicy,
+    is_transient: IsTransient,
+    breaker: CircuitBreaker,
+    *,
+    errors: tuple[type[Exception], ...],
+) -> T:
+    # Same contract as call_with_retry, for asynchronous calls.
+    retrier = _Retrier(name, policy, is_transient, breaker, policy.backoff.delays())
+    retried_errors: tuple[type[Exception], ...] = (CircuitOpenError, *errors)
+    for attempt, timeout in retrier.attempts():
+        try:  # pylint: disable=too-many-try-statements
+            breaker.before_call()
+            result = await call(timeout)
+        except retried_errors as error:
+            if (delay := retrier.failed(error, attempt, timeout)) is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        retrier.succeeded()
+        return result
+    raise RuntimeError(f"{name}: no attempt made.")
+
+
+def run_cmd_with_retry(
+    cmd: list[str],
+    policy: RetryPolicy,
+    is_transient: Callable[[subprocess.CalledProcessError, RetryPolicy], bool],
+    breaker: CircuitBreaker,
+    clock: Clock = SYSTEM_CLOCK,
+    *,
+    stdin: Optional[str] = None,
+) -> subprocess.CompletedProcess[str]:
+    def is_answered_transient(error: Exception, policy: RetryPolicy) -> Optional[bool]:
+        # Timed out commands got no answer.
+        if isinstance(error, subprocess.CalledProcessError):
+            return is_transient(error, policy)
+        return None
+
+    return call_with_retry(
+        " ".join([os.path.basename(cmd[0])] + cmd[1:2]),
+        lambda timeout: run_cmd(cmd, timeout, stdin),
+        policy,
+        is_answered_transient,
+        breaker,
+        clock=clock,
+        errors=(subprocess.SubprocessError,),
+    )
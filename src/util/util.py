@@ -1,29 +1,80 @@
+import fcntl
+import hashlib
 import json
 import logging
+import os
+import shutil
 import subprocess
-import time
-from collections.abc import Callable
-from functools import wraps
-from logging.config import dictConfig
-from math import ceil
-from typing import Any
-
-import httpx
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+from typing import IO, Any, Optional
+
 from environs import Env
 
+from src.util.metrics import metrics
+
 env = Env()
 env.read_env()
 logger = logging.getLogger()
 
+_DOWNLOAD_ATTEMPTS = 3
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
-def download_file(url: str, file_path: str) -> None:
-    logger.info("Downloading: %s to %s", url, file_path)
-    with open(file_path, "wb") as file:
-        try:
-            response = httpx.get(url, follow_redirects=True)
-        except httpx.RequestError as error:
-            logger.exception("Error requesting %s", repr(error.request.url))
-        file.write(response.content)
+
+def copy_file(src: str, dst: str) -> str:
+    with open(src, "rb") as source_file, _atomic_file(dst) as target_file:
+        shutil.copyfileobj(source_file, target_file)
+    return dst
+
+
+def download_file(url: str, file_path: str, sha256: Optional[str] = None) -> None:
+    # Artifacts are shared across workspaces through a content-addressed cache.
+    cache_dir = os.path.expanduser(
+        env("ARTIFACT_CACHE_DIR", default="~/.cache/ocs-osd-ci")
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_file = os.path.join(
+        cache_dir, sha256 or hashlib.sha256(url.encode("utf-8")).hexdigest()
+    )
+    with file_lock(cached_file):
+        if not os.path.exists(cached_file):
+            logger.info("Downloading: %s", url)
+            _download_to_file(url, cached_file, sha256)
+    logger.info("Copying %s to %s", url, file_path)
+    copy_file(cached_file, file_path)
+
+
+def export_metrics(file_prefix: str) -> None:
+    save_to_json_file(f"{file_prefix}.json", metrics.report())
+    # Point METRICS_TEXTFILE to the node-exporter textfile collector directory.
+    save_to_file(
+        env("METRICS_TEXTFILE", default=f"{file_prefix}.prom"), metrics.to_prometheus()
+    )
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(_DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def file_lock(file_path: str) -> Iterator[None]:
+    # Serializes access to a file across threads and processes.
+    with open(f"{file_path}.lock", mode="w", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def format_table(rows: Sequence[Sequence[str]]) -> str:
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
 
 
 def get_file_content(file_path: str) -> str:
@@ -31,23 +82,31 @@ def get_file_content(file_path: str) -> str:
         return file.read()
 
 
-def run_cmd(cmd: list[str]) -> subprocess.CompletedProcess[str]:
+def run_cmd(
+    cmd: list[str], timeout: float = 10, stdin: Optional[str] = None
+) -> subprocess.CompletedProcess[str]:
     logger.info(cmd)
-    try:
-        completed_process = subprocess.run(
-            cmd, check=True, text=True, capture_output=True, timeout=10
-        )
-    except subprocess.CalledProcessError as error:
-        logger.debug("Command failed:\n%s", error.stderr, exc_info=True)
-        raise
+    with metrics.stage(" ".join([os.path.basename(cmd[0])] + cmd[1:2]), "subprocess"):
+        try:
+            completed_process = subprocess.run(
+                cmd,
+                check=True,
+                text=True,
+                capture_output=True,
+                input=stdin,
+                timeout=timeout,
+            )
+        except subprocess.CalledProcessError as error:
+            logger.debug("Command failed:\n%s", error.stderr, exc_info=True)
+            raise
     if completed_process.stdout:
-        logger.debug(completed_process.stdout)
+        logger.debug("Command output:\n%s", completed_process.stdout)
     return completed_process
 
 
 def save_to_file(file_path: str, body: str) -> str:
-    with open(file_path, encoding="utf-8", mode="w") as file:
-        file.write(body)
+    with _atomic_file(file_path) as file:
+        file.write(body.encode("utf-8"))
     return file_path
 
 
@@ -55,53 +114,55 @@ def save_to_json_file(file_path: str, body: dict[str, Any]) -> str:
     return save_to_file(file_path, json.dumps(body, indent=2))
 
 
-def setup_logging() -> None:
-    dictConfig(
-        {
-            "version": 1,
-            "formatters": {
-                "BASE_FORMAT": {
-                    "format": " %(asctime)s [%(levelname)s] %(message)s",
-                },
-                "FILE_FORMAT": {
-                    "format": " %(asctime)s [%(levelname)s] %(filename)s %(message)s",
-                },
-            },
-            "handlers": {
-                "cli": {
-                    "class": "logging.StreamHandler",
-                    "level": "INFO",
-                    "formatter": "BASE_FORMAT",
-                },
-                "file": {
-                    "class": "logging.FileHandler",
-                    "level": "DEBUG",
-                    "formatter": "FILE_FORMAT",
-                    "filename": env("LOG_FILE", default="test-output.log"),
-                    "mode": "w+",
-                },
-            },
-            "root": {"level": "DEBUG", "handlers": ["cli", "file"]},
-        }
-    )
-
-
-def wait_for(timeout: int = 5400, check_period: int = 300) -> Callable[[Any], Any]:
-    if timeout <= 0 or check_period <= 0:
-        raise ValueError("Timeout and check period must be positive integers.")
+@contextmanager
+def _atomic_file(file_path: str) -> Iterator[IO[bytes]]:
+    # Readers never see partial content: write to a private temp file and rename.
+    with NamedTemporaryFile(
+        dir=os.path.dirname(os.path.abspath(file_path)), delete=False
+    ) as tmp_file:
+        try:
+            yield tmp_file
+        except BaseException:
+            os.remove(tmp_file.name)
+            raise
+    os.replace(tmp_file.name, file_path)
 
-    def inner(func: Callable[[Any], Any]) -> Callable[[Any], Any]:
-        @wraps(func)
-        def wrapper(*args: Any, **kwargs: Any) -> None:
-            for _ in range(ceil(timeout / check_period)):
-                check_start = time.time()
-                if func(*args, **kwargs):
-                    return
-                check_duration = time.time() - check_start
-                if check_period > check_duration:
-                    time.sleep(check_period - check_duration)
-            raise RuntimeError("Timeout while waiting for condition to be met.")
 
-        return wrapper
+def _download_to_file(url: str, file_path: str, sha256: Optional[str]) -> None:
+    import httpx
 
-    return inner
+    partial_file = f"{file_path}.part"
+    for attempt in range(1, _DOWNLOAD_ATTEMPTS + 1):
+        try:
+            _stream_to_file(url, partial_file)
+        except httpx.TransportError:
+            if attempt == _DOWNLOAD_ATTEMPTS:
+                raise
+            logger.warning("Download of %s interrupted, resuming...", url)
+            continue
+        break
+    if sha256 and (checksum := file_sha256(partial_file)) != sha256:
+        os.remove(partial_file)
+        raise ValueError(f"Checksum mismatch for {url}: {checksum} != {sha256}")
+    os.replace(partial_file, file_path)
+
+
+def _stream_to_file(url: str, file_path: str) -> None:
+    import httpx
+
+    offset = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with httpx.stream(
+        "GET", url, headers=headers, follow_redirects=True, timeout=60
+    ) as response:
+        if (
+            offset
+            and response.status_code == httpx.codes.REQUESTED_RANGE_NOT_SATISFIABLE
+        ):
+            # The partial file is already complete.
+            return
+        response.raise_for_status()
+        mode = "ab" if response.status_code == httpx.codes.PARTIAL_CONTENT else "wb"
+        with open(file_path, mode) as file:
+            for chunk in response.iter_bytes(_DOWNLOAD_CHUNK_SIZE):
+                file.write(chunk)
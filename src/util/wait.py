@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import random
+import time
+from collections.abc import AsyncIterable, Awaitable, Callable, Iterable, Iterator
+from dataclasses import dataclass
+from itertools import count
+from typing import Protocol
+
+from src.util.metrics import metrics
+
+logger = logging.getLogger()
+
+
+class WaitTimeoutError(RuntimeError):
+    pass
+
+
+class WatchError(Exception):
+    pass
+
+
+class Clock(Protocol):
+    def monotonic(self) -> float:
+        ...
+
+    def sleep(self, seconds: float) -> None:
+        ...
+
+
+class SystemClock:
+    @staticmethod
+    def monotonic() -> float:
+        return time.monotonic()
+
+    @staticmethod
+    def sleep(seconds: float) -> None:
+        time.sleep(seconds)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+@dataclass(frozen=True)
+class Backoff:
+    initial: float = 5
+    factor: float = 2
+    maximum: float = 60
+    jitter: float = 0.2
+
+    def __post_init__(self) -> None:
+        if self.initial <= 0 or self.maximum < self.initial:
+            raise ValueError("Backoff periods must be positive and ordered.")
+        if self.factor < 1 or not 0 <= self.jitter < 1:
+            raise ValueError("Backoff factor must be >= 1 and jitter in [0, 1).")
+
+    def delays(self) -> Iterator[float]:
+        period = self.initial
+        for _ in count():
+            yield period * random.uniform(1 - self.jitter, 1 + self.jitter)
+            period = min(period * self.factor, self.maximum)
+
+
+class Deadline:
+    _clock: Clock
+    _expires_at: float
+
+    def __init__(self, timeout: float, clock: Clock = SYSTEM_CLOCK) -> None:
+        if timeout <= 0:
+            raise ValueError("Timeout must be a positive number.")
+        self._clock = clock
+        self._expires_at = clock.monotonic() + timeout
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - self._clock.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return not self.remaining
+
+    def sleep(self, seconds: float) -> None:
+        self._clock.sleep(min(seconds, self.remaining))
+
+
+async def async_poll_until(
+    check: Callable[[], Awaitable[bool]],
+    timeout: float = 5400,
+    backoff: Backoff = Backoff(),
+    clock: Clock = SYSTEM_CLOCK,
+) -> None:
+    deadline = Deadline(timeout, clock)
+    for delay in backoff.delays():
+        metrics.increment("poll_attempts", check.__qualname__)
+        if await check():
+            return
+        if deadline.expired:
+            break
+        await asyncio.sleep(min(delay, deadline.remaining))
+    raise WaitTimeoutError("Timeout while waiting for condition to be met.")
+
+
+async def async_watch_until(
+    watch: Callable[[int], AsyncIterable[bool]],
+    timeout: float = 5400,
+    reconnect_backoff: Backoff = Backoff(initial=1, maximum=30),
+    clock: Clock = SYSTEM_CLOCK,
+) -> None:
+    # Same contract as watch_until, for asynchronous watch sources.
+    deadline = Deadline(timeout, clock)
+    reconnect_delays = reconnect_backoff.delays()
+    while not deadline.expired:  # pylint: disable=while-used
+        metrics.increment("watch_connections", watch.__qualname__)
+        condition_met, received_events = False, False
+        try:
+            condition_met, received_events = await _consume_async_watch(
+                watch(max(1, int(deadline.remaining))), deadline
+            )
+        except WatchError:
+            logger.debug("Watch stream interrupted, reconnecting...", exc_info=True)
+        if condition_met:
+            return
+        if received_events:
+            reconnect_delays = reconnect_backoff.delays()
+        await asyncio.sleep(min(next(reconnect_delays), deadline.remaining))
+    raise WaitTimeoutError("Timeout while waiting for condition to be met.")
+
+
+def poll_until(
+    check: Callable[[], bool],
+    timeout: float = 5400,
+    backoff: Backoff = Backoff(),
+    clock: Clock = SYSTEM_CLOCK,
+) -> None:
+    deadline = Deadline(timeout, clock)
+    for delay in backoff.delays():
+        metrics.increment("poll_attempts", check.__qualname__)
+        if check():
+            return
+        if deadline.expired:
+            break
+        deadline.sleep(delay)
+    raise WaitTimeoutError("Timeout while waiting for condition to be met.")
+
+
+def watch_until(
+    watch: Callable[[int], Iterable[bool]],
+    timeout: float = 5400,
+    reconnect_backoff: Backoff = Backoff(initial=1, maximum=30),
+    clock: Clock = SYSTEM_CLOCK,
+) -> None:
+    # The watch source receives the remaining seconds as server-side timeout and
+    # yields whether the condition is met after every event it processes.
+    deadline = Deadline(timeout, clock)
+    reconnect_delays = reconnect_backoff.delays()
+    while not deadline.expired:  # pylint: disable=while-used
+        metrics.increment("watch_connections", watch.__qualname__)
+        condition_met, received_events = False, False
+        try:
+            condition_met, received_events = _consume_watch(
+                watch(max(1, int(deadline.remaining))), deadline
+            )
+        except WatchError:
+            logger.debug("Watch stream interrupted, reconnecting...", exc_info=True)
+        if condition_met:
+            return
+        if received_events:
+            reconnect_delays = reconnect_backoff.delays()
+        deadline.sleep(next(reconnect_delays))
+    raise WaitTimeoutError("Timeout while waiting for condition to be met.")
+
+
+async def _consume_async_watch(
+    events: AsyncIterable[bool], deadline: Deadline
+) -> tuple[bool, bool]:
+    received_events = False
+    async for condition_met in events:
+        if condition_met:
+            return True, True
+        received_events = True
+        if deadline.expired:
+            break
+    return False, received_events
+
+
+def _consume_watch(events: Iterable[bool], deadline: Deadline) -> tuple[bool, bool]:
+    received_events = False
+    for condition_met in events:
+        if condition_met:
+            return True, True
+        received_events = True
+        if deadline.expired:
+            break
+    return False, received_events
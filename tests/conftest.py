@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+from typing import Any
+
+import pytest
+
+
+class FakeClock:
+    # Sleeping only moves the time forward: waits run instantly.
+    now: float
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += max(seconds, 0)
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+FAKE_OCM_SCRIPT = """#!{python}
+import fcntl, json, os, sys
+
+# Answers each "METHOD PATH" with the next scripted response, 404 when none left.
+fake_dir = os.environ["FAKE_OCM_DIR"]
+method, path = sys.argv[1].upper(), sys.argv[2]
+key = f"{{method}} {{path}}"
+with open(f"{{fake_dir}}/state.json", "r+", encoding="utf-8") as state_file:
+    fcntl.flock(state_file, fcntl.LOCK_EX)
+    state = json.load(state_file)
+    responses = state["script"].get(key, [])
+    index = state["calls"].count(key)
+    state["calls"].append(key)
+    state["stdin"].append(sys.stdin.read() if method == "POST" else "")
+    state_file.seek(0)
+    state_file.truncate()
+    json.dump(state, state_file)
+response = responses[min(index, len(responses) - 1)] if responses else {{"status": 404}}
+if "status" in response:
+    sys.stderr.write(json.dumps({{"kind": "Error", "id": str(response["status"])}}))
+    sys.exit(1)
+print(json.dumps(response.get("body", {{}})))
+"""
+
+
+class FakeOcmBinary:
+    # An ocm executable on PATH that replays scripted responses and records calls.
+    _fake_dir: str
+
+    def __init__(self, fake_dir: str) -> None:
+        self._fake_dir = fake_dir
+        self.script({})
+
+    @property
+    def calls(self) -> list[str]:
+        return self._get_state()["calls"]
+
+    @property
+    def stdin(self) -> list[str]:
+        return self._get_state()["stdin"]
+
+    def script(self, responses: dict[str, list[dict[str, Any]]]) -> None:
+        with open(f"{self._fake_dir}/state.json", "w", encoding="utf-8") as state_file:
+            json.dump({"script": responses, "calls": [], "stdin": []}, state_file)
+
+    def _get_state(self) -> dict[str, Any]:
+        with open(f"{self._fake_dir}/state.json", encoding="utf-8") as state_file:
+            return json.load(state_file)
+
+
+@pytest.fixture
+def fake_ocm(tmp_path: Any, monkeypatch: Any) -> FakeOcmBinary:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ocm_file = bin_dir / "ocm"
+    ocm_file.write_text(FAKE_OCM_SCRIPT.format(python=sys.executable))
+    ocm_file.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_OCM_DIR", str(tmp_path))
+    return FakeOcmBinary(str(tmp_path))
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Optional
+
+import pytest
+
+from src.platform.ocm import OcmCli
+from src.service.async_cluster import AsyncClusterService
+from src.service.cluster import CLUSTERS_API_PATH, ClusterService
+
+
+class FakeAsyncOcm:
+    closed = False
+    paths: list[str]
+
+    def __init__(self) -> None:
+        self.paths = []
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+    async def get(
+        self, path: str, params: Optional[dict[str, str]] = None
+    ) -> dict[str, Any]:
+        self.paths.append(path)
+        return {"name": "ci-test", "status": {"state": "error"}}
+
+
+def create_cluster_service(tmp_path: Any, clock: Any) -> ClusterService:
+    return ClusterService(
+        data_dir=str(tmp_path), run_id="test", ocm_backend=OcmCli(clock), clock=clock
+    )
+
+
+async def wait_for_cluster_ready(async_cluster_service: AsyncClusterService) -> None:
+    async with async_cluster_service:
+        await async_cluster_service.wait_for_cluster_ready("c1", timeout=60)
+
+
+def test_cluster_state_is_read_through_the_configured_backend(
+    tmp_path: Any, clock: Any, fake_ocm: Any
+) -> None:
+    fake_ocm.script(
+        {
+            f"GET {CLUSTERS_API_PATH}/c1": [
+                {"body": {"name": "ci-test", "status": {"state": "error"}}}
+            ]
+        }
+    )
+    async_cluster_service = AsyncClusterService(create_cluster_service(tmp_path, clock))
+
+    with pytest.raises(ValueError, match="error state"):
+        asyncio.run(wait_for_cluster_ready(async_cluster_service))
+
+    assert fake_ocm.calls == [f"GET {CLUSTERS_API_PATH}/c1"]
+
+
+def test_cluster_state_is_read_through_the_injected_backend(
+    tmp_path: Any, clock: Any, fake_ocm: Any
+) -> None:
+    ocm_backend = FakeAsyncOcm()
+    async_cluster_service = AsyncClusterService(
+        create_cluster_service(tmp_path, clock), ocm_backend
+    )
+
+    with pytest.raises(ValueError, match="error state"):
+        asyncio.run(wait_for_cluster_ready(async_cluster_service))
+
+    assert ocm_backend.paths == [f"{CLUSTERS_API_PATH}/c1"]
+    assert ocm_backend.closed
+    assert fake_ocm.calls == []
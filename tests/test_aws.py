@@ -0,0 +1,210 @@
+from collections.abc import Iterator
+from typing import Any
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from src.service.aws import AWSService, SubnetRole
+
+WORKER_SG_FILTERS = [
+    {"Name": "tag:Name", "Values": ["p1-*-worker-sg", "p2-*-worker-sg"]}
+]
+
+
+@pytest.fixture(name="ec2_client")
+def fixture_ec2_client() -> Any:
+    return boto3.session.Session(
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        region_name="us-east-1",
+    ).client("ec2")
+
+
+@pytest.fixture(name="stubber")
+def fixture_stubber(ec2_client: Any) -> Iterator[Stubber]:
+    with Stubber(ec2_client) as stubber:
+        # The canary check of the first use.
+        stubber.add_response("describe_regions", {"Regions": []})
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def create_ip_permissions(*ports: int) -> list[Any]:
+    return [
+        rule.to_ip_permission()
+        for rule in AWSService._provider_addon_inbound_rules
+        if rule.from_port in ports
+    ]
+
+
+def create_security_group(
+    group_id: str, cluster_name: str, ports: tuple[int, ...] = ()
+) -> dict[str, Any]:
+    return {
+        "GroupId": group_id,
+        "Tags": [{"Key": "Name", "Value": f"{cluster_name}-x1y2z-worker-sg"}],
+        "IpPermissions": create_ip_permissions(*ports),
+    }
+
+
+def test_inbound_rules_are_added_to_every_page_of_security_groups(
+    ec2_client: Any, stubber: Stubber
+) -> None:
+    stubber.add_response(
+        "describe_security_groups",
+        {
+            "SecurityGroups": [create_security_group("sg-1", "p1", (6800, 3300))],
+            "NextToken": "page-2",
+        },
+        {"Filters": WORKER_SG_FILTERS},
+    )
+    stubber.add_response(
+        "describe_security_groups",
+        {"SecurityGroups": [create_security_group("sg-2", "p2")]},
+        {"Filters": WORKER_SG_FILTERS, "NextToken": "page-2"},
+    )
+    stubber.add_response(
+        "authorize_security_group_ingress",
+        {"Return": True},
+        {"GroupId": "sg-1", "IpPermissions": create_ip_permissions(6789, 9283, 31659)},
+    )
+    stubber.add_response(
+        "authorize_security_group_ingress",
+        {"Return": True},
+        {
+            "GroupId": "sg-2",
+            "IpPermissions": create_ip_permissions(6800, 3300, 6789, 9283, 31659),
+        },
+    )
+
+    assert AWSService(ec2_client).add_provider_addon_inbound_rules("p1", "p2") == 8
+
+
+def test_inbound_rules_are_not_added_again(ec2_client: Any, stubber: Stubber) -> None:
+    all_ports = (6800, 3300, 6789, 9283, 31659)
+    stubber.add_response(
+        "describe_security_groups",
+        {
+            "SecurityGroups": [
+                create_security_group("sg-1", "p1", all_ports),
+                create_security_group("sg-2", "p2", all_ports),
+            ]
+        },
+        {"Filters": WORKER_SG_FILTERS},
+    )
+
+    assert AWSService(ec2_client).add_provider_addon_inbound_rules("p1", "p2") == 0
+
+
+def test_inbound_rules_missing_security_group_is_an_error(
+    ec2_client: Any, stubber: Stubber
+) -> None:
+    stubber.add_response(
+        "describe_security_groups",
+        {"SecurityGroups": [create_security_group("sg-1", "p1")]},
+        {"Filters": WORKER_SG_FILTERS},
+    )
+
+    with pytest.raises(RuntimeError, match="p2"):
+        AWSService(ec2_client).add_provider_addon_inbound_rules("p1", "p2")
+
+
+def test_duplicate_inbound_rules_are_retried_with_the_remaining_rules(
+    ec2_client: Any, stubber: Stubber
+) -> None:
+    stubber.add_response(
+        "describe_security_groups",
+        {"SecurityGroups": [create_security_group("sg-1", "p1")]},
+        {"Filters": [{"Name": "tag:Name", "Values": ["p1-*-worker-sg"]}]},
+    )
+    stubber.add_client_error(
+        "authorize_security_group_ingress",
+        service_error_code="InvalidPermission.Duplicate",
+        expected_params={
+            "GroupId": "sg-1",
+            "IpPermissions": create_ip_permissions(6800, 3300, 6789, 9283, 31659),
+        },
+    )
+    # A concurrent reconciler added the Ceph rules in the meantime.
+    stubber.add_response(
+        "describe_security_groups",
+        {"SecurityGroups": [create_security_group("sg-1", "p1", (6800, 3300, 6789))]},
+        {"GroupIds": ["sg-1"]},
+    )
+    stubber.add_response(
+        "authorize_security_group_ingress",
+        {"Return": True},
+        {"GroupId": "sg-1", "IpPermissions": create_ip_permissions(9283, 31659)},
+    )
+
+    assert AWSService(ec2_client).add_provider_addon_inbound_rules("p1") == 2
+
+
+def test_duplicate_inbound_rules_give_up_after_their_attempts(
+    ec2_client: Any, stubber: Stubber
+) -> None:
+    stubber.add_response(
+        "describe_security_groups",
+        {"SecurityGroups": [create_security_group("sg-1", "p1")]},
+        {"Filters": [{"Name": "tag:Name", "Values": ["p1-*-worker-sg"]}]},
+    )
+    for attempt in range(1, AWSService._authorize_attempts + 1):
+        stubber.add_client_error(
+            "authorize_security_group_ingress",
+            service_error_code="InvalidPermission.Duplicate",
+        )
+        if attempt < AWSService._authorize_attempts:
+            stubber.add_response(
+                "describe_security_groups",
+                {"SecurityGroups": [create_security_group("sg-1", "p1")]},
+                {"GroupIds": ["sg-1"]},
+            )
+
+    with pytest.raises(ClientError):
+        AWSService(ec2_client).add_provider_addon_inbound_rules("p1")
+
+
+def test_subnets_are_discovered_across_pages(ec2_client: Any, stubber: Stubber) -> None:
+    subnet_filters = [{"Name": "tag:Name", "Values": ["p1-*"]}]
+    stubber.add_response(
+        "describe_subnets",
+        {
+            "Subnets": [
+                {
+                    "AvailabilityZone": "us-east-1a",
+                    "SubnetId": "subnet-1",
+                    "Tags": [{"Key": "Name", "Value": "p1-x1y2z-public-us-east-1a"}],
+                    "VpcId": "vpc-1",
+                }
+            ],
+            "NextToken": "page-2",
+        },
+        {"Filters": subnet_filters},
+    )
+    stubber.add_response(
+        "describe_subnets",
+        {
+            "Subnets": [
+                {
+                    "AvailabilityZone": "us-east-1a",
+                    "SubnetId": "subnet-2",
+                    "Tags": [{"Key": "Name", "Value": "p1-x1y2z-private-us-east-1a"}],
+                    "VpcId": "vpc-1",
+                }
+            ]
+        },
+        {"Filters": subnet_filters, "NextToken": "page-2"},
+    )
+    aws_service = AWSService(ec2_client)
+
+    subnets_info = aws_service.get_subnets_info("p1")
+
+    assert subnets_info.complete
+    assert [subnet.role for subnet in subnets_info.subnets] == [
+        SubnetRole.PUBLIC,
+        SubnetRole.PRIVATE,
+    ]
+    # Complete subnets are cached: no further describe call is stubbed.
+    assert aws_service.get_subnets_info("p1") == subnets_info
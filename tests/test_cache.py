@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from src.util.cache import TTLCache
+
+
+def test_values_of_different_keys_are_created_concurrently() -> None:
+    cache: TTLCache[str, str] = TTLCache(maxsize=4, ttl=60)
+    # Both factories must run at the same time to get past the barrier.
+    barrier = threading.Barrier(2, timeout=5)
+
+    def create(key: str) -> str:
+        barrier.wait()
+        return f"client-{key}"
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        values = list(
+            executor.map(
+                lambda key: cache.get_or_create(key, lambda: create(key)), ["c1", "c2"]
+            )
+        )
+
+    assert values == ["client-c1", "client-c2"]
+
+
+def test_value_of_a_key_is_created_once() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=4, ttl=60)
+    created: list[int] = []
+
+    def create() -> int:
+        created.append(len(created))
+        return created[-1]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        values = list(
+            executor.map(lambda _: cache.get_or_create("c1", create), range(8))
+        )
+
+    assert values == [0] * 8
+    assert created == [0]
+
+
+def test_values_leaving_the_cache_are_evicted(clock: Any) -> None:
+    evicted: list[str] = []
+    cache: TTLCache[str, str] = TTLCache(
+        maxsize=2, ttl=60, clock=clock, on_evict=evicted.append
+    )
+    cache.set("c1", "v1")
+    cache.set("c2", "v2")
+    cache.set("c3", "v3")
+    cache.discard("c2")
+    clock.sleep(60)
+
+    assert cache.get("c3") is None
+    assert evicted == ["v1", "v2", "v3"]
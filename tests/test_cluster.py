@@ -0,0 +1,154 @@
+import json
+from typing import Any, Optional
+
+import pytest
+
+from src.platform.kube import KubeClient
+from src.service.cluster import ClusterService
+from src.service.ledger import ClusterRecord, ClusterRole
+from src.util.wait import WaitTimeoutError
+
+
+class FakeResponse:
+    data: bytes
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def close(self) -> None:
+        pass
+
+    def release_conn(self) -> None:
+        pass
+
+    def stream(self, **_: Any) -> list[bytes]:
+        return [self.data]
+
+
+class FakeCoreV1Api:
+    # Lists the nodes at resource version 7, whose watch streams the given events.
+    calls: list[tuple[bool, Optional[str]]]
+    events: list[dict[str, Any]]
+    nodes: list[dict[str, Any]]
+
+    def __init__(
+        self, nodes: list[dict[str, Any]], events: list[dict[str, Any]]
+    ) -> None:
+        self.calls = []
+        self.events = events
+        self.nodes = nodes
+
+    def list_node(
+        self,
+        watch: bool = False,
+        resource_version: Optional[str] = None,
+        **_: Any,
+    ) -> FakeResponse:
+        self.calls.append((watch, resource_version))
+        if watch:
+            # Without a resource version, the API server first sends every node.
+            events = self.events
+            if resource_version is None:
+                events = [{"type": "ADDED", "object": item} for item in self.nodes]
+            return FakeResponse(
+                "".join(f"{json.dumps(event)}\n" for event in events).encode()
+            )
+        return FakeResponse(
+            json.dumps(
+                {"metadata": {"resourceVersion": "7"}, "items": self.nodes}
+            ).encode()
+        )
+
+
+class FakeOcm:
+    def get(self, path: str, params: Optional[dict[str, str]] = None) -> Any:
+        return {
+            "items": [{"id": "c1", "name": "ci-test", "status": {"state": "ready"}}],
+            "total": 1,
+        }
+
+
+def node(name: str, ready: bool) -> dict[str, Any]:
+    return {
+        "metadata": {"name": name},
+        "status": {"conditions": [{"type": "Ready", "status": str(ready)}]},
+    }
+
+
+def create_cluster_service(
+    tmp_path: Any, clock: Any, monkeypatch: Any, core_v1_api: FakeCoreV1Api
+) -> ClusterService:
+    kube_client = object.__new__(KubeClient)
+    kube_client._core_v1_api = core_v1_api
+    cluster_service = ClusterService(
+        data_dir=str(tmp_path), run_id="test", ocm_backend=FakeOcm(), clock=clock
+    )
+    monkeypatch.setattr(
+        cluster_service, "_get_kube_client", lambda cluster_id: kube_client
+    )
+    return cluster_service
+
+
+def test_watch_nodes_statuses_starts_from_the_full_list() -> None:
+    core_v1_api = FakeCoreV1Api(
+        [node("n1", True), node("n2", False)],
+        [{"type": "MODIFIED", "object": node("n2", True)}],
+    )
+    kube_client = object.__new__(KubeClient)
+    kube_client._core_v1_api = core_v1_api
+
+    assert [dict(statuses) for statuses in kube_client.watch_nodes_statuses(60)] == [
+        {"n1": True, "n2": False},
+        {"n1": True, "n2": True},
+    ]
+    assert core_v1_api.calls == [(False, None), (True, "7")]
+
+
+def test_wait_for_cluster_ready_waits_for_every_node(
+    tmp_path: Any, clock: Any, monkeypatch: Any
+) -> None:
+    # The first node is Ready, the second one is not: watching from scratch, the
+    # ADDED event of the first node alone made the cluster look ready.
+    core_v1_api = FakeCoreV1Api([node("n1", True), node("n2", False)], [])
+    cluster_service = create_cluster_service(tmp_path, clock, monkeypatch, core_v1_api)
+
+    with pytest.raises(WaitTimeoutError):
+        cluster_service.wait_for_cluster_ready("c1", timeout=120)
+    assert all(
+        resource_version == "7"
+        for watch, resource_version in core_v1_api.calls
+        if watch
+    )
+
+
+def test_wait_for_cluster_ready_returns_once_every_node_is_ready(
+    tmp_path: Any, clock: Any, monkeypatch: Any
+) -> None:
+    core_v1_api = FakeCoreV1Api(
+        [node("n1", True), node("n2", False)],
+        [{"type": "MODIFIED", "object": node("n2", True)}],
+    )
+    cluster_service = create_cluster_service(tmp_path, clock, monkeypatch, core_v1_api)
+    started_at = clock.now
+
+    cluster_service.wait_for_cluster_ready("c1", timeout=120)
+
+    assert core_v1_api.calls == [(False, None), (True, "7")]
+    assert clock.now == started_at
+
+
+def test_snapshot_leaves_the_ledger_alone_until_the_cluster_is_ready(
+    tmp_path: Any, clock: Any, monkeypatch: Any
+) -> None:
+    core_v1_api = FakeCoreV1Api([node("n1", True)], [])
+    cluster_service = create_cluster_service(tmp_path, clock, monkeypatch, core_v1_api)
+    record = ClusterRecord("c1", "ci-test", ClusterRole.PROVIDER.value, "test")
+    cluster_service._ledger.add(record)
+    (record,) = cluster_service._ledger.find()
+
+    assert cluster_service.snapshot(["c1", "c2"], include_kube=False)
+    assert cluster_service._ledger.find() == [record]
+
+    cluster_service.wait_for_cluster_ready("c1", timeout=120)
+
+    assert [record.state for record in cluster_service._ledger.find()] == ["ready"]
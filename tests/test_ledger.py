@@ -0,0 +1,36 @@
+import dbm
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from src.service.ledger import ClusterLedger, ClusterRecord, ClusterRole
+
+
+def to_record(cluster_id: str, cluster_name: bytes) -> ClusterRecord:
+    return ClusterRecord(cluster_id, cluster_name.decode(), ClusterRole.UNKNOWN.value)
+
+
+def test_dbm_store_is_imported_once_by_concurrent_processes(tmp_path: Any) -> None:
+    dbm_file = f"{tmp_path}/cluster_store.db"
+    with dbm.open(dbm_file, "c") as store:
+        for index in range(20):
+            store[f"c{index}"] = f"ci-{index}"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        imported = list(
+            executor.map(
+                lambda _: ClusterLedger(f"{tmp_path}/cluster_ledger.db").import_dbm(
+                    dbm_file, to_record
+                ),
+                range(4),
+            )
+        )
+
+    assert sorted(imported) == [0, 0, 0, 20]
+    assert len(ClusterLedger(f"{tmp_path}/cluster_ledger.db").find()) == 20
+    assert not dbm.whichdb(dbm_file)
+    assert [
+        file_name
+        for file_name in os.listdir(tmp_path)
+        if file_name.startswith("cluster_store.db")
+    ] == ["cluster_store.db.lock"]
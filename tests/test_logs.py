@@ -0,0 +1,41 @@
+import logging
+import queue
+import threading
+from typing import Any
+
+from src.util.logs import ContextQueueHandler, SanitizingQueueListener
+
+
+class CapturingHandler(logging.Handler):
+    records: list[tuple[str, str]]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append((threading.current_thread().name, record.getMessage()))
+
+
+def test_records_are_redacted_in_the_listener_thread() -> None:
+    log_queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+    handler = CapturingHandler()
+    listener = SanitizingQueueListener(log_queue, handler)
+    logger = logging.getLogger("test_logs")
+    logger.propagate = False
+    logger.addHandler(ContextQueueHandler(log_queue))
+
+    logger.warning("Calling with %s", "Bearer abc.def")
+    # The logging thread only queues the record, with its arguments merged.
+    record = log_queue.get_nowait()
+    assert record.msg == "Calling with Bearer abc.def"
+    log_queue.put(record)
+    listener.start()
+    listener.stop()
+
+    assert [message for _, message in handler.records] == [
+        "Calling with Bearer [REDACTED]"
+    ]
+    assert all(
+        thread != threading.current_thread().name for thread, _ in handler.records
+    )
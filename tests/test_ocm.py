@@ -0,0 +1,274 @@
+import json
+import subprocess
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src.platform.ocm import OcmCli, OcmClient, OcmError
+from src.service.cluster import CLUSTERS_API_PATH, ClusterService
+from src.util.wait import SYSTEM_CLOCK
+
+
+class StubOcmServer:
+    # Issues access tokens t1, t2... and only accepts the latest one, like an
+    # OCM whose previous token expired.
+    clusters: list[dict[str, Any]]
+    failures: dict[str, list[int]]
+    requests: list[tuple[str, str]]
+    token_status: int
+    tokens_issued: int
+
+    def __init__(self) -> None:
+        self.clusters = []
+        self.failures = {}
+        self.requests = []
+        self.token_status = 200
+        self.tokens_issued = 0
+
+    @property
+    def current_token(self) -> str:
+        return f"t{self.tokens_issued}"
+
+
+def create_handler(stub: StubOcmServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            url = urlparse(self.path)
+            authorization = self.headers.get("Authorization", "")
+            stub.requests.append((url.path, authorization))
+            if not self._authorize(authorization):
+                return
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            page, size = int(params.get("page", "1")), int(params.get("size", "100"))
+            self._send(
+                200,
+                {
+                    "items": stub.clusters[(page - 1) * size : page * size],
+                    "total": len(stub.clusters),
+                },
+            )
+
+        def do_DELETE(self) -> None:  # pylint: disable=invalid-name
+            stub.requests.append((self.path, self.headers.get("Authorization", "")))
+            if self._authorize(self.headers.get("Authorization", "")):
+                self._send(204, {})
+
+        def do_POST(self) -> None:  # pylint: disable=invalid-name
+            self.rfile.read(int(self.headers.get("Content-Length", "0")))
+            if self.path != "/token":
+                stub.requests.append((self.path, self.headers.get("Authorization", "")))
+                if self._authorize(self.headers.get("Authorization", "")):
+                    self._send(201, {"id": "c1"})
+                return
+            stub.requests.append((self.path, "token"))
+            if stub.token_status != 200:
+                self._send(stub.token_status, {"error": "invalid_grant"})
+                return
+            stub.tokens_issued += 1
+            self._send(200, {"access_token": stub.current_token, "expires_in": 900})
+
+        def log_message(self, *_: Any) -> None:
+            pass
+
+        def _authorize(self, authorization: str) -> bool:
+            if authorization != f"Bearer {stub.current_token}":
+                self._send(401, {"kind": "Error", "id": "401"})
+                return False
+            # Scripted failures of the next requests to this method and path.
+            if failures := stub.failures.get(
+                f"{self.command} {urlparse(self.path).path}"
+            ):
+                status = failures.pop(0)
+                self._send(status, {"kind": "Error", "id": str(status)})
+                return False
+            return True
+
+        def _send(self, status: int, body: dict[str, Any]) -> None:
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
+
+
+@pytest.fixture
+def stub_ocm() -> Iterator[tuple[StubOcmServer, str]]:
+    stub = StubOcmServer()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), create_handler(stub))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield stub, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def create_client(url: str, clock: Any = SYSTEM_CLOCK) -> OcmClient:
+    return OcmClient(url, f"{url}/token", "client", "refresh-token", clock=clock)
+
+
+def test_rejected_access_token_is_refreshed_once(
+    stub_ocm: tuple[StubOcmServer, str]
+) -> None:
+    stub, url = stub_ocm
+    client = create_client(url)
+    client.get_access_token()
+    # Another client refreshed the token meanwhile: the cached one is now rejected.
+    stub.tokens_issued += 1
+    stub.requests.clear()
+
+    assert client.get(CLUSTERS_API_PATH) == {"items": [], "total": 0}
+
+    assert stub.requests == [
+        (CLUSTERS_API_PATH, "Bearer t1"),
+        ("/token", "token"),
+        (CLUSTERS_API_PATH, "Bearer t3"),
+    ]
+
+
+def test_access_token_is_refreshed_before_it_expires(
+    stub_ocm: tuple[StubOcmServer, str], clock: Any
+) -> None:
+    stub, url = stub_ocm
+    client = create_client(url, clock)
+
+    assert client.get_access_token() == "t1"
+    clock.now += 900 - 61
+    assert client.get_access_token() == "t1"
+    clock.now += 1
+    assert client.get_access_token() == "t2"
+
+
+def test_failed_token_refresh_raises(stub_ocm: tuple[StubOcmServer, str]) -> None:
+    stub, url = stub_ocm
+    stub.token_status = 400
+
+    with pytest.raises(OcmError) as error:
+        create_client(url).get(CLUSTERS_API_PATH)
+
+    assert error.value.status_code == 400
+
+
+def test_cluster_search_reads_every_page(
+    stub_ocm: tuple[StubOcmServer, str], tmp_path: Any, monkeypatch: Any
+) -> None:
+    stub, url = stub_ocm
+    stub.clusters = [
+        {
+            "id": f"c{index}",
+            "name": f"ci-{index}",
+            "status": {"state": "ready"},
+            "creation_timestamp": "2026-01-02T03:04:05.678Z",
+        }
+        for index in range(5)
+    ]
+    cluster_service = ClusterService(
+        data_dir=str(tmp_path), run_id="test", ocm_backend=create_client(url)
+    )
+    monkeypatch.setattr(cluster_service, "_ocm_page_size", 2)
+
+    clusters = cluster_service.find_clusters(["ci-"])
+
+    assert [cluster.cluster_id for cluster in clusters] == [
+        f"c{index}" for index in range(5)
+    ]
+    assert [path for path, _ in stub.requests].count(CLUSTERS_API_PATH) == 3
+
+
+def test_transient_errors_of_idempotent_requests_are_retried(
+    stub_ocm: tuple[StubOcmServer, str], clock: Any
+) -> None:
+    stub, url = stub_ocm
+    stub.failures = {
+        f"GET {CLUSTERS_API_PATH}": [503, 502],
+        f"DELETE {CLUSTERS_API_PATH}/c1": [500],
+    }
+    client = create_client(url, clock)
+    started_at = clock.now
+
+    assert client.get(CLUSTERS_API_PATH) == {"items": [], "total": 0}
+    client.delete(f"{CLUSTERS_API_PATH}/c1")
+
+    assert [path for path, _ in stub.requests if path != "/token"] == [
+        CLUSTERS_API_PATH
+    ] * 3 + [f"{CLUSTERS_API_PATH}/c1"] * 2
+    assert clock.now > started_at
+
+
+def test_server_errors_of_non_idempotent_requests_are_not_retried(
+    stub_ocm: tuple[StubOcmServer, str], clock: Any
+) -> None:
+    stub, url = stub_ocm
+    stub.failures = {f"POST {CLUSTERS_API_PATH}": [500]}
+
+    with pytest.raises(OcmError) as error:
+        create_client(url, clock).post(CLUSTERS_API_PATH, {"name": "ci-test"})
+
+    assert error.value.status_code == 500
+    assert [path for path, _ in stub.requests if path != "/token"] == [
+        CLUSTERS_API_PATH
+    ]
+
+
+def test_client_errors_are_not_retried(
+    stub_ocm: tuple[StubOcmServer, str], clock: Any
+) -> None:
+    stub, url = stub_ocm
+    stub.failures = {f"DELETE {CLUSTERS_API_PATH}/c1": [404]}
+
+    with pytest.raises(OcmError) as error:
+        create_client(url, clock).delete(f"{CLUSTERS_API_PATH}/c1")
+
+    assert error.value.status_code == 404
+    assert clock.now == 1000.0
+
+
+def test_unanswered_requests_open_the_circuit(
+    stub_ocm: tuple[StubOcmServer, str], clock: Any, monkeypatch: Any
+) -> None:
+    import httpx
+
+    _, url = stub_ocm
+    client = create_client(url, clock)
+    client.get_access_token()
+    attempts: list[str] = []
+
+    def refuse(method: str, *_: Any, **__: Any) -> Any:
+        attempts.append(method)
+        raise httpx.ConnectError("Connection refused")
+
+    monkeypatch.setattr(client._client, "request", refuse)
+
+    with pytest.raises(OcmError) as error:
+        client.get(CLUSTERS_API_PATH)
+    assert error.value.status_code == 0
+    assert attempts == ["GET"] * 5
+
+    # The circuit is open: the POST waits for a single probe, not retried either.
+    started_at = clock.now
+    with pytest.raises(OcmError):
+        client.post(CLUSTERS_API_PATH, {"name": "ci-test"})
+    assert attempts == ["GET"] * 5 + ["POST"]
+    assert clock.now - started_at >= 60
+
+
+def test_timed_out_cli_commands_raise_ocm_errors(clock: Any, monkeypatch: Any) -> None:
+    cmds: list[list[str]] = []
+
+    def time_out(cmd: list[str], timeout: float, *_: Any) -> Any:
+        cmds.append(cmd)
+        raise subprocess.TimeoutExpired(cmd, timeout)
+
+    monkeypatch.setattr("src.util.retry.run_cmd", time_out)
+
+    with pytest.raises(OcmError) as error:
+        OcmCli(clock).get(f"{CLUSTERS_API_PATH}/c1")
+
+    assert error.value.status_code == 0
+    assert cmds == [["ocm", "get", f"{CLUSTERS_API_PATH}/c1"]] * 5
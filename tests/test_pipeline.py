@@ -0,0 +1,69 @@
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from typing import Any
+
+import pytest
+
+from src.util.checkpoint import RunCheckpoint
+from src.util.pipeline import Pipeline, Step, StepResults
+
+
+def fail(_: StepResults) -> None:
+    time.sleep(0.1)
+    raise RuntimeError("step failed")
+
+
+def test_run_fails_fast_and_checkpoints_steps_finished_in_the_grace_period(
+    tmp_path: Any, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(Pipeline, "_abandon_timeout", 1.0)
+    release = threading.Event()
+    checkpoint = RunCheckpoint(f"{tmp_path}/checkpoint.json")
+    pipeline = Pipeline(
+        [
+            Step("fail", fail),
+            Step("quick", lambda _: time.sleep(0.3) or "done"),
+            Step("slow", lambda _: release.wait(60)),
+        ],
+        checkpoint=checkpoint,
+    )
+    started_at = time.monotonic()
+
+    with pytest.raises(RuntimeError, match="step failed"):
+        pipeline.run()
+
+    release.set()
+    assert time.monotonic() - started_at < 5
+    assert checkpoint.is_completed("quick")
+    assert not checkpoint.is_completed("slow")
+
+
+def test_failed_run_does_not_hold_up_the_process_exit() -> None:
+    script = textwrap.dedent(
+        """
+        import time
+        from src.util.pipeline import Pipeline, Step
+
+        def fail(_):
+            time.sleep(0.2)
+            raise RuntimeError("step failed")
+
+        Pipeline([Step("fail", fail), Step("slow", lambda _: time.sleep(60))]).run()
+        """
+    )
+    started_at = time.monotonic()
+
+    completed_process = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        timeout=30,
+        check=False,
+    )
+
+    assert completed_process.returncode == 1
+    assert "step failed" in completed_process.stderr
+    assert time.monotonic() - started_at < 10
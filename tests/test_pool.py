@@ -0,0 +1,86 @@
+from typing import Any
+
+import pytest
+
+from src.platform.ocm import OcmCli
+from src.service.cluster import CLUSTERS_API_PATH, ClusterService
+from src.service.ledger import ClusterLedger, ClusterRecord, ClusterRole
+from src.service.pool import ClusterPool, Lease, PoolState
+
+
+@pytest.fixture(name="pool")
+def fixture_pool(tmp_path: Any, clock: Any) -> ClusterPool:
+    (tmp_path / "pool").mkdir()
+    ClusterLedger(f"{tmp_path}/pool/pool_ledger.db").add(
+        ClusterRecord(
+            cluster_id="c1",
+            name="pool-p1",
+            role=ClusterRole.PROVIDER.value,
+            state=PoolState.READY.value,
+        )
+    )
+    return ClusterPool(
+        ClusterService(
+            data_dir=f"{tmp_path}/data",
+            run_id="test",
+            ocm_backend=OcmCli(clock),
+            clock=clock,
+        ),
+        pool_dir=f"{tmp_path}/pool",
+    )
+
+
+def test_recycled_lease_is_removed_once_uninstalled(
+    pool: ClusterPool, fake_ocm: Any
+) -> None:
+    fake_ocm.script({f"DELETE {CLUSTERS_API_PATH}/c1": [{}]})
+
+    lease = pool.lease("job-1")
+    assert lease
+
+    pool.release(lease)
+
+    assert not pool.status()
+
+
+def test_recycled_lease_stays_failed_if_not_uninstalled(
+    pool: ClusterPool, fake_ocm: Any
+) -> None:
+    fake_ocm.script({f"DELETE {CLUSTERS_API_PATH}/c1": [{"status": 400}]})
+
+    lease = pool.lease("job-1")
+    assert lease
+
+    pool.release(lease)
+
+    assert [(record.cluster_id, record.state) for record in pool.status()] == [
+        ("c1", PoolState.FAILED.value)
+    ]
+
+
+def test_returned_lease_is_ready_again(pool: ClusterPool, fake_ocm: Any) -> None:
+    lease = pool.lease("job-1")
+    assert lease
+
+    pool.release(lease, recycle=False)
+
+    assert fake_ocm.calls == []
+    assert pool.lease("job-2") == Lease("c1", "pool-p1", "job-2")
+
+
+def test_installed_clusters_are_recorded_before_the_batch_ends(
+    pool: ClusterPool, monkeypatch: Any
+) -> None:
+    def install_batch(*_: Any, on_installed: Any, **__: Any) -> dict[str, str]:
+        on_installed("pool-p2", "c2")
+        raise KeyboardInterrupt  # The refill is killed during the batch.
+
+    monkeypatch.setattr(pool._cluster_service, "install_batch", install_batch)
+
+    with pytest.raises(KeyboardInterrupt):
+        pool._install([], max_workers=1)
+
+    assert [(record.name, record.state) for record in pool.status()] == [
+        ("pool-p1", PoolState.READY.value),
+        ("pool-p2", PoolState.PROVISIONING.value),
+    ]
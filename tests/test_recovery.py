@@ -0,0 +1,70 @@
+from typing import Any
+
+from src.service.recovery import RecoveryBenchmark, RecoveryTrial
+
+
+class FakeClusterService:
+    # The provider storage recovers 30s after its pods are deleted, unless broken.
+    broken: bool
+    clock: Any
+    deleted_at: float = 0.0
+
+    def __init__(self, clock: Any, broken: bool = False) -> None:
+        self.broken = broken
+        self.clock = clock
+
+    def delete_storage_pods(self, cluster_id: str, pod_selector: str) -> int:
+        self.deleted_at = self.clock.monotonic()
+        return 3
+
+    def get_addon_ocs_provider_storage_endpoint(self, cluster_id: str) -> str:
+        return "10.0.0.1:31659"
+
+    def get_nodes_ready(self, cluster_id: str) -> bool:
+        return True
+
+    def get_storage_cluster_phase(self, cluster_id: str) -> str:
+        if self.broken or (
+            self.deleted_at and self.clock.monotonic() - self.deleted_at < 30
+        ):
+            return "Progressing"
+        return "Ready"
+
+
+def test_trials_stop_when_the_clusters_are_not_ready(clock: Any) -> None:
+    cluster_service = FakeClusterService(clock)
+    benchmark = RecoveryBenchmark(cluster_service, "p1", "c1", clock)
+    trials = benchmark.run(1, "app=rook-ceph-osd")
+    cluster_service.broken = True
+
+    trials += benchmark.run(3, "app=rook-ceph-osd")
+
+    assert [trial.error for trial in trials] == [
+        "",
+        "Clusters not Ready before the disruption.",
+    ]
+    assert trials[0].consumer_reconnection_seconds == 30.0
+    assert trials[1] == RecoveryTrial(
+        1, error="Clusters not Ready before the disruption."
+    )
+
+
+def test_trials_stop_on_errors_and_keep_the_previous_results(
+    clock: Any, monkeypatch: Any
+) -> None:
+    cluster_service = FakeClusterService(clock)
+    benchmark = RecoveryBenchmark(cluster_service, "p1", "c1", clock)
+    deletions = iter([3, RuntimeError("OCM API error")])
+
+    def delete_storage_pods(*_: Any) -> int:
+        if isinstance(deleted_pods := next(deletions), Exception):
+            raise deleted_pods
+        cluster_service.deleted_at = clock.monotonic()
+        return deleted_pods
+
+    monkeypatch.setattr(cluster_service, "delete_storage_pods", delete_storage_pods)
+
+    trials = benchmark.run(3, "app=rook-ceph-osd")
+
+    assert [trial.error for trial in trials] == ["", "OCM API error"]
+    assert trials[0].consumer_reconnection_seconds == 30.0
@@ -0,0 +1,60 @@
+import base64
+import json
+from typing import Any
+
+import pytest
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+from cryptography.hazmat.primitives.asymmetric.rsa import (
+    RSAPrivateKey,
+    generate_private_key,
+)
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+)
+
+from src.service.ticket import OnboardingTicketGenerator
+
+
+@pytest.fixture(name="private_key")
+def fixture_private_key() -> RSAPrivateKey:
+    return generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture(name="ticket")
+def fixture_ticket(tmp_path: Any, private_key: RSAPrivateKey) -> str:
+    key_file = tmp_path / "onboarding-private.pem"
+    key_file.write_bytes(
+        private_key.private_bytes(
+            Encoding.PEM, PrivateFormat.TraditionalOpenSSL, NoEncryption()
+        )
+    )
+    return OnboardingTicketGenerator(str(key_file)).generate()
+
+
+def test_ticket_is_verified_like_the_provider_server(
+    ticket: str, private_key: RSAPrivateKey
+) -> None:
+    # As ocs-operator's decodeAndValidateTicket: the signature covers the decoded
+    # payload, i.e. the ticket JSON bytes.
+    payload, signature = ticket.split(".")
+    message = base64.b64decode(payload)
+
+    private_key.public_key().verify(
+        base64.b64decode(signature), message, PKCS1v15(), SHA256()
+    )
+    assert set(json.loads(message)) == {"expirationDate", "id"}
+
+
+def test_ticket_signature_does_not_cover_the_base64_payload(
+    ticket: str, private_key: RSAPrivateKey
+) -> None:
+    payload, signature = ticket.split(".")
+
+    with pytest.raises(InvalidSignature):
+        private_key.public_key().verify(
+            base64.b64decode(signature), payload.encode(), PKCS1v15(), SHA256()
+        )
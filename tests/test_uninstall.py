@@ -0,0 +1,94 @@
+from typing import Any
+
+import pytest
+
+from src.platform.ocm import OcmCli, OcmError
+from src.service.cluster import CLUSTERS_API_PATH, ClusterService
+from src.service.ledger import ClusterRole
+
+
+def create_cluster_service(tmp_path: Any, clock: Any) -> ClusterService:
+    return ClusterService(
+        data_dir=f"{tmp_path}/data",
+        run_id="test",
+        ocm_backend=OcmCli(clock),
+        clock=clock,
+    )
+
+
+def test_uninstall_retries_transient_errors(
+    tmp_path: Any, clock: Any, fake_ocm: Any
+) -> None:
+    fake_ocm.script({f"DELETE {CLUSTERS_API_PATH}/c1": [{"status": 503}, {}]})
+    cluster_service = create_cluster_service(tmp_path, clock)
+    started_at = clock.now
+
+    assert cluster_service.uninstall("c1", "ci-c1")
+
+    assert fake_ocm.calls == [f"DELETE {CLUSTERS_API_PATH}/c1"] * 2
+    assert clock.now > started_at
+
+
+def test_uninstall_of_missing_cluster_is_not_retried(
+    tmp_path: Any, clock: Any, fake_ocm: Any
+) -> None:
+    cluster_service = create_cluster_service(tmp_path, clock)
+
+    assert not cluster_service.uninstall("c1", "ci-c1")
+
+    assert fake_ocm.calls == [f"DELETE {CLUSTERS_API_PATH}/c1"]
+
+
+def test_uninstall_transient_errors_are_only_retried_by_the_backend(
+    tmp_path: Any, clock: Any, fake_ocm: Any
+) -> None:
+    fake_ocm.script({f"DELETE {CLUSTERS_API_PATH}/c1": [{"status": 503}]})
+    cluster_service = create_cluster_service(tmp_path, clock)
+
+    with pytest.raises(OcmError) as error:
+        cluster_service.uninstall("c1", "ci-c1")
+
+    assert error.value.status_code == 503
+    assert fake_ocm.calls == [f"DELETE {CLUSTERS_API_PATH}/c1"] * 4
+
+
+def test_uninstall_client_errors_are_not_retried(
+    tmp_path: Any, clock: Any, fake_ocm: Any
+) -> None:
+    fake_ocm.script({f"DELETE {CLUSTERS_API_PATH}/c1": [{"status": 400}]})
+    cluster_service = create_cluster_service(tmp_path, clock)
+
+    with pytest.raises(OcmError) as error:
+        cluster_service.uninstall("c1", "ci-c1")
+
+    assert error.value.status_code == 400
+    assert fake_ocm.calls == [f"DELETE {CLUSTERS_API_PATH}/c1"]
+    assert clock.now == 1000.0
+
+
+def test_uninstall_all_clusters_keeps_failed_clusters_in_the_ledger(
+    tmp_path: Any, clock: Any, fake_ocm: Any, monkeypatch: Any
+) -> None:
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_ACCOUNT_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(name, "test")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    fake_ocm.script(
+        {
+            f"POST {CLUSTERS_API_PATH}": [
+                {"body": {"id": "c1"}},
+                {"body": {"id": "c2"}},
+            ],
+            f"DELETE {CLUSTERS_API_PATH}/c1": [{}],
+            f"DELETE {CLUSTERS_API_PATH}/c2": [{"status": 400}],
+        }
+    )
+    cluster_service = create_cluster_service(tmp_path, clock)
+    for cluster_name in ("ci-one", "ci-two"):
+        cluster_service.install(cluster_name, ClusterRole.UNKNOWN)
+
+    report = cluster_service.uninstall_all_clusters(max_workers=1)
+
+    assert report.uninstalled == ["ci-one"]
+    assert list(report.failed) == ["ci-two"]
+    assert cluster_service.list_stored_clusters() == {"c2": "ci-two"}
+    assert fake_ocm.calls.count(f"DELETE {CLUSTERS_API_PATH}/c2") == 1